@@ -0,0 +1,433 @@
+import struct
+
+from peephole import parse_instruction
+from utility import error
+
+
+class Register:
+    '''
+    x86-64 の汎用レジスタ
+    code は ModR/M や REX に入れる 0〜15 の番号
+    '''
+    __codes = {
+        'rax': 0, 'rcx': 1, 'rdx': 2, 'rbx': 3, 'rsp': 4, 'rbp': 5, 'rsi': 6, 'rdi': 7,
+        'r8': 8, 'r9': 9, 'r10': 10, 'r11': 11, 'r12': 12, 'r13': 13, 'r14': 14, 'r15': 15,
+    }
+    __byte_codes = {'al': 0, 'cl': 1, 'dl': 2, 'bl': 3}
+
+    def __init__(self, name):
+        self.name = name
+        self.code = Register.__byte_codes[name] if name in Register.__byte_codes else Register.__codes[name]
+
+    @staticmethod
+    def is_register(text):
+        return text in Register.__codes or text in Register.__byte_codes
+
+
+class Memory:
+    '''
+    [base] / [base+disp] / [base-disp] の形のメモリオペランド
+    '''
+
+    def __init__(self, text):
+        inner = text[text.index('[') + 1:text.rindex(']')].replace(' ', '')
+        for sign in '+-':
+            if sign in inner:
+                base, disp = inner.split(sign)
+                self.base = Register(base)
+                self.disp = int(disp) if sign == '+' else -int(disp)
+                return
+        self.base = Register(inner)
+        self.disp = 0
+
+
+class Assembler:
+    '''
+    生成したアセンブリの行を機械語に変換し，ELF の再配置可能オブジェクトを作る
+    コード生成器が出力する命令の形だけに対応する
+    ジャンプと call は全て rel32 で符号化し，未定義の関数の call は再配置として残す
+    '''
+    __conditions = {'e': 0x4, 'ne': 0x5, 'l': 0xc, 'ge': 0xd, 'le': 0xe, 'g': 0xf}
+
+    # (reg, reg) と (mem, reg) の形のオペコード，および即値を取る形の /digit
+    __alu = {
+        'add': (0x01, 0),
+        'sub': (0x29, 5),
+        'cmp': (0x39, 7),
+    }
+
+    def __init__(self):
+        self.__code = bytearray()
+        self.__labels = {}
+        self.__globals = set()
+        self.__functions = []
+        self.__fixups = []
+        self.__map = {
+            'push': self.__asm_push,
+            'pop': self.__asm_pop,
+            'mov': self.__asm_mov,
+            'lea': self.__asm_lea,
+            'add': self.__asm_alu,
+            'sub': self.__asm_alu,
+            'cmp': self.__asm_alu,
+            'imul': self.__asm_imul,
+            'idiv': self.__asm_idiv,
+            'shl': self.__asm_shl,
+            'cqo': self.__asm_cqo,
+            'movzb': self.__asm_movzx,
+            'movzx': self.__asm_movzx,
+            'jmp': self.__asm_jmp,
+            'call': self.__asm_call,
+            'ret': self.__asm_ret,
+        }
+        for cond in Assembler.__conditions:
+            self.__map[f'j{cond}'] = self.__asm_jcc
+            self.__map[f'set{cond}'] = self.__asm_setcc
+
+    def assemble(self, lines):
+        for line in lines:
+            self.__assemble_line(line)
+        return self
+
+    @property
+    def functions(self):
+        '''
+        関数名から機械語の先頭からの位置への辞書
+        '''
+        return {name: self.__labels[name] for name in self.__functions}
+
+    def link(self):
+        '''
+        ジャンプ先を解決し (機械語のバイト列, 定義されていない call の (位置, 名前) のリスト) を返す
+        '''
+        relocations = self.__resolve()
+        return bytes(self.__code), relocations
+
+    def to_elf(self):
+        '''
+        ここまでに変換した機械語を ELF64 の再配置可能オブジェクトのバイト列にする
+        '''
+        code, relocations = self.link()
+        writer = ElfWriter(code)
+        for name in self.__functions:
+            writer.add_symbol(name, self.__labels[name], name in self.__globals)
+        for offset, name in relocations:
+            writer.add_relocation(offset, name)
+        return writer.write()
+
+    def __assemble_line(self, line):
+        instruction = parse_instruction(line)
+        if instruction is not None:
+            op, operands = instruction
+            if op not in self.__map:
+                error(f'機械語に変換できない命令です {line.strip()}')
+            self.__map[op](op, operands)
+            return
+        line = line.strip()
+        if not line:
+            return
+        if line.endswith(':'):
+            self.__define_label(line[:-1])
+        elif line.startswith('.global'):
+            self.__globals.add(line.split()[1])
+        elif line != '.intel_syntax noprefix':
+            error(f'対応していないディレクティブです {line}')
+
+    def __define_label(self, name):
+        if name in self.__labels:
+            error(f'ラベルが重複しています {name}')
+        self.__labels[name] = len(self.__code)
+        if not name.startswith('.'):
+            self.__functions.append(name)
+
+    def __resolve(self):
+        '''
+        ジャンプ先を書き込み，定義されていない call の飛び先を (位置, 名前) のリストで返す
+        '''
+        relocations = []
+        for offset, name, is_call in self.__fixups:
+            if name in self.__labels:
+                # rel32 はその次の命令の先頭からの相対位置
+                struct.pack_into('<i', self.__code, offset, self.__labels[name] - (offset + 4))
+            elif is_call:
+                relocations.append((offset, name))
+            else:
+                error(f'ラベルが定義されていません {name}')
+        return relocations
+
+    def __emit(self, *values):
+        self.__code += bytes(values)
+
+    def __emit_imm(self, value, size):
+        self.__code += value.to_bytes(size, 'little', signed=True)
+
+    @staticmethod
+    def __fits(value, bits):
+        return -(1 << (bits - 1)) <= value < (1 << (bits - 1))
+
+    @staticmethod
+    def __operand(text):
+        if '[' in text:
+            return Memory(text)
+        if Register.is_register(text):
+            return Register(text)
+        try:
+            return int(text, 0)
+        except ValueError:
+            error(f'オペランドを解釈できません {text}')
+
+    def __emit_rex(self, reg, rm, wide=True):
+        '''
+        reg は ModR/M の reg 欄の番号，rm はレジスタかメモリオペランド
+        '''
+        base = rm.base.code if isinstance(rm, Memory) else rm.code
+        rex = 0x40 | (0x08 if wide else 0) | ((reg >> 3) << 2) | (base >> 3)
+        if rex != 0x40:
+            self.__emit(rex)
+
+    def __emit_modrm(self, reg, rm):
+        if isinstance(rm, Register):
+            self.__emit(0xc0 | ((reg & 7) << 3) | (rm.code & 7))
+            return
+        base = rm.base.code & 7
+        if rm.disp == 0 and base != 5:
+            mod = 0x00
+        elif Assembler.__fits(rm.disp, 8):
+            mod = 0x40
+        else:
+            mod = 0x80
+        self.__emit(mod | ((reg & 7) << 3) | base)
+        if base == 4:
+            # rsp と r12 をベースにするときは SIB が必要
+            self.__emit(0x24)
+        if mod == 0x40:
+            self.__emit_imm(rm.disp, 1)
+        elif mod == 0x80:
+            self.__emit_imm(rm.disp, 4)
+
+    def __emit_rm(self, opcode, reg, rm):
+        '''
+        REX.W + opcode + ModR/M の形の命令
+        '''
+        self.__emit_rex(reg, rm)
+        self.__emit(*opcode)
+        self.__emit_modrm(reg, rm)
+
+    def __emit_label_ref(self, name, is_call=False):
+        self.__fixups.append((len(self.__code), name, is_call))
+        self.__emit_imm(0, 4)
+
+    def __asm_push(self, op, operands):
+        operand = Assembler.__operand(operands[0])
+        if isinstance(operand, int):
+            if Assembler.__fits(operand, 8):
+                self.__emit(0x6a)
+                self.__emit_imm(operand, 1)
+            else:
+                self.__emit(0x68)
+                self.__emit_imm(operand, 4)
+            return
+        self.__emit_rex(0, operand, wide=False)
+        self.__emit(0x50 | (operand.code & 7))
+
+    def __asm_pop(self, op, operands):
+        operand = Assembler.__operand(operands[0])
+        self.__emit_rex(0, operand, wide=False)
+        self.__emit(0x58 | (operand.code & 7))
+
+    def __asm_mov(self, op, operands):
+        dst = Assembler.__operand(operands[0])
+        src = Assembler.__operand(operands[1])
+        if isinstance(src, int):
+            if Assembler.__fits(src, 32):
+                self.__emit_rm([0xc7], 0, dst)
+                self.__emit_imm(src, 4)
+            else:
+                self.__emit_rex(0, dst)
+                self.__emit(0xb8 | (dst.code & 7))
+                self.__emit_imm(src, 8)
+        elif isinstance(src, Memory):
+            self.__emit_rm([0x8b], dst.code, src)
+        else:
+            self.__emit_rm([0x89], src.code, dst)
+
+    def __asm_lea(self, op, operands):
+        dst = Assembler.__operand(operands[0])
+        self.__emit_rm([0x8d], dst.code, Assembler.__operand(operands[1]))
+
+    def __asm_alu(self, op, operands):
+        opcode, digit = Assembler.__alu[op]
+        dst = Assembler.__operand(operands[0])
+        src = Assembler.__operand(operands[1])
+        if isinstance(src, int):
+            if Assembler.__fits(src, 8):
+                self.__emit_rm([0x83], digit, dst)
+                self.__emit_imm(src, 1)
+            else:
+                self.__emit_rm([0x81], digit, dst)
+                self.__emit_imm(src, 4)
+        else:
+            self.__emit_rm([opcode], src.code, dst)
+
+    def __asm_imul(self, op, operands):
+        dst = Assembler.__operand(operands[0])
+        if len(operands) == 1:
+            # rdx:rax = rax * dst
+            self.__emit_rm([0xf7], 5, dst)
+            return
+        src = Assembler.__operand(operands[1])
+        if isinstance(src, int):
+            if Assembler.__fits(src, 8):
+                self.__emit_rm([0x6b], dst.code, dst)
+                self.__emit_imm(src, 1)
+            else:
+                self.__emit_rm([0x69], dst.code, dst)
+                self.__emit_imm(src, 4)
+        else:
+            self.__emit_rm([0x0f, 0xaf], dst.code, src)
+
+    def __asm_idiv(self, op, operands):
+        self.__emit_rm([0xf7], 7, Assembler.__operand(operands[0]))
+
+    def __asm_shl(self, op, operands):
+        dst = Assembler.__operand(operands[0])
+        count = Assembler.__operand(operands[1])
+        if count == 1:
+            self.__emit_rm([0xd1], 4, dst)
+        elif isinstance(count, int):
+            self.__emit_rm([0xc1], 4, dst)
+            self.__emit_imm(count, 1)
+        elif count.name == 'cl':
+            self.__emit_rm([0xd3], 4, dst)
+        else:
+            error(f'シフト量は即値か cl にしてください {count.name}')
+
+    def __asm_cqo(self, op, operands):
+        self.__emit(0x48, 0x99)
+
+    def __asm_movzx(self, op, operands):
+        dst = Assembler.__operand(operands[0])
+        self.__emit_rm([0x0f, 0xb6], dst.code, Assembler.__operand(operands[1]))
+
+    def __asm_setcc(self, op, operands):
+        operand = Assembler.__operand(operands[0])
+        self.__emit(0x0f, 0x90 | Assembler.__conditions[op[3:]])
+        self.__emit_modrm(0, operand)
+
+    def __asm_jmp(self, op, operands):
+        self.__emit(0xe9)
+        self.__emit_label_ref(operands[0])
+
+    def __asm_jcc(self, op, operands):
+        self.__emit(0x0f, 0x80 | Assembler.__conditions[op[1:]])
+        self.__emit_label_ref(operands[0])
+
+    def __asm_call(self, op, operands):
+        self.__emit(0xe8)
+        self.__emit_label_ref(operands[0], is_call=True)
+
+    def __asm_ret(self, op, operands):
+        self.__emit(0xc3)
+
+
+class ElfWriter:
+    '''
+    .text を1つだけ持つ ELF64 (x86-64) の再配置可能オブジェクトを組み立てる
+    '''
+    EM_X86_64 = 62
+    SHT_PROGBITS = 1
+    SHT_SYMTAB = 2
+    SHT_STRTAB = 3
+    SHT_RELA = 4
+    STB_LOCAL = 0
+    STB_GLOBAL = 1
+    STT_NOTYPE = 0
+    STT_FUNC = 2
+    STT_SECTION = 3
+    R_X86_64_PLT32 = 4
+
+    TEXT_INDEX = 1
+    SYMTAB_INDEX = 3
+    STRTAB_INDEX = 4
+    SHSTRTAB_INDEX = 5
+
+    __header = struct.Struct('<16sHHIQQQIHHHHHH')
+    __section = struct.Struct('<IIQQQQIIQQ')
+    __symbol = struct.Struct('<IBBHQQ')
+    __rela = struct.Struct('<QQq')
+
+    def __init__(self, text):
+        self.__text = text
+        self.__strtab = bytearray(b'\0')
+        self.__names = {}
+        # 0番は空のシンボル，1番は .text のセクションシンボル
+        self.__locals = [(0, 0, 0, 0, 0, 0),
+                         (0, ElfWriter.STT_SECTION, 0, ElfWriter.TEXT_INDEX, 0, 0)]
+        self.__globals = []
+        self.__undefined = {}
+        self.__relocations = []
+
+    def add_symbol(self, name, offset, is_global):
+        bind = ElfWriter.STB_GLOBAL if is_global else ElfWriter.STB_LOCAL
+        entry = (self.__name(name), (bind << 4) | ElfWriter.STT_FUNC, 0, ElfWriter.TEXT_INDEX, offset, 0)
+        (self.__globals if is_global else self.__locals).append(entry)
+
+    def add_relocation(self, offset, name):
+        if name not in self.__undefined:
+            self.__undefined[name] = len(self.__globals)
+            self.__globals.append((self.__name(name), (ElfWriter.STB_GLOBAL << 4) | ElfWriter.STT_NOTYPE, 0, 0, 0, 0))
+        self.__relocations.append((offset, name))
+
+    def write(self):
+        # ELF ではローカルシンボルをグローバルシンボルより前に並べる
+        local_count = len(self.__locals)
+        symtab = b''.join(ElfWriter.__symbol.pack(*x) for x in self.__locals + self.__globals)
+        rela = bytearray()
+        for offset, name in self.__relocations:
+            # call の rel32 は次の命令の先頭から数えるので addend は -4
+            index = local_count + self.__undefined[name]
+            rela += ElfWriter.__rela.pack(offset, (index << 32) | ElfWriter.R_X86_64_PLT32, -4)
+
+        shstrtab = bytearray(b'\0')
+        section_names = {}
+        for name in ['.text', '.rela.text', '.symtab', '.strtab', '.shstrtab', '.note.GNU-stack']:
+            section_names[name] = len(shstrtab)
+            shstrtab += name.encode() + b'\0'
+
+        # (名前, 種類, フラグ, 中身, link, info, アラインメント, エントリサイズ)
+        sections = [
+            ('.text', ElfWriter.SHT_PROGBITS, 0x6, self.__text, 0, 0, 16, 0),
+            ('.rela.text', ElfWriter.SHT_RELA, 0x40, bytes(rela), ElfWriter.SYMTAB_INDEX, ElfWriter.TEXT_INDEX, 8,
+             ElfWriter.__rela.size),
+            ('.symtab', ElfWriter.SHT_SYMTAB, 0, symtab, ElfWriter.STRTAB_INDEX, local_count, 8, ElfWriter.__symbol.size),
+            ('.strtab', ElfWriter.SHT_STRTAB, 0, bytes(self.__strtab), 0, 0, 1, 0),
+            ('.shstrtab', ElfWriter.SHT_STRTAB, 0, bytes(shstrtab), 0, 0, 1, 0),
+            ('.note.GNU-stack', ElfWriter.SHT_PROGBITS, 0, b'', 0, 0, 1, 0),
+        ]
+
+        body = bytearray()
+        offset = ElfWriter.__header.size
+        headers = [ElfWriter.__section.pack(0, 0, 0, 0, 0, 0, 0, 0, 0, 0)]
+        for name, sh_type, flags, data, link, info, align, entsize in sections:
+            padding = -offset % align
+            body += bytes(padding)
+            offset += padding
+            headers.append(ElfWriter.__section.pack(section_names[name], sh_type, flags, 0, offset, len(data),
+                                                    link, info, align, entsize))
+            body += data
+            offset += len(data)
+        padding = -offset % 8
+        body += bytes(padding)
+        offset += padding
+
+        ident = b'\x7fELF' + bytes([2, 1, 1, 0]) + bytes(8)
+        header = ElfWriter.__header.pack(ident, 1, ElfWriter.EM_X86_64, 1, 0, 0, offset, 0,
+                                         ElfWriter.__header.size, 0, 0, ElfWriter.__section.size,
+                                         len(headers), ElfWriter.SHSTRTAB_INDEX)
+        return header + bytes(body) + b''.join(headers)
+
+    def __name(self, name):
+        if name not in self.__names:
+            self.__names[name] = len(self.__strtab)
+            self.__strtab += name.encode() + b'\0'
+        return self.__names[name]
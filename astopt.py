@@ -0,0 +1,211 @@
+from node import NodeFactory, NodeTypes
+
+
+class AstOptimizer:
+    '''
+    構文木の最適化
+    定数式の畳み込み，x+0 や x*1 などの簡約，2のべき乗の乗算のシフトへの置き換え，
+    条件が定数の if / while / for の枝の除去を行う
+    '''
+    INT32_MIN = -(1 << 31)
+    INT32_MAX = (1 << 31) - 1
+
+    __operators = {
+        NodeTypes.ADD: lambda x, y: x + y,
+        NodeTypes.SUB: lambda x, y: x - y,
+        NodeTypes.MUL: lambda x, y: x * y,
+        NodeTypes.DIV: lambda x, y: abs(x) // abs(y) * (1 if (x < 0) == (y < 0) else -1),
+        NodeTypes.SHL: lambda x, y: x << y,
+        NodeTypes.EQ: lambda x, y: int(x == y),
+        NodeTypes.NE: lambda x, y: int(x != y),
+        NodeTypes.LT: lambda x, y: int(x < y),
+        NodeTypes.LE: lambda x, y: int(x <= y),
+        NodeTypes.GT: lambda x, y: int(x > y),
+        NodeTypes.GE: lambda x, y: int(x >= y),
+    }
+
+    def __init__(self, node_context):
+        self.__ncontext = node_context
+        self.__map = {
+            NodeTypes.ASSIGN: self.__opt_assign,
+            NodeTypes.RETURN: self.__opt_return,
+            NodeTypes.IF: self.__opt_if,
+            NodeTypes.IF_ELSE: self.__opt_if_else,
+            NodeTypes.WHILE: self.__opt_while,
+            NodeTypes.FOR: self.__opt_for,
+            NodeTypes.BLOCK: self.__opt_block,
+            NodeTypes.CALL: self.__opt_call,
+            NodeTypes.FUNC: self.__opt_func,
+            NodeTypes.ADDR: self.__opt_unary,
+            NodeTypes.DEREF: self.__opt_unary,
+        }
+        for n_type in AstOptimizer.__operators:
+            self.__map[n_type] = self.__opt_operator
+
+    def optimize(self):
+        for node in self.__ncontext.nodes:
+            self.__opt(node)
+        return self.__ncontext
+
+    def __opt(self, node):
+        '''
+        node を根とする部分木を最適化した結果を返す
+        各 __opt_* は子ノードを yield して最適化した子を受け取るジェネレータで，
+        入れ子が深くても再帰しないように，最適化途中のジェネレータをスタックに積んで進める
+        '''
+        stack = []
+        child = node
+        while True:
+            if child is None or child.type not in self.__map:
+                result = child
+            else:
+                stack.append(self.__map[child.type](child))
+                result = None
+            while stack:
+                try:
+                    child = stack[-1].send(result)
+                    break
+                except StopIteration as e:
+                    stack.pop()
+                    result = e.value
+            else:
+                return result
+
+    @staticmethod
+    def __const(node):
+        return int(node.value) if node.type == NodeTypes.NUM else None
+
+    @staticmethod
+    def __is_pure(node):
+        '''
+        評価しても副作用がない (捨ててよい) 式か
+        '''
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.type in (NodeTypes.NUM, NodeTypes.IDENT):
+                continue
+            if node.type == NodeTypes.ADDR and node.unary.type == NodeTypes.IDENT:
+                continue
+            if node.type in AstOptimizer.__operators and node.type != NodeTypes.DIV:
+                stack.append(node.left)
+                stack.append(node.right)
+                continue
+            return False
+        return True
+
+    @staticmethod
+    def __empty():
+        return NodeFactory.create_block_node([])
+
+    def __opt_operator(self, node):
+        node.left = yield node.left
+        node.right = yield node.right
+        left = AstOptimizer.__const(node.left)
+        right = AstOptimizer.__const(node.right)
+
+        if left is not None and right is not None and not (node.type == NodeTypes.DIV and right == 0):
+            value = AstOptimizer.__operators[node.type](left, right)
+            if AstOptimizer.INT32_MIN <= value <= AstOptimizer.INT32_MAX:
+                return NodeFactory.create_num_node(value)
+            return node
+
+        if node.type == NodeTypes.ADD:
+            if right == 0:
+                return node.left
+            if left == 0:
+                return node.right
+        elif node.type == NodeTypes.SUB:
+            if right == 0:
+                return node.left
+        elif node.type == NodeTypes.MUL:
+            if left is not None and right is None:
+                node.left, node.right = node.right, node.left
+                left, right = right, left
+            if right == 1:
+                return node.left
+            if right == 0 and AstOptimizer.__is_pure(node.left):
+                return NodeFactory.create_num_node(0)
+            if right is not None and right > 1 and right & (right - 1) == 0:
+                return NodeFactory.create_ope_node(NodeTypes.SHL, node.left, NodeFactory.create_num_node(right.bit_length() - 1))
+        elif node.type == NodeTypes.DIV:
+            if right == 1:
+                return node.left
+        return node
+
+    def __opt_assign(self, node):
+        node.left = yield node.left
+        node.right = yield node.right
+        return node
+
+    def __opt_unary(self, node):
+        node.unary = yield node.unary
+        return node
+
+    def __opt_call(self, node):
+        args = []
+        for arg in node.args:
+            args.append((yield arg))
+        node.args = args
+        return node
+
+    def __opt_return(self, node):
+        node.expr = yield node.expr
+        return node
+
+    def __opt_if(self, node):
+        node.expr = yield node.expr
+        node.stmt = yield node.stmt
+        cond = AstOptimizer.__const(node.expr)
+        if cond is None:
+            return node
+        return node.stmt if cond else AstOptimizer.__empty()
+
+    def __opt_if_else(self, node):
+        node.expr = yield node.expr
+        node.stmt = yield node.stmt
+        node.else_stmt = yield node.else_stmt
+        cond = AstOptimizer.__const(node.expr)
+        if cond is None:
+            return node
+        return node.stmt if cond else node.else_stmt
+
+    def __opt_while(self, node):
+        node.expr = yield node.expr
+        node.stmt = yield node.stmt
+        cond = AstOptimizer.__const(node.expr)
+        if cond is None:
+            return node
+        if cond:
+            return NodeFactory.create_for_node(None, None, None, node.stmt)
+        return AstOptimizer.__empty()
+
+    def __opt_for(self, node):
+        node.expr1 = yield node.expr1
+        node.expr2 = yield node.expr2
+        node.expr3 = yield node.expr3
+        node.stmt = yield node.stmt
+        cond = None if node.expr2 is None else AstOptimizer.__const(node.expr2)
+        if cond is None:
+            return node
+        if cond:
+            # 条件が常に真なら条件判定を省く
+            node.expr2 = None
+            return node
+        return node.expr1 if node.expr1 else AstOptimizer.__empty()
+
+    def __opt_block(self, node):
+        stmts = []
+        for stmt in node.stmts:
+            stmt = yield stmt
+            if AstOptimizer.__is_pure(stmt):
+                continue
+            if stmt.type == NodeTypes.BLOCK and not stmt.stmts:
+                continue
+            stmts.append(stmt)
+        node.stmts = stmts
+        return node
+
+    def __opt_func(self, node):
+        node.block = yield node.block
+        return node
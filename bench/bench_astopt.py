@@ -0,0 +1,35 @@
+'''
+構文木の最適化 (AstOptimizer) の有無で生成される命令数を比較する
+
+$ python -m bench.bench_astopt
+'''
+from astopt import AstOptimizer
+from bench.sources import load_test_cases
+from compiler import BACKENDS
+from cparser import Parser
+from peephole import parse_instruction
+from tokenizer import Tokenizer
+
+CONSTANT_HEAVY = ('int main() { int x; int i; x = 0; for (i = 0; i < 10 * 10; i = i + 1) { x = x * 4 + (1 - 1) * x; '
+                  'if (2 * 3 == 6) x = x / 1 + -(-1); while (0) x = 0; } for (;;) { return x - 8 * 0; } }')
+
+
+def count_instructions(c_code, backend, optimize):
+    ncontext = Parser(Tokenizer(c_code).stream()).parse()
+    if optimize:
+        ncontext = AstOptimizer(ncontext).optimize()
+    return len([x for x in BACKENDS[backend](ncontext).generate() if parse_instruction(x)])
+
+
+def main():
+    programs = [('test.sh', [c_code for _, c_code in load_test_cases()]), ('constant', [CONSTANT_HEAVY])]
+    print(f'{"programs":>10} {"backend":>10} {"before":>8} {"after":>8}')
+    for name, sources in programs:
+        for backend in BACKENDS:
+            before = sum(count_instructions(x, backend, False) for x in sources)
+            after = sum(count_instructions(x, backend, True) for x in sources)
+            print(f'{name:>10} {backend:>10} {before:>8} {after:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+'''
+バックエンドごとに生成したプログラムの実行時間を比較する (gcc が必要)
+
+$ python -m bench.bench_backends
+'''
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from compiler import BACKENDS
+
+PROGRAMS = [
+    'int main() { int x; x = 50000000; int i; for (i = 0; i < 50000000; i = i + 1) { x = x - 2; x = x + 1; } return x; }',
+    'int main() { int x; x = 50000000; while (x > 0) { x = x - 1; if (x == 255) { return x; } } return x; }',
+    'int fib(int n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); } int main() { return fib(30) - 832040; }',
+]
+
+
+def build(workdir, backend, c_code):
+    asm = Path(workdir) / f'{backend}.s'
+    exe = Path(workdir) / backend
+    assembly = subprocess.run([sys.executable, 'py9cc.py', f'--backend={backend}', c_code], capture_output=True, text=True, check=True).stdout
+    asm.write_text(assembly)
+    subprocess.run(['gcc', '-z', 'noexecstack', '-o', str(exe), str(asm)], check=True)
+    return exe, len(assembly.splitlines())
+
+
+def main():
+    print(f'{"program":>8} {"backend":>10} {"lines":>8} {"sec":>8}')
+    with TemporaryDirectory() as workdir:
+        for i, c_code in enumerate(PROGRAMS):
+            for backend in BACKENDS:
+                exe, lines = build(workdir, backend, c_code)
+                start = perf_counter()
+                subprocess.run([str(exe)])
+                elapsed = perf_counter() - start
+                print(f'{i:>8} {backend:>10} {lines:>8} {elapsed:>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
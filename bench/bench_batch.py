@@ -0,0 +1,43 @@
+'''
+1ファイルごとに py9cc.py を起動する場合と，1プロセスでまとめてコンパイルする場合を比較する
+
+$ python -m bench.bench_batch
+'''
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from bench.sources import make_program
+
+COUNT = 50
+
+
+def timed(command):
+    start = perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return perf_counter() - start
+
+
+def main():
+    with TemporaryDirectory() as workdir:
+        sources = []
+        for i in range(COUNT):
+            path = Path(workdir) / f'unit{i}.c'
+            path.write_text(make_program(2 << 10))
+            sources.append(str(path))
+        outdir = f'{workdir}/out/'
+
+        startup = timed([sys.executable, '-c', 'import compiler'])
+        spawn = sum(timed([sys.executable, 'py9cc.py', x, '-o', outdir]) for x in sources)
+        batch = timed([sys.executable, 'py9cc.py', *sources, '-o', outdir])
+
+    print(f'startup + import: {startup * 1000:.1f} ms')
+    print(f'{"mode":>8} {"files":>6} {"sec":>8} {"files/s":>8}')
+    print(f'{"spawn":>8} {COUNT:>6} {spawn:>8.3f} {COUNT / spawn:>8.1f}')
+    print(f'{"batch":>8} {COUNT:>6} {batch:>8.3f} {COUNT / batch:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+'''
+文の多い関数のコード生成時間を計測する
+
+$ python -m bench.bench_codegen
+'''
+from time import perf_counter
+
+from cparser import Parser
+from generator import Generator
+from tokenizer import Tokenizer
+
+COUNTS = [1000, 10000, 50000]
+
+
+def make_source(count):
+    stmts = ''.join(f'x = x + {i % 7}; if (x > 100) x = x - 100; ' for i in range(count // 2))
+    return f'int main() {{ int x; x = 0; {stmts}return x; }}'
+
+
+def main():
+    print(f'{"stmts":>8} {"sec":>8} {"us/stmt":>8}')
+    for count in COUNTS:
+        ncontext = Parser(Tokenizer(make_source(count)).stream()).parse()
+        start = perf_counter()
+        Generator(ncontext).generate()
+        elapsed = perf_counter() - start
+        print(f'{count:>8} {elapsed:>8.3f} {elapsed / count * 1e6:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+'''
+アセンブリの出力のスループットとピークメモリを計測する
+行のリストを作ってから1行ずつ print する方法と，関数ごとに sink へ書き出す Compiler.compile_to を比べる
+
+$ python -m bench.bench_emit
+'''
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+from bench.sources import make_program
+from compiler import Compiler
+
+SIZES = [100 << 10, 500 << 10]
+
+
+def emit_lines(c_code, f):
+    for line in Compiler().compile(c_code):
+        print(line, file=f)
+
+
+def emit_stream(c_code, f):
+    Compiler().compile_to(c_code, f)
+
+
+def measure(emit, c_code):
+    with tempfile.TemporaryFile('w+', buffering=1 << 16) as f:
+        start = perf_counter()
+        emit(c_code, f)
+        elapsed = perf_counter() - start
+        written = f.tell()
+    # tracemalloc は実行時間を大きく伸ばすので時間とは別に計測する
+    with tempfile.TemporaryFile('w+', buffering=1 << 16) as f:
+        tracemalloc.start()
+        emit(c_code, f)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return written, elapsed, peak
+
+
+def main():
+    print(f'{"size":>10} {"method":>8} {"out MB":>8} {"sec":>8} {"MB/s":>8} {"peak MB":>8}')
+    for size in SIZES:
+        c_code = make_program(size)
+        for name, emit in (('print', emit_lines), ('stream', emit_stream)):
+            written, elapsed, peak = measure(emit, c_code)
+            print(f'{len(c_code):>10} {name:>8} {written / (1 << 20):>8.2f} {elapsed:>8.3f} '
+                  f'{written / elapsed / (1 << 20):>8.2f} {peak / (1 << 20):>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''
+Evaluator で test.sh のプログラムを実行するスループットを計測する
+外部の関数は sample.c と同じ動作の Python の関数で与える
+5000万回のループを回すプログラムは Python では遅すぎるので除く
+
+$ python -m bench.bench_eval
+'''
+from time import perf_counter
+
+from bench.sources import load_test_cases
+from compiler import Compiler
+from evaluator import Evaluator
+from tokenizer import Tokenizer
+
+ROUNDS = 20
+LOOP_LIMIT = 1000000
+
+HOSTS = {
+    'MyPrint': lambda: 0,
+    'MyPrintNum': lambda num: 0,
+    'MyAdd': lambda v1, v2, v3, v4, v5, v6: v1 + v2 + v3 + v4 + v5 + v6,
+    'MyDiv': lambda v1, v2: int(v1 / v2),
+}
+
+
+def is_small(c_code):
+    return all(int(x.value) < LOOP_LIMIT for x in Tokenizer(c_code).tokenize_table() if x.value is not None)
+
+
+def main():
+    cases = [(expected, c_code) for expected, c_code in load_test_cases() if is_small(c_code)]
+    compiler = Compiler()
+    parsed = [(expected, compiler.parse(Tokenizer(c_code).stream())) for expected, c_code in cases]
+
+    start = perf_counter()
+    for _ in range(ROUNDS):
+        for expected, c_code in cases:
+            ncontext = compiler.parse(Tokenizer(c_code).stream())
+            if Evaluator(ncontext, HOSTS).call('main') & 0xff != expected:
+                print(f'{c_code} => {expected} expected')
+    total = perf_counter() - start
+
+    start = perf_counter()
+    for _ in range(ROUNDS):
+        for expected, ncontext in parsed:
+            Evaluator(ncontext, HOSTS).call('main')
+    evaluate = perf_counter() - start
+
+    count = len(cases) * ROUNDS
+    print(f'{len(cases)} programs x {ROUNDS}')
+    print(f'{"":>16} {"sec":>8} {"progs/s":>8}')
+    print(f'{"parse + eval":>16} {total:>8.2f} {count / total:>8.0f}')
+    print(f'{"eval":>16} {evaluate:>8.2f} {count / evaluate:>8.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+'''
+5,000関数のファイルの1関数を書き換えた時の再コンパイル時間を，全体のコンパイルと比較する
+
+$ python -m bench.bench_incremental
+'''
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from bench.sources import make_func
+from cache import CompileCache
+from compiler import Compiler
+from incremental import IncrementalCompiler
+
+COUNT = 5000
+
+
+def make_source(edited):
+    funcs = [make_func(i) for i in range(COUNT)]
+    if edited:
+        funcs[COUNT // 2] = funcs[COUNT // 2].replace('return x;', 'return x + 1;')
+    return ''.join(funcs) + 'int main() { return f0(1, 2); }\n'
+
+
+def timed(func, *args):
+    start = perf_counter()
+    func(*args)
+    return perf_counter() - start
+
+
+def main():
+    original = make_source(False)
+    edited = make_source(True)
+    with TemporaryDirectory() as cachedir:
+        full = timed(Compiler().compile, edited)
+        cold = timed(IncrementalCompiler(CompileCache(cachedir)).compile, original)
+        incremental = IncrementalCompiler(CompileCache(cachedir))
+        warm = timed(incremental.compile, edited)
+
+    print(f'{"mode":>12} {"sec":>8}')
+    print(f'{"full":>12} {full:>8.3f}')
+    print(f'{"incr(cold)":>12} {cold:>8.3f}')
+    print(f'{"incr(edit)":>12} {warm:>8.3f}  ({incremental.reused} reused, {incremental.recompiled} recompiled)')
+
+
+if __name__ == '__main__':
+    main()
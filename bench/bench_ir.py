@@ -0,0 +1,43 @@
+'''
+中間表現のバックエンドの段階ごとの時間を，ソースの大きさを変えながら計測する
+変換・最適化 (値番号付けと不要命令の除去)・生存区間・アセンブリ出力が命令数に対して線形に増えることを確かめる
+
+$ python -m bench.bench_ir
+'''
+from time import perf_counter
+
+from bench.sources import make_program
+from cparser import Parser
+from ir import live_ranges, optimize
+from irgen import IrGenerator
+from lowering import IrLowering
+from tokenizer import Tokenizer
+
+SIZES = [1 << 16, 1 << 18, 1 << 20]
+
+
+def main():
+    for size in SIZES:
+        ncontext = Parser(Tokenizer(make_program(size)).stream()).parse()
+
+        start = perf_counter()
+        functions = IrLowering(ncontext).lower()
+        lowered = perf_counter()
+        count = sum(x.instruction_count() for x in functions)
+        removed = sum(optimize(x) for x in functions)
+        optimized = perf_counter()
+        for function in functions:
+            live_ranges(function)
+        analyzed = perf_counter()
+        IrGenerator(ncontext, opt_level=1).generate()
+        emitted = perf_counter()
+
+        print(f'{size >> 10:>5} KB: {count} instructions ({removed} removed), '
+              f'lower {(lowered - start) * 1e6 / count:.2f} us/insn, '
+              f'optimize {(optimized - lowered) * 1e6 / count:.2f} us/insn, '
+              f'liveness {(analyzed - optimized) * 1e6 / count:.2f} us/insn, '
+              f'generate (all stages) {emitted - analyzed:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
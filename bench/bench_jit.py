@@ -0,0 +1,57 @@
+'''
+test.sh のプログラムを，アセンブリを gcc でリンクして実行する場合と JitProgram でプロセス内で実行する場合で比べる
+
+$ python -m bench.bench_jit
+'''
+import subprocess
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from bench.sources import load_test_cases
+from compiler import Compiler
+from jit import JitProgram
+
+
+def run_with_gcc(c_code, work):
+    '''
+    (main の戻り値, 実行までにかかった秒数, 実行にかかった秒数) を返す
+    '''
+    start = perf_counter()
+    source = work / 'tmp.s'
+    source.write_text('\n'.join(Compiler().compile(c_code)) + '\n')
+    subprocess.run(['gcc', '-z', 'noexecstack', '-o', work / 'tmp', source, work / 'sample.o'], check=True)
+    middle = perf_counter()
+    result = subprocess.run([work / 'tmp'], stdout=subprocess.DEVNULL).returncode
+    return result, middle - start, perf_counter() - middle
+
+
+def run_with_jit(c_code, work):
+    start = perf_counter()
+    with JitProgram(Compiler().assemble(c_code), [work / 'libsample.so']) as program:
+        middle = perf_counter()
+        result = program.call('main') & 0xff
+        return result, middle - start, perf_counter() - middle
+
+
+def main():
+    cases = load_test_cases()
+    with tempfile.TemporaryDirectory() as directory:
+        work = Path(directory)
+        subprocess.run(['gcc', '-c', '-o', work / 'sample.o', 'sample.c'], check=True)
+        subprocess.run(['gcc', '-shared', '-fPIC', '-o', work / 'libsample.so', 'sample.c'], check=True)
+        print(f'{len(cases)} programs')
+        print(f'{"method":>8} {"build":>8} {"run":>8} {"build ms/prog":>14}')
+        for name, run in (('gcc', run_with_gcc), ('jit', run_with_jit)):
+            build_time = run_time = 0
+            for expected, c_code in cases:
+                actual, build, elapsed = run(c_code, work)
+                build_time += build
+                run_time += elapsed
+                if actual != expected:
+                    print(f'{c_code} => {expected} expected, but got {actual}')
+            print(f'{name:>8} {build_time:>8.2f} {run_time:>8.2f} {build_time / len(cases) * 1000:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
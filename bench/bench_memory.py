@@ -0,0 +1,38 @@
+'''
+トークナイズ時のピークRSSを入力1MBあたりで計測する
+
+$ python -m bench.bench_memory
+'''
+import resource
+import subprocess
+import sys
+
+from bench.sources import make_program
+from tokenizer import Tokenizer
+
+SIZES = [1 << 20, 4 << 20, 16 << 20]
+
+
+def measure(size):
+    c_code = make_program(size)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tcontext = Tokenizer(c_code).tokenize()
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    del tcontext
+    print(len(c_code), after - before)
+
+
+def main():
+    print(f'{"size":>10} {"peak KB":>10} {"KB/MB":>10}')
+    for size in SIZES:
+        # ru_maxrss は単調増加なので1サイズ毎に別プロセスで計測する
+        result = subprocess.run([sys.executable, '-m', 'bench.bench_memory', str(size)], capture_output=True, text=True, check=True)
+        length, peak = map(int, result.stdout.split())
+        print(f'{length:>10} {peak:>10} {peak / (length / (1 << 20)):>10.0f}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        measure(int(sys.argv[1]))
+    else:
+        main()
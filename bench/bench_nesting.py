@@ -0,0 +1,50 @@
+'''
+入れ子の深さを変えながら，構文解析とスタックマシンのバックエンドによるコード生成の時間とピークメモリを計測する
+深さに対して線形に増えることと，再帰の上限に当たらないことを確かめる
+
+$ python -m bench.bench_nesting
+'''
+import tracemalloc
+from time import perf_counter
+
+from cparser import Parser
+from generator import Generator
+from tokenizer import TokenContext, Tokenizer
+
+DEPTHS = [1000, 10000, 100000]
+
+SHAPES = {
+    'paren': lambda n: 'int main() { return ' + '(' * n + '42' + ')' * n + '; }',
+    'right': lambda n: 'int main() { return ' + '(1 + ' * n + '0' + ')' * n + '; }',
+    'assign': lambda n: 'int main() { int a; ' + 'a = ' * n + '42; return a; }',
+    'block': lambda n: 'int main() { ' + '{ ' * n + 'return 42; ' + '} ' * n + '}',
+    'if': lambda n: 'int main() { ' + 'if (1) ' * n + 'return 42; }',
+}
+
+
+def measure(c_code):
+    '''
+    (構文解析の秒数, コード生成の秒数, ピークメモリの MB) を返す
+    '''
+    table = Tokenizer(c_code).tokenize_table()
+    tracemalloc.start()
+    start = perf_counter()
+    ncontext = Parser(TokenContext(table, c_code)).parse()
+    middle = perf_counter()
+    Generator(ncontext).generate()
+    end = perf_counter()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return middle - start, end - middle, peak / (1 << 20)
+
+
+def main():
+    for name, make in SHAPES.items():
+        for depth in DEPTHS:
+            parse, generate, peak = measure(make(depth))
+            print(f'{name:6} depth {depth:>7}: parse {parse:.3f} s, generate {generate:.3f} s, '
+                  f'{depth / (parse + generate):,.0f} levels/s, peak {peak:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+'''
+構文木の1ノードあたりのメモリと，スタックマシンのバックエンドが1秒あたりに生成するノード数を計測する
+
+$ python -m bench.bench_nodes
+'''
+import tracemalloc
+from time import perf_counter
+
+from bench.sources import make_program
+from cparser import Parser
+from generator import Generator
+from stats import CompileStats
+from tokenizer import TokenContext, Tokenizer
+
+SIZE = 1 << 20
+ROUNDS = 3
+
+
+def main():
+    c_code = make_program(SIZE)
+    table = Tokenizer(c_code).tokenize_table()
+
+    tracemalloc.start()
+    ncontext = Parser(TokenContext(table, c_code)).parse()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    stats = CompileStats()
+    stats.count_nodes(ncontext)
+    count = sum(stats.nodes.values())
+
+    best = None
+    for _ in range(ROUNDS):
+        start = perf_counter()
+        Generator(ncontext).generate()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f'{count} nodes, {memory / count:.0f} bytes/node (with symbol tables), '
+          f'generate {best:.3f} s, {count / best:,.0f} nodes/s')
+
+
+if __name__ == '__main__':
+    main()
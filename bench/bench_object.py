@@ -0,0 +1,56 @@
+'''
+アセンブリを出力して gcc -c で組み立てる場合と，Compiler.compile_object で直接オブジェクトを作る場合の
+コンパイルからリンクまでの時間を test.sh のプログラムで比べる
+
+$ python -m bench.bench_object
+'''
+import subprocess
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from bench.sources import load_test_cases
+from compiler import Compiler
+
+
+def build_with_as(c_code, work):
+    source = work / 'tmp.s'
+    source.write_text('\n'.join(Compiler().compile(c_code)) + '\n')
+    subprocess.run(['gcc', '-c', '-o', work / 'tmp.o', source], check=True)
+
+
+def build_direct(c_code, work):
+    (work / 'tmp.o').write_bytes(Compiler().compile_object(c_code))
+
+
+def link(work):
+    subprocess.run(['gcc', '-z', 'noexecstack', '-o', work / 'tmp', work / 'tmp.o', work / 'sample.o'], check=True)
+
+
+def measure(build, cases, work):
+    compile_time = link_time = 0
+    for _, c_code in cases:
+        start = perf_counter()
+        build(c_code, work)
+        middle = perf_counter()
+        link(work)
+        compile_time += middle - start
+        link_time += perf_counter() - middle
+    return compile_time, link_time
+
+
+def main():
+    cases = load_test_cases()
+    with tempfile.TemporaryDirectory() as directory:
+        work = Path(directory)
+        subprocess.run(['gcc', '-c', '-o', work / 'sample.o', 'sample.c'], check=True)
+        print(f'{len(cases)} programs')
+        print(f'{"method":>8} {"compile":>8} {"link":>8} {"total":>8} {"ms/prog":>8}')
+        for name, build in (('as', build_with_as), ('direct', build_direct)):
+            compile_time, link_time = measure(build, cases, work)
+            total = compile_time + link_time
+            print(f'{name:>8} {compile_time:>8.2f} {link_time:>8.2f} {total:>8.2f} {total / len(cases) * 1000:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+'''
+-j のプロセス数を変えて複数ファイルのコンパイル時間を計測する
+
+$ python -m bench.bench_parallel
+'''
+import os
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from bench.sources import make_program
+
+COUNT = 32
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    jobs = sorted({1, 2, 4, 8, cpus})
+    with TemporaryDirectory() as workdir:
+        sources = []
+        for i in range(COUNT):
+            path = Path(workdir) / f'unit{i}.c'
+            path.write_text(make_program(20 << 10))
+            sources.append(str(path))
+
+        print(f'cpus: {cpus}')
+        print(f'{"-j":>4} {"sec":>8} {"speedup":>8}')
+        base = None
+        for j in jobs:
+            start = perf_counter()
+            subprocess.run([sys.executable, 'py9cc.py', *sources, '-o', f'{workdir}/out/', '-j', str(j)], check=True)
+            elapsed = perf_counter() - start
+            base = base or elapsed
+            print(f'{j:>4} {elapsed:>8.3f} {base / elapsed:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+'''
+式の多いソースで Parser.parse が1秒あたりに読むトークン数を計測する
+トークナイズは計測の外で済ませておく
+
+$ python -m bench.bench_parse
+'''
+from time import perf_counter
+
+from cparser import Parser
+from tokenizer import TokenContext, Tokenizer
+
+ROUNDS = 5
+FUNCS = 200
+
+
+def make_expression_program(count):
+    funcs = []
+    for i in range(count):
+        funcs.append(f'int e{i}(int a, int b) {{ int x; x = (a + {i}) * (b - 3) / 2 + a * b - (a - b) * 4; '
+                     f'x = x + (a < b) + (a >= {i}) * 2 - (x == b) + (a != 3) * (b <= x) - (x > 1); '
+                     f'return -x + a * (b + (x - (a * 2 + b / 3)) * (a + b)) - 7 * 3 + 2 * x; }}\n')
+    funcs.append('int main() { return e0(1, 2); }\n')
+    return ''.join(funcs)
+
+
+def main():
+    c_code = make_expression_program(FUNCS)
+    table = Tokenizer(c_code).tokenize_table()
+    best = None
+    for _ in range(ROUNDS):
+        start = perf_counter()
+        Parser(TokenContext(table, c_code)).parse()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{len(table)} tokens, best of {ROUNDS}: {best:.3f} s, {len(table) / best:,.0f} tokens/s')
+
+
+if __name__ == '__main__':
+    main()
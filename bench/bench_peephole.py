@@ -0,0 +1,57 @@
+'''
+test.sh のプログラムについて，のぞき穴最適化の有無で命令数と実行時間を比較する (gcc が必要)
+
+$ python -m bench.bench_peephole
+'''
+import subprocess
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from bench.sources import load_test_cases
+from compiler import BACKENDS
+from cparser import Parser
+from peephole import PeepholeOptimizer, parse_instruction
+from tokenizer import Tokenizer
+
+
+def count_instructions(assembly):
+    return len([x for x in assembly if parse_instruction(x)])
+
+
+def compile_code(c_code, backend, opt_level):
+    assembly = BACKENDS[backend](Parser(Tokenizer(c_code).stream()).parse()).generate()
+    if opt_level >= 1:
+        assembly = PeepholeOptimizer().optimize(assembly)
+    return assembly
+
+
+def run(workdir, assembly, sample):
+    asm = Path(workdir) / 'tmp.s'
+    exe = Path(workdir) / 'tmp'
+    asm.write_text('\n'.join(assembly) + '\n')
+    subprocess.run(['gcc', '-z', 'noexecstack', '-o', str(exe), str(asm), str(sample)], check=True)
+    start = perf_counter()
+    subprocess.run([str(exe)], stdout=subprocess.DEVNULL)
+    return perf_counter() - start
+
+
+def main():
+    cases = load_test_cases()
+    print(f'{"backend":>10} {"-O":>3} {"insns":>8} {"run sec":>8}')
+    with TemporaryDirectory() as workdir:
+        sample = Path(workdir) / 'sample.o'
+        subprocess.run(['gcc', '-c', '-o', str(sample), 'sample.c'], check=True)
+        for backend in BACKENDS:
+            for opt_level in (0, 1):
+                insns = 0
+                elapsed = 0
+                for _, c_code in cases:
+                    assembly = compile_code(c_code, backend, opt_level)
+                    insns += count_instructions(assembly)
+                    elapsed += run(workdir, assembly, sample)
+                print(f'{backend:>10} {opt_level:>3} {insns:>8} {elapsed:>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
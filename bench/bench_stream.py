@@ -0,0 +1,58 @@
+'''
+Tokenizer.tokenize (一括) と Tokenizer.stream (逐次) を比較する
+最初のトークンが得られるまでの時間，全トークンを読み進める時間，ピークメモリを計測する
+
+$ python -m bench.bench_stream
+'''
+import tracemalloc
+from time import perf_counter
+
+from bench.sources import make_program
+from tokenizer import TokenContext, Tokenizer, TokenTypes
+
+SIZES = [100 << 10, 1 << 20]
+
+CONSUMERS = {
+    TokenTypes.NUM: TokenContext.consume_num,
+    TokenTypes.IDENT: TokenContext.consume_ident,
+    TokenTypes.TYPE: TokenContext.consume_type,
+    TokenTypes.RETURN: TokenContext.consume_return,
+    TokenTypes.IF: TokenContext.consume_if,
+    TokenTypes.ELSE: TokenContext.consume_else,
+    TokenTypes.WHILE: TokenContext.consume_while,
+    TokenTypes.FOR: TokenContext.consume_for,
+}
+
+
+def drain(tcontext):
+    while not tcontext.is_empty():
+        token = tcontext.current
+        if token.type == TokenTypes.SYMBOL:
+            tcontext.consume_symbol(token.text)
+        else:
+            CONSUMERS[token.type](tcontext)
+
+
+def measure(c_code, mode):
+    tracemalloc.start()
+    start = perf_counter()
+    tcontext = getattr(Tokenizer(c_code), mode)()
+    first = perf_counter() - start
+    drain(tcontext)
+    total = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first, total, peak
+
+
+def main():
+    print(f'{"size":>10} {"mode":>8} {"first(s)":>10} {"total(s)":>10} {"peak KB":>10}')
+    for size in SIZES:
+        c_code = make_program(size)
+        for mode in ('tokenize', 'stream'):
+            first, total, peak = measure(c_code, mode)
+            print(f'{len(c_code):>10} {mode:>8} {first:>10.4f} {total:>10.3f} {peak >> 10:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+'''
+ローカル変数が多い関数の構文解析時間を計測する
+変数表の参照が定数時間なら 1参照あたりの時間は変数の数によらない
+
+$ python -m bench.bench_symbols
+'''
+from time import perf_counter
+
+from cparser import Parser
+from tokenizer import Tokenizer
+
+COUNTS = [1000, 2000, 4000, 8000]
+
+
+def make_source(count):
+    decls = ''.join(f'int v{i}; ' for i in range(count))
+    stmts = ''.join(f'v{i} = v{i - 1} + v{i // 2}; ' for i in range(1, count))
+    return f'int main() {{ {decls}v0 = 1; {stmts}return v{count - 1}; }}'
+
+
+def main():
+    print(f'{"locals":>8} {"refs":>8} {"sec":>8} {"us/ref":>8}')
+    for count in COUNTS:
+        c_code = make_source(count)
+        refs = 3 * count
+        start = perf_counter()
+        Parser(Tokenizer(c_code).stream()).parse()
+        elapsed = perf_counter() - start
+        print(f'{count:>8} {refs:>8} {elapsed:>8.3f} {elapsed / refs * 1e6:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
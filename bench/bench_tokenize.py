@@ -0,0 +1,25 @@
+'''
+Tokenizer.tokenize のスケーリングを計測する
+
+$ python -m bench.bench_tokenize
+'''
+from time import perf_counter
+
+from bench.sources import make_program
+from tokenizer import Tokenizer
+
+SIZES = [1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20]
+
+
+def main():
+    print(f'{"size":>10} {"sec":>8} {"MB/s":>8}')
+    for size in SIZES:
+        c_code = make_program(size)
+        start = perf_counter()
+        Tokenizer(c_code).tokenize()
+        elapsed = perf_counter() - start
+        print(f'{len(c_code):>10} {elapsed:>8.3f} {len(c_code) / elapsed / (1 << 20):>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
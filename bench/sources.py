@@ -0,0 +1,48 @@
+import shlex
+
+
+def make_func(index):
+    return (f'int f{index}(int a, int b) {{ int x; x = a * {index % 97} + b; int i; '
+            f'for (i = 0; i < 10; i = i + 1) {{ if (x > 100) x = x - 3; else x = x + i; }} return x; }}\n')
+
+
+def make_program(size):
+    '''
+    size バイト程度のCソースを生成する
+    '''
+    funcs = []
+    length = 0
+    index = 0
+    while length < size:
+        func = make_func(index)
+        funcs.append(func)
+        length += len(func)
+        index += 1
+    funcs.append('int main() { return f0(1, 2); }\n')
+    return ''.join(funcs)
+
+
+def load_test_cases(path='test.sh'):
+    '''
+    test.sh の try 行から (期待値, Cのコード) を読み出す
+    '''
+    cases = []
+    with open(path) as f:
+        for line in f:
+            if line.startswith('try '):
+                expected, c_code = shlex.split(line)[1:]
+                cases.append((int(expected), c_code))
+    return cases
+
+
+def load_deep_test_cases(path='test.sh'):
+    '''
+    test.sh の deep 行から (期待値, Pythonの式 (n = 深さ), Cのコード) を読み出す
+    '''
+    cases = []
+    with open(path) as f:
+        for line in f:
+            if line.strip().startswith('deep '):
+                expected, depth, expr = shlex.split(line)[1:]
+                cases.append((int(expected), f'{expr} (n = {depth})', eval(expr, {'n': int(depth)})))
+    return cases
@@ -0,0 +1,100 @@
+import os
+from hashlib import sha256
+from io import StringIO
+from pathlib import Path
+from shutil import copyfileobj
+from tempfile import NamedTemporaryFile
+
+
+def compiler_version():
+    '''
+    コンパイラのソースファイルの内容から作るバージョン文字列
+    コンパイラを変更するとキャッシュは自動的に無効になる
+    '''
+    digest = sha256()
+    for path in sorted(Path(__file__).parent.glob('*.py')):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class CompileCache:
+    '''
+    コンパイル結果のアセンブリを，ソースとコンパイラのバージョン，オプションのハッシュをキーにして保存する
+    合計の大きさが max_bytes を超えたら最後に使われたのが古いものから消す
+    '''
+    DEFAULT_DIR = Path(os.environ.get('PY9CC_CACHE_DIR', Path.home() / '.cache' / 'py9cc'))
+    DEFAULT_MAX_BYTES = 64 << 20
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory or CompileCache.DEFAULT_DIR)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # put で書き込んだバイト数．0 なら evict で消すものはない
+        self.written = 0
+        self.__version = compiler_version()
+
+    def key(self, c_code, *options):
+        digest = sha256(self.__version.encode())
+        for option in options:
+            digest.update(f'\0{option}'.encode())
+        digest.update(b'\0')
+        digest.update(c_code.encode())
+        return digest.hexdigest()
+
+    def __path(self, key):
+        return self.directory / key[:2] / f'{key}.s'
+
+    def get(self, key):
+        path = self.__path(key)
+        try:
+            text = path.read_text()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # 更新時刻を最終使用時刻として使う．読んだ後に他のプロセスが消していれば何もしない
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return text
+
+    def put(self, key, text):
+        self.put_file(key, StringIO(text))
+
+    def put_file(self, key, source):
+        '''
+        テキストのファイルオブジェクト source の今の位置から最後までを key のエントリとして保存する
+        全体を1つの文字列にせずに少しずつ写す
+        '''
+        path = self.__path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile('w', dir=path.parent, delete=False) as f:
+            copyfileobj(source, f)
+        self.written += os.path.getsize(f.name)
+        os.replace(f.name, path)
+
+    def evict(self):
+        '''
+        合計の大きさが max_bytes 以下になるまで古いものから消す
+        put で書き込んでいなければ大きさは増えていないので，ディレクトリを走査しない
+        同じディレクトリを使う他のプロセスが同時に消したものは飛ばす
+        '''
+        if self.written == 0:
+            return
+        self.written = 0
+        entries = []
+        for path in self.directory.glob('*/*.s'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,243 @@
+from peephole import parse_instruction
+
+
+def is_function_label(line):
+    return line.endswith(':') and not line.startswith((' ', '.'))
+
+
+class BasicBlock:
+    '''
+    先頭のラベルの行と命令の行からなる基本ブロック
+    途中に入ってくるジャンプはなく，ジャンプと ret は末尾にしか置かない
+    '''
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.lines = []
+
+    @property
+    def names(self):
+        return [x[:-1] for x in self.labels]
+
+    @property
+    def last(self):
+        return parse_instruction(self.lines[-1]) if self.lines else None
+
+    @property
+    def jump(self):
+        '''
+        末尾のジャンプ命令 (命令, 飛び先) ．ジャンプで終わらなければ None
+        '''
+        last = self.last
+        if last and last[0].startswith('j'):
+            return last[0], last[1][0]
+        return None
+
+    @property
+    def falls_through(self):
+        '''
+        末尾から次のブロックへ進むことがあるか
+        '''
+        last = self.last
+        return not (last and last[0] in ('jmp', 'ret'))
+
+
+class ControlFlowGraph:
+    '''
+    1つの関数のアセンブリを基本ブロックに分けた制御フローグラフ
+    ラベルの行と，ジャンプ・ret の次の行で新しいブロックを始める
+    先頭のブロックは関数のラベルを持つ入口で，取り除かない
+    '''
+
+    def __init__(self, lines):
+        self.blocks = [BasicBlock([])]
+        for line in lines:
+            block = self.blocks[-1]
+            if line.endswith(':') and parse_instruction(line) is None:
+                if block.lines:
+                    self.blocks.append(BasicBlock([line]))
+                else:
+                    block.labels.append(line)
+                continue
+            if not block.falls_through or block.jump:
+                block = BasicBlock([])
+                self.blocks.append(block)
+            block.lines.append(line)
+
+    @property
+    def name(self):
+        return self.blocks[0].names[0]
+
+    def lines(self):
+        result = []
+        for block in self.blocks:
+            result += block.labels
+            result += block.lines
+        return result
+
+    def instruction_count(self):
+        return sum(1 for x in self.lines() if parse_instruction(x) is not None)
+
+    def successors(self, index, indexes=None):
+        '''
+        index 番目のブロックの後に実行しうるブロックの番号
+        indexes はラベル名からブロックの番号への辞書で，省略すると作り直す
+        '''
+        indexes = self.__indexes() if indexes is None else indexes
+        block = self.blocks[index]
+        targets = []
+        jump = block.jump
+        if jump and jump[1] in indexes:
+            targets.append(indexes[jump[1]])
+        if block.falls_through and index + 1 < len(self.blocks):
+            targets.append(index + 1)
+        return targets
+
+    def __indexes(self):
+        return {name: i for i, block in enumerate(self.blocks) for name in block.names}
+
+    def simplify(self):
+        '''
+        変化がなくなるまで，到達できないブロックの除去とジャンプの整理を繰り返す
+        '''
+        while self.__remove_unreachable() | self.__thread_jumps() | self.__remove_jumps_to_next() | self.__merge_blocks():
+            pass
+        return self
+
+    def __remove_unreachable(self):
+        '''
+        入口からたどれないブロックを取り除く
+        '''
+        indexes = self.__indexes()
+        reached = {0}
+        stack = [0]
+        while stack:
+            for successor in self.successors(stack.pop(), indexes):
+                if successor not in reached:
+                    reached.add(successor)
+                    stack.append(successor)
+        if len(reached) == len(self.blocks):
+            return False
+        self.blocks = [x for i, x in enumerate(self.blocks) if i in reached]
+        return True
+
+    def __thread_jumps(self):
+        '''
+        jmp だけのブロックへのジャンプを，その飛び先へ直接飛ぶようにする
+        '''
+        indexes = self.__indexes()
+        changed = False
+        for block in self.blocks:
+            jump = block.jump
+            if jump is None:
+                continue
+            op, target = jump
+            visited = {target}
+            while target in indexes:
+                forward = self.blocks[indexes[target]]
+                if len(forward.lines) != 1 or forward.jump is None or forward.jump[0] != 'jmp' \
+                        or forward.jump[1] in visited:
+                    break
+                target = forward.jump[1]
+                visited.add(target)
+            if target != jump[1]:
+                block.lines[-1] = f'  {op} {target}'
+                changed = True
+        return changed
+
+    def __remove_jumps_to_next(self):
+        '''
+        直後のブロックへのジャンプを取り除く
+        '''
+        changed = False
+        for block, following in zip(self.blocks, self.blocks[1:]):
+            jump = block.jump
+            if jump and jump[1] in following.names:
+                block.lines.pop()
+                changed = True
+        return changed
+
+    def __merge_blocks(self):
+        '''
+        どこからも飛んでこないラベルを消し，前のブロックから流れ込むだけのブロックをつなげる
+        '''
+        targets = {x.jump[1] for x in self.blocks if x.jump}
+        changed = False
+        blocks = [self.blocks[0]]
+        for block in self.blocks[1:]:
+            labels = [x for x in block.labels if x[:-1] in targets]
+            if labels != block.labels:
+                block.labels = labels
+                changed = True
+            previous = blocks[-1]
+            if not labels and previous.falls_through and not previous.jump:
+                previous.lines += block.lines
+                changed = True
+            else:
+                blocks.append(block)
+        self.blocks = blocks
+        return changed
+
+    def remove_dead_stores(self):
+        '''
+        関数の中で一度も読まない局所変数への mov [rbp-N], R を取り除く
+        lea などで変数のアドレスを取る関数では，アドレスからどの変数を読むか分からないので何もしない
+        '''
+        frame = {('push', ('rbp',)), ('mov', ('rbp', 'rsp')), ('mov', ('rsp', 'rbp')), ('pop', ('rbp',))}
+        stores = []
+        reads = set()
+        for block in self.blocks:
+            for i, line in enumerate(block.lines):
+                instruction = parse_instruction(line)
+                if instruction is None:
+                    continue
+                op, operands = instruction
+                if (op, tuple(operands)) in frame:
+                    continue
+                for j, operand in enumerate(operands):
+                    operand = operand.replace('QWORD PTR ', '')
+                    if 'rbp' not in operand:
+                        continue
+                    if op == 'lea' or not operand.startswith('[rbp-'):
+                        return self
+                    if op == 'mov' and j == 0:
+                        stores.append((block, i, operand))
+                    else:
+                        reads.add(operand)
+        for block, i, operand in reversed(stores):
+            if operand not in reads:
+                del block.lines[i]
+        return self
+
+
+class CfgOptimizer:
+    '''
+    関数ごとに制御フローグラフを作り，到達できないブロックと読まれない変数への書き込みを取り除き，
+    ジャンプを整理する．関数ごとに減らした命令数を eliminated に記録する
+    '''
+
+    def __init__(self):
+        self.eliminated = {}
+
+    def optimize(self, lines):
+        result = []
+        function = None
+        for line in lines:
+            if is_function_label(line):
+                if function:
+                    result += self.__optimize_function(function)
+                function = []
+            if function is None:
+                result.append(line)
+            else:
+                function.append(line)
+        if function:
+            result += self.__optimize_function(function)
+        return result
+
+    def __optimize_function(self, lines):
+        graph = ControlFlowGraph(lines)
+        before = graph.instruction_count()
+        graph.simplify().remove_dead_stores()
+        self.eliminated[graph.name] = self.eliminated.get(graph.name, 0) + before - graph.instruction_count()
+        return graph.lines()
@@ -0,0 +1,162 @@
+from io import StringIO
+from time import perf_counter
+
+from assembler import Assembler
+from astopt import AstOptimizer
+from cfg import CfgOptimizer
+from cparser import Parser
+from generator import PRELUDE, Generator
+from irgen import IrGenerator
+from peephole import PeepholeOptimizer
+from regalloc import RegAllocGenerator
+from tokenizer import TokenContext, Tokenizer
+
+BACKENDS = {'stack': Generator, 'regalloc': RegAllocGenerator, 'ir': IrGenerator}
+
+
+class Compiler:
+    '''
+    Cのコードからアセンブリの行を生成する
+    1つの Compiler で複数の翻訳単位を続けてコンパイルできる
+    '''
+
+    def __init__(self, backend='stack', opt_level=0):
+        self.backend = backend
+        self.opt_level = opt_level
+        self.peephole_hits = {}
+        # 関数名から，制御フローグラフの整理で減らした命令数への辞書
+        self.cfg_eliminated = {}
+
+    def compile(self, c_code):
+        tokenizer = Tokenizer(c_code)
+        tcontext = tokenizer.stream()
+
+        ncontext = self.parse(tcontext)
+        generator = self.__generator(ncontext)
+        return self.__optimize(generator.generate())
+
+    def compile_with_stats(self, c_code, stats):
+        '''
+        段階ごとの計測を stats (CompileStats) に記録しながらコンパイルする
+        段階を分けて計るため，トークナイズは先に全て済ませる
+        '''
+        with stats.phase('tokenize'):
+            table = Tokenizer(c_code).tokenize_table()
+        stats.tokens = len(table)
+
+        with stats.phase('parse'):
+            ncontext = Parser(TokenContext(table, c_code)).parse()
+        if self.opt_level >= 1:
+            with stats.phase('astopt'):
+                ncontext = AstOptimizer(ncontext).optimize()
+        stats.count_nodes(ncontext)
+
+        with stats.phase('generate'):
+            assembly = self.__generator(ncontext, stats.lines).generate()
+        if self.opt_level >= 1:
+            with stats.phase('peephole'):
+                assembly = self.__peephole(assembly)
+            with stats.phase('cfg'):
+                assembly = self.__simplify_cfg(assembly)
+            stats.eliminated = self.cfg_eliminated
+        stats.count_instructions(assembly)
+        return assembly
+
+    def compile_to(self, c_code, sink):
+        '''
+        アセンブリを関数ごとに sink (テキストのファイルオブジェクト) へ書き出す
+        全体の行のリストは作らない
+        '''
+        tokenizer = Tokenizer(c_code)
+        tcontext = tokenizer.stream()
+
+        ncontext = self.parse(tcontext)
+        generator = self.__generator(ncontext)
+        sink.write('\n'.join(PRELUDE))
+        sink.write('\n')
+        for assembly in generator.generate_functions():
+            sink.write('\n'.join(self.__optimize(assembly)))
+            sink.write('\n')
+
+    def compile_object(self, c_code):
+        '''
+        外部のアセンブラを使わずに ELF の再配置可能オブジェクトのバイト列を作る
+        '''
+        return self.assemble(c_code).to_elf()
+
+    def assemble(self, c_code):
+        '''
+        生成したアセンブリを関数ごとに機械語へ変換した Assembler を返す
+        '''
+        tokenizer = Tokenizer(c_code)
+        tcontext = tokenizer.stream()
+
+        ncontext = self.parse(tcontext)
+        generator = self.__generator(ncontext)
+        assembler = Assembler().assemble(PRELUDE)
+        for assembly in generator.generate_functions():
+            assembler.assemble(self.__optimize(assembly))
+        return assembler
+
+    def lower(self, c_code):
+        '''
+        関数ごとに中間表現にした IrFunction のリストを返す．opt_level が1以上なら最適化する
+        '''
+        ncontext = self.parse(Tokenizer(c_code).stream())
+        generator = IrGenerator(ncontext, opt_level=self.opt_level)
+        return [generator.lower_function(node) for node in ncontext.nodes]
+
+    def __generator(self, ncontext, counts=None):
+        '''
+        バックエンドの生成器．中間表現のバックエンドは自身で最適化するので最適化レベルを渡す
+        '''
+        if self.backend == 'ir':
+            return IrGenerator(ncontext, counts, self.opt_level)
+        return BACKENDS[self.backend](ncontext, counts)
+
+    def parse(self, tcontext):
+        parser = Parser(tcontext)
+        ncontext = parser.parse()
+        if self.opt_level >= 1:
+            ncontext = AstOptimizer(ncontext).optimize()
+        return ncontext
+
+    def compile_functions(self, tcontext):
+        '''
+        tcontext に含まれる関数をコンパイルし，関数ごとのアセンブリの行のリストを返す
+        PRELUDE のディレクティブは含まない
+        '''
+        ncontext = self.parse(tcontext)
+        generator = self.__generator(ncontext)
+        return [self.__optimize(generator.generate_function(node)) for node in ncontext.nodes]
+
+    def __optimize(self, assembly):
+        if self.opt_level >= 1:
+            assembly = self.__simplify_cfg(self.__peephole(assembly))
+        return assembly
+
+    def __peephole(self, assembly):
+        optimizer = PeepholeOptimizer()
+        assembly = optimizer.optimize(assembly)
+        for name, count in optimizer.hits.items():
+            self.peephole_hits[name] = self.peephole_hits.get(name, 0) + count
+        return assembly
+
+    def __simplify_cfg(self, assembly):
+        optimizer = CfgOptimizer()
+        assembly = optimizer.optimize(assembly)
+        for name, count in optimizer.eliminated.items():
+            self.cfg_eliminated[name] = self.cfg_eliminated.get(name, 0) + count
+        return assembly
+
+
+def compile_unit(backend, opt_level, c_code):
+    '''
+    1つの翻訳単位をコンパイルして (アセンブリの文字列, 経過秒数, のぞき穴最適化の適用回数) を返す
+    プロセスプールのワーカーから呼ぶため，結果はまとめて1つの文字列にする
+    '''
+    start = perf_counter()
+    compiler = Compiler(backend, opt_level)
+    sink = StringIO()
+    compiler.compile_to(c_code, sink)
+    return sink.getvalue(), perf_counter() - start, compiler.peephole_hits
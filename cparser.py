@@ -1,6 +1,6 @@
 from enum import Enum, auto
 
-from node import NodeContext, NodeFactory, NodeTypes
+from node import FrameLayout, NodeContext, NodeFactory, NodeTypes
 from utility import error
 
 
@@ -13,6 +13,41 @@ class TypeInfo:
         self.ptr_level = ptr_level
 
 
+class SymbolTable:
+    '''
+    関数ごとの変数表
+    変数名から (スロット番号, 型) を引く．ブロックごとにスコープを積み，内側の宣言が外側を隠す
+    '''
+
+    def __init__(self, funcname):
+        self.funcname = funcname
+        self.size = 0
+        self.__symbols = {}
+        self.__scopes = [set()]
+
+    def enter_scope(self):
+        self.__scopes.append(set())
+
+    def leave_scope(self):
+        for varname in self.__scopes.pop():
+            self.__symbols[varname].pop()
+
+    def regist(self, varname, typeinfo):
+        scope = self.__scopes[-1]
+        if varname in scope:
+            error(f'既に変数が宣言されています {self.funcname}::{varname}')
+        scope.add(varname)
+        self.size += 1
+        self.__symbols.setdefault(varname, []).append((self.size, typeinfo))
+        return self.size
+
+    def lookup(self, varname):
+        entries = self.__symbols.get(varname)
+        if not entries:
+            error(f'未宣言の変数が使われています {self.funcname}::{varname}')
+        return entries[-1]
+
+
 class Parser:
     '''
     program    = func*
@@ -24,22 +59,39 @@ class Parser:
                | "return" expr? ";"
                | expr ";"
     expr       = assign
-    assign     = equality ("=" assign)?
-    equality   = relational ("==" relational | "!=" relational)*
-    relational = add ("<" add | "<=" add | ">" add | ">=" add)*
-    add        = mul ("+" mul | "-" mul)*
-    mul        = unary ("*" unary | "/" unary)*
+    assign     = binary ("=" assign)?
+    binary     = unary (binop unary)*    -- binop の優先順位は BINARY_OPERATORS
     unary      = ("*" | "&") unary | ("+" | "-")? term
     term       = "(" expr ")" | "int" "*"* ident | ident ("(" expr* ")")? | num
     '''
 
+    # 二項演算子の (優先順位, ノードの種類)．値が大きいほど強く結合し，全て左結合
+    BINARY_OPERATORS = {
+        '==': (1, NodeTypes.EQ),
+        '!=': (1, NodeTypes.NE),
+        '<': (2, NodeTypes.LT),
+        '<=': (2, NodeTypes.LE),
+        '>': (2, NodeTypes.GT),
+        '>=': (2, NodeTypes.GE),
+        '+': (3, NodeTypes.ADD),
+        '-': (3, NodeTypes.SUB),
+        '*': (4, NodeTypes.MUL),
+        '/': (4, NodeTypes.DIV),
+    }
+    # 前置演算子から部分木を作る関数
+    __PREFIX_OPERATORS = {
+        '&': NodeFactory.create_address_node,
+        '*': NodeFactory.create_dereference_node,
+        '-': lambda node: NodeFactory.create_ope_node(NodeTypes.SUB, NodeFactory.create_num_node(0), node),
+    }
+
     def __init__(self, token_context):
         self.__token_context = token_context
-        self.__varinfos = []
+        self.__frames = []
 
     def parse(self):
         nodes = self.__program(self.__token_context)
-        return NodeContext(nodes, [name for name, _ in self.__varinfos])
+        return NodeContext(nodes, self.__frames)
 
     def __program(self, tcontext):
         '''
@@ -56,6 +108,7 @@ class Parser:
         '''
         tcontext.expect_type()
         funcname = tcontext.expect_ident().text
+        symbols = SymbolTable(funcname)
         tcontext.expect_symbol('(')
         args_order_type = []
         while not tcontext.consume_symbol(')'):
@@ -67,16 +120,46 @@ class Parser:
             typeinfo = TypeInfo(vtype, ptr_level)
 
             arg_token = tcontext.expect_ident()
-            order = self.__regist_varname(arg_token.text, funcname, typeinfo)
+            order = self.__regist_varname(arg_token.text, symbols, typeinfo)
             args_order_type.append((order, typeinfo))
             if not tcontext.consume_symbol(','):
                 tcontext.expect_symbol(')')
                 break
-        if tcontext.current.text != '{':
+        if not tcontext.consume_symbol('{'):
             error('関数の"{"がありません')
-        return NodeFactory.create_func_node(funcname, args_order_type, self.__stmt(tcontext, funcname))
+        # 関数本体は引数と同じスコープ
+        block = self.__run_stmts(tcontext, symbols, self.__block(tcontext, symbols))
+        self.__frames.append(FrameLayout(symbols.size))
+        return NodeFactory.create_func_node(funcname, args_order_type, block)
 
-    def __stmt(self, tcontext, funcname):
+    def __run_stmts(self, tcontext, symbols, steps):
+        '''
+        文の解析を再帰させずに進める
+        解析中の文 (ジェネレータ) は入れ子の文が必要になると yield するので，新しい文の解析をスタックに積む
+        入れ子の文を読み終えたら，その構文木を yield の値として呼び出し元の文に返す
+        '''
+        stack = [steps]
+        node = None
+        while stack:
+            try:
+                stack[-1].send(node)
+            except StopIteration as e:
+                stack.pop()
+                node = e.value
+            else:
+                stack.append(self.__stmt(tcontext, symbols))
+                node = None
+        return node
+
+    def __block(self, tcontext, symbols):
+        stmts = []
+        while not tcontext.consume_symbol('}'):
+            if tcontext.is_empty():
+                error('ブロックの"}"がありません')
+            stmts.append((yield))
+        return NodeFactory.create_block_node(stmts)
+
+    def __stmt(self, tcontext, symbols):
         '''
         stmt = "{" stmt* "}"
              | "if" "(" expr ")" stmt ("else" stmt)?
@@ -84,143 +167,158 @@ class Parser:
              | "for" "(" expr? ";" expr? ";" expr? ")" stmt
              | "return" expr? ";"
              | expr ";"
+        入れ子の stmt は yield して __run_stmts に読ませる
         '''
         if tcontext.consume_symbol('{'):
-            stmts = []
-            while not tcontext.consume_symbol('}'):
-                if tcontext.is_empty():
-                    error('ブロックの"}"がありません')
-                stmts.append(self.__stmt(tcontext, funcname))
-            node = NodeFactory.create_block_node(stmts)
+            symbols.enter_scope()
+            node = yield from self.__block(tcontext, symbols)
+            symbols.leave_scope()
         elif tcontext.consume_if():
             tcontext.expect_symbol('(')
-            expr = self.__expr(tcontext, funcname)
+            expr = self.__expr(tcontext, symbols)
             tcontext.expect_symbol(')')
-            stmt = self.__stmt(tcontext, funcname)
-            else_stmt = self.__stmt(tcontext, funcname) if tcontext.consume_else() else None
+            stmt = yield
+            else_stmt = (yield) if tcontext.consume_else() else None
             if else_stmt:
                 node = NodeFactory.create_if_else_node(expr, stmt, else_stmt)
             else:
                 node = NodeFactory.create_if_node(expr, stmt)
         elif tcontext.consume_while():
             tcontext.expect_symbol('(')
-            expr = self.__expr(tcontext, funcname)
+            expr = self.__expr(tcontext, symbols)
             tcontext.expect_symbol(')')
-            stmt = self.__stmt(tcontext, funcname)
+            stmt = yield
             node = NodeFactory.create_while_node(expr, stmt)
         elif tcontext.consume_for():
             tcontext.expect_symbol('(')
-            expr1 = None if tcontext.consume_symbol(';') else self.__expr(tcontext, funcname)
+            expr1 = None if tcontext.consume_symbol(';') else self.__expr(tcontext, symbols)
             if expr1:
                 tcontext.expect_symbol(';')
-            expr2 = None if tcontext.consume_symbol(';') else self.__expr(tcontext, funcname)
+            expr2 = None if tcontext.consume_symbol(';') else self.__expr(tcontext, symbols)
             if expr2:
                 tcontext.expect_symbol(';')
             else:
                 expr2 = NodeFactory.create_for_infinite_dummy_node()
-            expr3 = None if tcontext.consume_symbol(')') else self.__expr(tcontext, funcname)
+            expr3 = None if tcontext.consume_symbol(')') else self.__expr(tcontext, symbols)
             if expr3:
                 tcontext.expect_symbol(')')
-            stmt = self.__stmt(tcontext, funcname)
+            stmt = yield
             node = NodeFactory.create_for_node(expr1, expr2, expr3, stmt)
         elif tcontext.consume_return():
             if tcontext.consume_symbol(';'):
                 expr = None
             else:
-                expr = self.__expr(tcontext, funcname)
+                expr = self.__expr(tcontext, symbols)
                 tcontext.expect_symbol(';')
             node = NodeFactory.create_return_node(expr)
         else:
-            node = self.__expr(tcontext, funcname)
+            node = self.__expr(tcontext, symbols)
             tcontext.expect_symbol(';')
         return node
 
-    def __expr(self, tcontext, funcname):
-        '''
-        expr = assign
-        '''
-        return self.__assign(tcontext, funcname)
-
-    def __assign(self, tcontext, funcname):
+    def __expr(self, tcontext, symbols):
         '''
-        assign = equality ("=" assign)?
+        expr   = assign
+        assign = binary ("=" assign)?
+        binary = unary (binop unary)*
+        unary  = ("&" | "*") unary | ("+" | "-")? term
+        term   = "(" expr ")" | "int" "*"* ident | ident ("(" expr* ")")? | num
+        入れ子の括弧や代入の連鎖で再帰しないように，読みかけの演算子・括弧・関数呼び出しを operators に，
+        組み立て途中の部分木を operands に積んで読む
         '''
-        node = self.__equality(tcontext, funcname)
-        if tcontext.consume_symbol('='):
-            node = NodeFactory.create_assign_node(node, self.__assign(tcontext, funcname))
-        return node
-
-    def __parse_common_func(self, tcontext, funcname, map_, next_func):
-        node = next_func(tcontext, funcname)
+        operators = []
+        operands = []
+        node = None
         while True:
-            for k, v in map_.items():
-                token = tcontext.consume_symbol(k)
-                if token:
-                    node = NodeFactory.create_ope_node(v, node, next_func(tcontext, funcname))
-                    break
-            else:
-                return node
-
-    def __equality(self, tcontext, funcname):
-        '''
-        equality = relational ("==" relational | "!=" relational)*
-        '''
-        map_ = {'==': NodeTypes.EQ, '!=': NodeTypes.NE}
-        return self.__parse_common_func(tcontext, funcname, map_, self.__relational)
+            if node is None:
+                node = self.__operand(tcontext, symbols, operators)
+            # 被演算子を読み終えたら，その直前の前置演算子を適用する
+            while operators and operators[-1][0] in Parser.__PREFIX_OPERATORS:
+                node = Parser.__PREFIX_OPERATORS[operators.pop()[0]](node)
+            operands.append(node)
+            node = None
 
-    def __relational(self, tcontext, funcname):
-        '''
-        relational = add ("<" add | "<=" add | ">" add | ">=" add)*
-        '''
-        map_ = {'<': NodeTypes.LT, '<=': NodeTypes.LE, '>': NodeTypes.GT, '>=': NodeTypes.GE}
-        return self.__parse_common_func(tcontext, funcname, map_, self.__add)
+            symbol = tcontext.peek_symbol()
+            operator = Parser.BINARY_OPERATORS.get(symbol)
+            if operator is not None:
+                tcontext.next()
+                Parser.__reduce(operators, operands, operator[0])
+                operators.append(('binop',) + operator)
+                continue
+            if symbol == '=':
+                tcontext.next()
+                # 代入は右結合なので，積まれている "=" は還元しない
+                Parser.__reduce(operators, operands, 1)
+                operators.append(('=',))
+                continue
 
-    def __add(self, tcontext, funcname):
-        '''
-        add = mul ("+" mul | "-" mul)*
-        '''
-        map_ = {'+': NodeTypes.ADD, '-': NodeTypes.SUB}
-        return self.__parse_common_func(tcontext, funcname, map_, self.__mul)
+            Parser.__reduce(operators, operands, 0)
+            if not operators:
+                return operands.pop()
+            if operators[-1][0] == '(':
+                tcontext.expect_symbol(')')
+                operators.pop()
+                node = operands.pop()
+            elif tcontext.consume_symbol(','):
+                operators[-1][2].append(operands.pop())
+            else:
+                tcontext.expect_symbol(')')
+                _, name, args = operators.pop()
+                args.append(operands.pop())
+                node = NodeFactory.create_call_node(name, args)
 
-    def __mul(self, tcontext, funcname):
+    @staticmethod
+    def __reduce(operators, operands, min_precedence):
         '''
-        mul = unary ("*" unary | "/" unary)*
+        優先順位が min_precedence 以上の二項演算子を部分木にまとめる．min_precedence が0なら代入もまとめる
         '''
-        map_ = {'*': NodeTypes.MUL, '/': NodeTypes.DIV}
-        return self.__parse_common_func(tcontext, funcname, map_, self.__unary)
+        while operators:
+            operator = operators[-1]
+            if operator[0] == 'binop' and operator[1] >= min_precedence:
+                right = operands.pop()
+                operands[-1] = NodeFactory.create_ope_node(operator[2], operands[-1], right)
+            elif operator[0] == '=' and min_precedence == 0:
+                right = operands.pop()
+                operands[-1] = NodeFactory.create_assign_node(operands[-1], right)
+            else:
+                return
+            operators.pop()
 
-    def __unary(self, tcontext, funcname):
+    def __operand(self, tcontext, symbols, operators):
         '''
-        unary = ("&" | "*") unary | ("+" | "-")? term
+        前置演算子と開き括弧を operators に積みながら，被演算子になる項を1つ読む
+        "+" と "-" の後ろは項でなければならない
         '''
-        token = tcontext.consume_symbol('&')
-        if token:
-            return NodeFactory.create_address_node(self.__unary(tcontext, funcname))
-
-        token = tcontext.consume_symbol('*')
-        if token:
-            return NodeFactory.create_dereference_node(self.__unary(tcontext, funcname))
-
-        token = tcontext.consume_symbol('+')
-        if token:
-            return self.__term(tcontext, funcname)
-
-        token = tcontext.consume_symbol('-')
-        if token:
-            return NodeFactory.create_ope_node(NodeTypes.SUB, NodeFactory.create_num_node(0), self.__term(tcontext, funcname))
-
-        return self.__term(tcontext, funcname)
+        term_only = False
+        while True:
+            symbol = tcontext.peek_symbol()
+            if symbol in ('&', '*') and not term_only:
+                tcontext.next()
+                operators.append((symbol,))
+            elif symbol in ('+', '-') and not term_only:
+                tcontext.next()
+                if symbol == '-':
+                    operators.append((symbol,))
+                term_only = True
+            elif symbol == '(':
+                tcontext.next()
+                operators.append(('(',))
+                term_only = False
+            elif symbol == ')' and operators and operators[-1][0] == 'call':
+                # 引数のない呼び出しか，最後の引数の後ろの ","
+                tcontext.next()
+                _, name, args = operators.pop()
+                return NodeFactory.create_call_node(name, args)
+            else:
+                node = self.__term(tcontext, symbols, operators)
+                if node is not None:
+                    return node
+                term_only = False
 
-    def __term(self, tcontext, funcname):
+    def __term(self, tcontext, symbols, operators):
         '''
-        term = "(" expr ")" | "int" "*"* ident | ident ("(" expr* ")")? | num
+        括弧以外の項を読む．関数呼び出しの "(" を読んだら operators に積んで None を返す
         '''
-        token = tcontext.consume_symbol('(')
-        if token:
-            node = self.__expr(tcontext, funcname)
-            tcontext.expect_symbol(')')
-            return node
-
         token = tcontext.consume_type()
         if token:
             ptr_level = 0
@@ -229,44 +327,26 @@ class Parser:
             vtype = self.__get_type_from_typename(token.text)
             typeinfo = TypeInfo(vtype, ptr_level)
             name = tcontext.expect_ident().text
-            order = self.__regist_varname(name, funcname, typeinfo)
-            node = NodeFactory.create_ident_node(order, typeinfo)
-            return node
+            order = self.__regist_varname(name, symbols, typeinfo)
+            return NodeFactory.create_ident_node(order, typeinfo)
 
         token = tcontext.consume_ident()
         if token:
             name = token.text
             if tcontext.consume_symbol('('):
-                args = []
-                while not tcontext.consume_symbol(')'):
-                    args.append(self.__expr(tcontext, funcname))
-                    if not tcontext.consume_symbol(','):
-                        tcontext.expect_symbol(')')
-                        break
-                node = NodeFactory.create_call_node(name, args)
-            else:
-                order, typeinfo = self.__get_order_and_type_from_varname(name, funcname)
-                node = NodeFactory.create_ident_node(order, typeinfo)
-            return node
+                operators.append(('call', name, []))
+                return None
+            order, typeinfo = self.__get_order_and_type_from_varname(name, symbols)
+            return NodeFactory.create_ident_node(order, typeinfo)
 
         token_num = tcontext.expect_num()
         return NodeFactory.create_num_node(token_num.value)
 
-    def __regist_varname(self, varname, funcname, typeinfo):
-        name = f'{funcname}::{varname}'
-        if name in [n for n, t in self.__varinfos]:
-            error(f'既に変数が宣言されています {name}')
-        self.__varinfos.append((name, typeinfo))
-        order, _ = self.__get_order_and_type_from_varname(varname, funcname)
-        return order
-
-    def __get_order_and_type_from_varname(self, varname, funcname):
-        name = f'{funcname}::{varname}'
-        if name not in [n for n, t in self.__varinfos]:
-            error(f'未宣言の変数が使われています {name}')
-        name_type = [(n, t) for n, t in self.__varinfos if n.startswith(f'{funcname}:')]
-        index = [n for n, t in name_type].index(name)
-        return index + 1, name_type[index][1]
+    def __regist_varname(self, varname, symbols, typeinfo):
+        return symbols.regist(varname, typeinfo)
+
+    def __get_order_and_type_from_varname(self, varname, symbols):
+        return symbols.lookup(varname)
 
     def __get_type_from_typename(self, typename):
         type_map = {'int': TypeInfo.Types.INT}
@@ -0,0 +1,280 @@
+import ctypes
+
+from node import FrameLayout, NodeTypes
+from utility import error
+
+
+class Evaluator:
+    '''
+    構文木をアセンブリを経由せずに評価する
+    各ノードを Python のクロージャに変換してから実行する
+    変数は生成するコードと同じく rbp - order * 8 のアドレスに置き，メモリはアドレスから値への辞書で表す
+    定義されていない関数は hosts の関数，次に libraries の共有ライブラリの関数を呼ぶ
+    '''
+    STACK_TOP = 1 << 47
+    INT64_MASK = (1 << 64) - 1
+    INT64_SIGN = 1 << 63
+
+    # 文を実行した結果．return 以外はこれを返す
+    NEXT = object()
+
+    __operators = {
+        NodeTypes.ADD: lambda x, y: x + y,
+        NodeTypes.SUB: lambda x, y: x - y,
+        NodeTypes.MUL: lambda x, y: x * y,
+        NodeTypes.SHL: lambda x, y: x << (y & 63),
+        NodeTypes.EQ: lambda x, y: int(x == y),
+        NodeTypes.NE: lambda x, y: int(x != y),
+        NodeTypes.LT: lambda x, y: int(x < y),
+        NodeTypes.LE: lambda x, y: int(x <= y),
+        NodeTypes.GT: lambda x, y: int(x > y),
+        NodeTypes.GE: lambda x, y: int(x >= y),
+    }
+
+    def __init__(self, node_context, hosts=None, libraries=()):
+        self.__ncontext = node_context
+        self.__hosts = dict(hosts or {})
+        self.__libraries = [ctypes.CDLL(str(x)) for x in libraries]
+        self.__memory = {}
+        self.__sp = Evaluator.STACK_TOP
+        self.__functions = {}
+        self.__map = {
+            NodeTypes.NUM: self.__compile_num,
+            NodeTypes.IDENT: self.__compile_ident,
+            NodeTypes.DIV: self.__compile_div,
+            NodeTypes.ASSIGN: self.__compile_assign,
+            NodeTypes.ADDR: self.__compile_address,
+            NodeTypes.DEREF: self.__compile_dereference,
+            NodeTypes.CALL: self.__compile_call,
+            NodeTypes.RETURN: self.__compile_return,
+            NodeTypes.IF: self.__compile_if,
+            NodeTypes.IF_ELSE: self.__compile_if_else,
+            NodeTypes.WHILE: self.__compile_while,
+            NodeTypes.FOR: self.__compile_for,
+            NodeTypes.BLOCK: self.__compile_block,
+        }
+        for n_type in Evaluator.__operators:
+            self.__map[n_type] = self.__compile_operator
+        # クロージャの変換と実行は構文木の深さだけ再帰する
+        try:
+            for node in self.__ncontext.nodes:
+                self.__functions[node.name] = self.__compile_func(node)
+        except RecursionError:
+            error('入れ子が深すぎて評価できません')
+
+    def call(self, name, *args):
+        '''
+        関数 name を呼び出して戻り値を返す
+        '''
+        try:
+            if name in self.__functions:
+                return self.__functions[name](*args)
+            return self.__call_host(name, args)
+        except RecursionError:
+            error(f'入れ子か関数呼び出しが深すぎて評価できません {name}')
+
+    def __call_host(self, name, args):
+        if name in self.__hosts:
+            return self.__hosts[name](*args)
+        for library in self.__libraries:
+            try:
+                function = getattr(library, name)
+            except AttributeError:
+                continue
+            # 外部の関数は int を返すとみなす
+            self.__hosts[name] = function
+            return function(*args)
+        error(f'関数が見つかりません {name}')
+
+    @staticmethod
+    def __wrap(value):
+        '''
+        64ビットのレジスタと同じく符号付き64ビットに丸める
+        '''
+        if -Evaluator.INT64_SIGN <= value < Evaluator.INT64_SIGN:
+            return value
+        value &= Evaluator.INT64_MASK
+        return value - (1 << 64) if value & Evaluator.INT64_SIGN else value
+
+    def __compile(self, node):
+        if node.type not in self.__map:
+            error(f'評価できないノードです {node.type}')
+        return self.__map[node.type](node)
+
+    def __compile_num(self, node):
+        value = int(node.value)
+        return lambda rbp: value
+
+    def __compile_ident(self, node):
+        offset = FrameLayout.SLOT_SIZE * node.order
+        memory = self.__memory
+        return lambda rbp: memory.get(rbp - offset, 0)
+
+    def __compile_lval(self, node):
+        '''
+        左辺値のアドレスを返すクロージャ
+        '''
+        if node.type == NodeTypes.IDENT:
+            offset = FrameLayout.SLOT_SIZE * node.order
+            return lambda rbp: rbp - offset
+        if node.type == NodeTypes.DEREF:
+            return self.__compile(node.unary)
+        error(f'代入の左辺値が変数ではありません {node.type}')
+
+    def __compile_operator(self, node):
+        operator = Evaluator.__operators[node.type]
+        left = self.__compile(node.left)
+        right = self.__compile(node.right)
+        wrap = Evaluator.__wrap
+        return lambda rbp: wrap(operator(left(rbp), right(rbp)))
+
+    def __compile_div(self, node):
+        left = self.__compile(node.left)
+        right = self.__compile(node.right)
+
+        def div(rbp):
+            x = left(rbp)
+            y = right(rbp)
+            if y == 0:
+                error('0で除算しました')
+            # idiv と同じく0方向に切り捨てる
+            q = abs(x) // abs(y)
+            return Evaluator.__wrap(q if (x < 0) == (y < 0) else -q)
+        return div
+
+    def __compile_assign(self, node):
+        address = self.__compile_lval(node.left)
+        value = self.__compile(node.right)
+        memory = self.__memory
+
+        def assign(rbp):
+            v = value(rbp)
+            memory[address(rbp)] = v
+            return v
+        return assign
+
+    def __compile_address(self, node):
+        return self.__compile_lval(node.unary)
+
+    def __compile_dereference(self, node):
+        address = self.__compile(node.unary)
+        memory = self.__memory
+        return lambda rbp: memory.get(address(rbp), 0)
+
+    def __compile_call(self, node):
+        name = node.name
+        args = [self.__compile(x) for x in node.args]
+        functions = self.__functions
+
+        def call(rbp):
+            values = [x(rbp) for x in args]
+            if name in functions:
+                return functions[name](*values)
+            return self.__call_host(name, values)
+        return call
+
+    def __compile_return(self, node):
+        if node.expr is None:
+            # 値のない return は 0 を返す
+            return lambda rbp: 0
+        return self.__compile(node.expr)
+
+    def __compile_stmt(self, node):
+        '''
+        文を実行するクロージャ．return に達したらその値を，そうでなければ NEXT を返す
+        '''
+        if node.type == NodeTypes.RETURN:
+            return self.__compile_return(node)
+        if node.type in (NodeTypes.IF, NodeTypes.IF_ELSE, NodeTypes.WHILE, NodeTypes.FOR, NodeTypes.BLOCK):
+            return self.__compile(node)
+        expr = self.__compile(node)
+        next_ = Evaluator.NEXT
+
+        def stmt(rbp):
+            expr(rbp)
+            return next_
+        return stmt
+
+    def __compile_if(self, node):
+        cond = self.__compile(node.expr)
+        stmt = self.__compile_stmt(node.stmt)
+        next_ = Evaluator.NEXT
+        return lambda rbp: stmt(rbp) if cond(rbp) else next_
+
+    def __compile_if_else(self, node):
+        cond = self.__compile(node.expr)
+        stmt = self.__compile_stmt(node.stmt)
+        else_stmt = self.__compile_stmt(node.else_stmt)
+        return lambda rbp: stmt(rbp) if cond(rbp) else else_stmt(rbp)
+
+    def __compile_while(self, node):
+        cond = self.__compile(node.expr)
+        stmt = self.__compile_stmt(node.stmt)
+        next_ = Evaluator.NEXT
+
+        def while_(rbp):
+            while cond(rbp):
+                result = stmt(rbp)
+                if result is not next_:
+                    return result
+            return next_
+        return while_
+
+    def __compile_for(self, node):
+        init = self.__compile(node.expr1) if node.expr1 else Evaluator.__nothing
+        cond = self.__compile(node.expr2) if node.expr2 else Evaluator.__nothing
+        step = self.__compile(node.expr3) if node.expr3 else Evaluator.__nothing
+        stmt = self.__compile_stmt(node.stmt)
+        next_ = Evaluator.NEXT
+
+        def for_(rbp):
+            init(rbp)
+            while cond(rbp):
+                result = stmt(rbp)
+                if result is not next_:
+                    return result
+                step(rbp)
+            return next_
+        return for_
+
+    @staticmethod
+    def __nothing(rbp):
+        '''
+        省略した for の式．条件としては常に真
+        '''
+        return 1
+
+    def __compile_block(self, node):
+        stmts = [self.__compile_stmt(x) for x in node.stmts]
+        next_ = Evaluator.NEXT
+
+        def block(rbp):
+            for stmt in stmts:
+                result = stmt(rbp)
+                if result is not next_:
+                    return result
+            return next_
+        return block
+
+    def __compile_func(self, node):
+        '''
+        関数を呼び出すたびに rbp を下げてフレームを確保する
+        '''
+        block = self.__compile_block(node.block)
+        offsets = [FrameLayout.SLOT_SIZE * order for order, _ in node.args_order_type]
+        # 戻りアドレスと退避した rbp の分
+        size = node.frame.size + 2 * FrameLayout.SLOT_SIZE
+        memory = self.__memory
+        next_ = Evaluator.NEXT
+
+        def func(*args):
+            rbp = self.__sp
+            self.__sp = rbp - size
+            try:
+                for offset, value in zip(offsets, args):
+                    memory[rbp - offset] = value
+                result = block(rbp)
+            finally:
+                self.__sp = rbp
+            return 0 if result is next_ else result
+        return func
@@ -1,125 +1,155 @@
 from abc import ABCMeta, abstractmethod
 
+from node import NodeTypes
 from utility import error
 
 
+PRELUDE = ['.intel_syntax noprefix', '.global main']
+
+
+class LabelAllocator:
+    '''
+    関数ごとに '.関数名.連番' の形のラベルの接尾辞を払い出す
+    他の関数に依存しないので，関数ごとに生成したアセンブリをそのまま再利用できる
+    '''
+
+    def __init__(self, funcname):
+        self.__funcname = funcname
+        self.__count = 0
+
+    def new_label(self):
+        self.__count += 1
+        return f'.{self.__funcname}.{self.__count}'
+
+
+class Assembly(list):
+    '''
+    生成したアセンブリの行
+    push / pop はメソッド経由で出力し，スタックに積まれている値の数を depth で数える
+    counts を渡すと，生成器のクラス名ごとに出力した行数を数える
+    '''
+
+    def __init__(self, labels, counts=None):
+        super().__init__()
+        self.depth = 0
+        self.labels = labels
+        self.counts = counts
+
+    def push(self, operand):
+        self.append(f'  push {operand}')
+        self.depth += 1
+
+    def pop(self, operand):
+        self.append(f'  pop {operand}')
+        self.depth -= 1
+
+
 class NodeGenerator(metaclass=ABCMeta):
     REG_ARGS = ['rdi', 'rsi', 'rdx', 'rcx', 'r8', 'r9']
 
     @abstractmethod
     def generate(self, node, output):
+        '''
+        子を持つノードではジェネレータにして，子ノードを yield する (generate_node を参照)
+        '''
         pass
 
     def _gen_lval(self, node, output):
-        from node import NodeTypes
-
         if node.type != NodeTypes.IDENT:
             error(f'代入の左辺値が変数ではありません {node.type}')
         output.append('  mov rax, rbp')
         output.append(f'  sub rax, {node.order * 8}')
-        output.append('  push rax')
-
-    def _append_missing_pop(self, output):
-        push_count = len([x for x in output if x.lstrip().startswith('push') and not x.rstrip().endswith('rbp')])
-        pop_count = len([x for x in output if x.lstrip().startswith('pop') and not x.rstrip().endswith('rbp')])
-        if (push_count - pop_count) == 0:
+        output.push('rax')
+
+    def _append_missing_pop(self, output, depth):
+        '''
+        depth は文を生成する前の output.depth
+        式文が残した値を捨てる
+        '''
+        count = output.depth - depth
+        if count == 0:
             pass
-        elif (push_count - pop_count) == 1:
-            output.append('  pop rax')
-        elif (push_count - pop_count) > 1:
-            error(f'pushが多すぎます push: {push_count} pop: {pop_count}')
+        elif count == 1:
+            output.pop('rax')
+        elif count > 1:
+            error(f'pushが多すぎます push: {count}')
         else:
-            # error(f'popが多すぎます push: {push_count} pop: {pop_count}')
-            pass
+            error(f'popが多すぎます pop: {-count}')
 
 
 class NumGenerator(NodeGenerator):
     def generate(self, node, output):
-        output.append(f'  push {node.value}')
+        output.push(node.value)
 
 
 class OperatorGenerator(NodeGenerator):
-    def __gen_arithmetic(self, node, output):
-        from node import NodeTypes
-
-        map_ = {
-            NodeTypes.ADD: ['  add rax, rdi'],
-            NodeTypes.SUB: ['  sub rax, rdi'],
-            NodeTypes.MUL: ['  imul rdi'],
-            NodeTypes.DIV: ['  cqo',
-                            '  idiv rdi']
-        }
-        if node.type in map_:
-            output += map_[node.type]
-            return True
-        return False
-
-    def __gen_comparison(self, node, output):
-        from node import NodeTypes
-
-        map_ = {
-            NodeTypes.EQ: ['  cmp rax, rdi',
-                           '  sete al'],
-            NodeTypes.NE: ['  cmp rax, rdi',
-                           '  setne al'],
-            NodeTypes.LE: ['  cmp rax, rdi',
-                           '  setle al'],
-            NodeTypes.GE: ['  cmp rdi, rax',
-                           '  setle al'],
-            NodeTypes.LT: ['  cmp rax, rdi',
-                           '  setl al'],
-            NodeTypes.GT: ['  cmp rdi, rax',
-                           '  setl al'],
-        }
-        if node.type in map_:
-            output += map_[node.type]
-            output.append('  movzb rax, al')
-            return True
-        return False
+    __arithmetic = {
+        NodeTypes.ADD: ['  add rax, rdi'],
+        NodeTypes.SUB: ['  sub rax, rdi'],
+        NodeTypes.MUL: ['  imul rdi'],
+        NodeTypes.DIV: ['  cqo',
+                        '  idiv rdi'],
+        NodeTypes.SHL: ['  mov rcx, rdi',
+                        '  shl rax, cl'],
+    }
+    __comparison = {
+        NodeTypes.EQ: ['  cmp rax, rdi',
+                       '  sete al'],
+        NodeTypes.NE: ['  cmp rax, rdi',
+                       '  setne al'],
+        NodeTypes.LE: ['  cmp rax, rdi',
+                       '  setle al'],
+        NodeTypes.GE: ['  cmp rdi, rax',
+                       '  setle al'],
+        NodeTypes.LT: ['  cmp rax, rdi',
+                       '  setl al'],
+        NodeTypes.GT: ['  cmp rdi, rax',
+                       '  setl al'],
+    }
 
     def generate(self, node, output):
-        node.left.generate(output)
-        node.right.generate(output)
+        yield node.left
+        yield node.right
 
-        output.append('  pop rdi')
-        output.append('  pop rax')
+        output.pop('rdi')
+        output.pop('rax')
 
-        self.__gen_arithmetic(node, output)
-        self.__gen_comparison(node, output)
+        if node.type in OperatorGenerator.__arithmetic:
+            output += OperatorGenerator.__arithmetic[node.type]
+        else:
+            output += OperatorGenerator.__comparison[node.type]
+            output.append('  movzb rax, al')
 
-        output.append('  push rax')
-        return True
+        output.push('rax')
 
 
 class AssignGenerator(NodeGenerator):
     def generate(self, node, output):
-        from node import NodeTypes
-
         if node.left.type == NodeTypes.DEREF:
-            node.left.unary.generate(output)
+            yield node.left.unary
         else:
             self._gen_lval(node.left, output)
 
-        node.right.generate(output)
-        output.append('  pop rdi')
-        output.append('  pop rax')
+        yield node.right
+        output.pop('rdi')
+        output.pop('rax')
         output.append('  mov [rax], rdi')
-        output.append('  push rdi')
+        output.push('rdi')
 
 
 class IdentGenerator(NodeGenerator):
     def generate(self, node, output):
         self._gen_lval(node, output)
-        output.append('  pop rax')
+        output.pop('rax')
         output.append('  mov rax, [rax]')
-        output.append('  push rax')
+        output.push('rax')
 
 
 class ReturnGenerator(NodeGenerator):
     def generate(self, node, output):
         if node.expr:
-            node.expr.generate(output)
-            output.append('  pop rax')
+            yield node.expr
+            output.pop('rax')
         output.append('  mov rsp, rbp')
         output.append('  pop rbp')
         output.append('  ret')
@@ -127,67 +157,77 @@ class ReturnGenerator(NodeGenerator):
 
 class IfGenerator(NodeGenerator):
     def generate(self, node, output):
-        node.expr.generate(output)
-        output.append('  pop rax')
+        depth = output.depth
+        label = output.labels.new_label()
+        yield node.expr
+        output.pop('rax')
         output.append('  cmp rax, 0')
-        output.append(f'  je  .Lend{id(node)}')
-        node.stmt.generate(output)
-        self._append_missing_pop(output)
-        output.append(f'.Lend{id(node)}:')
+        output.append(f'  je  .Lend{label}')
+        yield node.stmt
+        self._append_missing_pop(output, depth)
+        output.append(f'.Lend{label}:')
 
 
 class IfElseGenerator(NodeGenerator):
     def generate(self, node, output):
-        node.expr.generate(output)
-        output.append('  pop rax')
+        depth = output.depth
+        label = output.labels.new_label()
+        yield node.expr
+        output.pop('rax')
         output.append('  cmp rax, 0')
-        output.append(f'  je  .Lelse{id(node)}')
-        node.stmt.generate(output)
-        self._append_missing_pop(output)
-        output.append(f'  jmp .Lend{id(node)}')
-        output.append(f'.Lelse{id(node)}:')
-        node.else_stmt.generate(output)
-        self._append_missing_pop(output)
-        output.append(f'.Lend{id(node)}:')
+        output.append(f'  je  .Lelse{label}')
+        yield node.stmt
+        self._append_missing_pop(output, depth)
+        output.append(f'  jmp .Lend{label}')
+        output.append(f'.Lelse{label}:')
+        yield node.else_stmt
+        self._append_missing_pop(output, depth)
+        output.append(f'.Lend{label}:')
 
 
 class WhileGenerator(NodeGenerator):
     def generate(self, node, output):
-        output.append(f'.Lbegin{id(node)}:')
-        node.expr.generate(output)
-        output.append('  pop rax')
+        depth = output.depth
+        label = output.labels.new_label()
+        output.append(f'.Lbegin{label}:')
+        yield node.expr
+        output.pop('rax')
         output.append('  cmp rax, 0')
-        output.append(f'  je  .Lend{id(node)}')
-        node.stmt.generate(output)
-        self._append_missing_pop(output)
-        output.append(f'  jmp .Lbegin{id(node)}')
-        output.append(f'.Lend{id(node)}:')
+        output.append(f'  je  .Lend{label}')
+        yield node.stmt
+        self._append_missing_pop(output, depth)
+        output.append(f'  jmp .Lbegin{label}')
+        output.append(f'.Lend{label}:')
 
 
 class ForGenerator(NodeGenerator):
     def generate(self, node, output):
+        depth = output.depth
+        label = output.labels.new_label()
         if node.expr1:
-            node.expr1.generate(output)
-            self._append_missing_pop(output)
-        output.append(f'.Lbegin{id(node)}:')
-        node.expr2.generate(output)
-        output.append('  pop rax')
-        output.append('  cmp rax, 0')
-        output.append(f'  je  .Lend{id(node)}')
-        node.stmt.generate(output)
-        self._append_missing_pop(output)
+            yield node.expr1
+            self._append_missing_pop(output, depth)
+        output.append(f'.Lbegin{label}:')
+        if node.expr2:
+            yield node.expr2
+            output.pop('rax')
+            output.append('  cmp rax, 0')
+            output.append(f'  je  .Lend{label}')
+        yield node.stmt
+        self._append_missing_pop(output, depth)
         if node.expr3:
-            node.expr3.generate(output)
-            self._append_missing_pop(output)
-        output.append(f'  jmp .Lbegin{id(node)}')
-        output.append(f'.Lend{id(node)}:')
+            yield node.expr3
+            self._append_missing_pop(output, depth)
+        output.append(f'  jmp .Lbegin{label}')
+        output.append(f'.Lend{label}:')
 
 
 class BlockGenerator(NodeGenerator):
     def generate(self, node, output):
+        depth = output.depth
         for stmt in node.stmts:
-            stmt.generate(output)
-            self._append_missing_pop(output)
+            yield stmt
+            self._append_missing_pop(output, depth)
 
 
 class CallGenerator(NodeGenerator):
@@ -196,27 +236,25 @@ class CallGenerator(NodeGenerator):
             error(f'引数が多すぎます {node.args}')
 
         for arg in node.args:
-            arg.generate(output)
+            yield arg
 
         for reg in CallGenerator.REG_ARGS[:len(node.args)][::-1]:
-            output.append(f'  pop {reg}')
+            output.pop(reg)
 
-        output.append('  push  r15')
-        output.append('  xor   r15, r15')
-        output.append('  test  rsp, 0xf')
-        output.append('  setnz r15b')
-        output.append('  shl   r15, 3')
-        output.append('  sub   rsp, r15')
-        output.append(f'  call  {node.name}')
-        output.append('  add   rsp, r15')
-        output.append('  pop   r15')
-        output.append('  push  rax')
+        # フレームは16バイト境界に揃っているので，積んでいる値の数が奇数なら8バイトずらす
+        padding = output.depth % 2 == 1
+        if padding:
+            output.append('  sub rsp, 8')
+        output.append(f'  call {node.name}')
+        if padding:
+            output.append('  add rsp, 8')
+        output.push('rax')
 
 
 class FuncGenerator(NodeGenerator):
     def generate(self, node, output):
         if len(NodeGenerator.REG_ARGS) < len(node.args_order_type):
-            error(f'引数が多すぎます {node.args}')
+            error(f'引数が多すぎます {node.name}')
 
         output.append(f'{node.name}:')
 
@@ -230,7 +268,7 @@ class FuncGenerator(NodeGenerator):
             output.append(f'  sub rax, {order * 8}')
             output.append(f'  mov [rax], {reg}')
 
-        node.block.generate(output)
+        yield node.block
 
         if not output[-1].lstrip().startswith('ret'):
             output.append('  mov rsp, rbp')
@@ -245,31 +283,111 @@ class AddressGenerator(NodeGenerator):
 
 class DereferenceGenerator(NodeGenerator):
     def generate(self, node, output):
-        node.unary.generate(output)
-        output.append('  pop rax')
+        yield node.unary
+        output.pop('rax')
         output.append('  mov rax, [rax]')
-        output.append('  push rax')
+        output.push('rax')
+
+
+# ノードの種類から生成器への表．生成器は状態を持たないので全ノードで共有する
+GENERATORS = {
+    NodeTypes.NUM: NumGenerator(),
+    NodeTypes.ASSIGN: AssignGenerator(),
+    NodeTypes.IDENT: IdentGenerator(),
+    NodeTypes.RETURN: ReturnGenerator(),
+    NodeTypes.IF: IfGenerator(),
+    NodeTypes.IF_ELSE: IfElseGenerator(),
+    NodeTypes.WHILE: WhileGenerator(),
+    NodeTypes.FOR: ForGenerator(),
+    NodeTypes.BLOCK: BlockGenerator(),
+    NodeTypes.CALL: CallGenerator(),
+    NodeTypes.FUNC: FuncGenerator(),
+    NodeTypes.ADDR: AddressGenerator(),
+    NodeTypes.DEREF: DereferenceGenerator(),
+}
+_OPERATORS = (NodeTypes.ADD, NodeTypes.SUB, NodeTypes.MUL, NodeTypes.DIV, NodeTypes.SHL,
+              NodeTypes.EQ, NodeTypes.NE, NodeTypes.GT, NodeTypes.GE, NodeTypes.LT, NodeTypes.LE)
+GENERATORS.update(dict.fromkeys(_OPERATORS, OperatorGenerator()))
+
+
+# generate_node で，ジェネレータが子ノードを全て yield し終えたことを表す
+_DONE = object()
+
+
+def generate_node(node, output):
+    '''
+    node を根とする部分木のアセンブリを output に出力する
+    子を持つノードの generate はジェネレータで，子ノードを yield すると先にその子を生成してから再開する
+    入れ子が深くても再帰しないように，生成途中のジェネレータをスタックに積む
+    '''
+    if output.counts is not None:
+        _generate_node_counting(node, output)
+        return
+    generators = GENERATORS
+    stack = []
+    child = node
+    while True:
+        if child is not _DONE:
+            steps = generators[child.type].generate(child, output)
+            if steps is not None:
+                stack.append(steps)
+        if not stack:
+            return
+        child = next(stack[-1], _DONE)
+        if child is _DONE:
+            stack.pop()
+
+
+def _generate_node_counting(node, output):
+    '''
+    generate_node と同じ順に生成しながら，生成器のクラスごとに出力した行数を output.counts に数える
+    '''
+    counts = output.counts
+    stack = []
+    child = node
+    while True:
+        if child is not _DONE:
+            generator = GENERATORS[child.type]
+            start = len(output)
+            steps = generator.generate(child, output)
+            if steps is not None:
+                stack.append((steps, generator))
+            else:
+                _count_lines(counts, generator, len(output) - start)
+        if not stack:
+            return
+        steps, generator = stack[-1]
+        start = len(output)
+        child = next(steps, _DONE)
+        _count_lines(counts, generator, len(output) - start)
+        if child is _DONE:
+            stack.pop()
+
+
+def _count_lines(counts, generator, count):
+    name = type(generator).__name__
+    counts[name] = counts.get(name, 0) + count
 
 
 class Generator:
-    def __init__(self, node_context):
+    def __init__(self, node_context, counts=None):
         self.__ncontext = node_context
+        self.__counts = counts
 
     def generate(self):
-        gen1 = self.__gen_pre()
-        gen2 = self.__gen_from_nodes(self.__ncontext)
-        return gen1 + gen2
-
-    def __gen_pre(self):
-        result = []
-        result.append('.intel_syntax noprefix')
-        result.append('.global main')
-        return result
-
-    def __gen_from_nodes(self, ncontext):
-        result = []
-        for node in ncontext.nodes:
-            output = []
-            node.generate(output)
+        result = list(PRELUDE)
+        for output in self.generate_functions():
             result += output
         return result
+
+    def generate_functions(self):
+        '''
+        関数ごとに生成したアセンブリの行を順に返す
+        '''
+        for node in self.__ncontext.nodes:
+            yield self.generate_function(node)
+
+    def generate_function(self, node):
+        output = Assembly(LabelAllocator(node.name), self.__counts)
+        generate_node(node, output)
+        return output
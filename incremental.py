@@ -0,0 +1,67 @@
+from cache import CompileCache
+from compiler import Compiler
+from generator import PRELUDE
+from tokenizer import TokenContext, Tokenizer, TokenTypes
+
+
+class IncrementalCompiler:
+    '''
+    関数単位で再コンパイルする
+    関数ごとのトークン列の指紋をキーにして，生成したアセンブリを CompileCache に保存する
+    前回から変わっていない関数は保存したアセンブリを使い，変わった関数だけを構文解析，コード生成する
+    '''
+
+    def __init__(self, cache=None, backend='stack', opt_level=0):
+        self.cache = cache or CompileCache()
+        self.compiler = Compiler(backend, opt_level)
+        self.reused = 0
+        self.recompiled = 0
+
+    @staticmethod
+    def split_functions(table):
+        '''
+        トークン表を関数ごとの [開始, 終了) の添字の範囲に分ける
+        関数は最初の "{" から対応する "}" まで．括弧が閉じていなければ残りをまとめて1つにする
+        '''
+        types = table.types
+        c_code = table.c_code
+        symbol = TokenTypes.SYMBOL.value
+        spans = []
+        start = 0
+        depth = 0
+        for i, t_type in enumerate(types):
+            if t_type != symbol:
+                continue
+            text = c_code[table.starts[i]]
+            if text == '{':
+                depth += 1
+            elif text == '}':
+                depth -= 1
+                if depth == 0:
+                    spans.append((start, i + 1))
+                    start = i + 1
+        if start < len(types):
+            spans.append((start, len(types)))
+        return spans
+
+    @staticmethod
+    def fingerprint(table, start, end):
+        c_code = table.c_code
+        return ' '.join(c_code[table.starts[i]:table.ends[i]] for i in range(start, end))
+
+    def compile(self, c_code):
+        table = Tokenizer(c_code).tokenize_table()
+        compiler = self.compiler
+        result = list(PRELUDE)
+        for start, end in IncrementalCompiler.split_functions(table):
+            key = self.cache.key(IncrementalCompiler.fingerprint(table, start, end), 'function', compiler.backend, compiler.opt_level)
+            text = self.cache.get(key)
+            if text is None:
+                tcontext = TokenContext((table[i] for i in range(start, end)), c_code)
+                text = ''.join(f'{line}\n' for assembly in compiler.compile_functions(tcontext) for line in assembly)
+                self.cache.put(key, text)
+                self.recompiled += 1
+            else:
+                self.reused += 1
+            result += text.splitlines()
+        return result
@@ -0,0 +1,283 @@
+from enum import Enum, auto
+
+
+class Op(Enum):
+    CONST = auto()
+    ARG = auto()
+    LOAD = auto()
+    STORE = auto()
+    ADDR = auto()
+    LOADP = auto()
+    STOREP = auto()
+    ADD = auto()
+    SUB = auto()
+    MUL = auto()
+    DIV = auto()
+    SHL = auto()
+    EQ = auto()
+    NE = auto()
+    LT = auto()
+    LE = auto()
+    GT = auto()
+    GE = auto()
+    CALL = auto()
+    JMP = auto()
+    BR = auto()
+    RET = auto()
+
+
+# 2つの仮想レジスタから値を求める命令．名前は NodeTypes と同じ
+BINARY = {Op.ADD, Op.SUB, Op.MUL, Op.DIV, Op.SHL, Op.EQ, Op.NE, Op.LT, Op.LE, Op.GT, Op.GE}
+COMPARISON = {Op.EQ, Op.NE, Op.LT, Op.LE, Op.GT, Op.GE}
+COMMUTATIVE = {Op.ADD, Op.MUL, Op.EQ, Op.NE}
+TERMINATORS = {Op.JMP, Op.BR, Op.RET}
+# 結果を使わなければ取り除いてよい命令．0除算で止まる DIV は含めない
+PURE = {Op.CONST, Op.ARG, Op.LOAD, Op.ADDR, Op.LOADP} | (BINARY - {Op.DIV})
+
+INT32_MIN = -(1 << 31)
+INT32_MAX = (1 << 31) - 1
+
+_FOLDING = {
+    Op.ADD: lambda x, y: x + y,
+    Op.SUB: lambda x, y: x - y,
+    Op.MUL: lambda x, y: x * y,
+    Op.DIV: lambda x, y: abs(x) // abs(y) * (1 if (x < 0) == (y < 0) else -1),
+    Op.SHL: lambda x, y: x << y,
+    Op.EQ: lambda x, y: int(x == y),
+    Op.NE: lambda x, y: int(x != y),
+    Op.LT: lambda x, y: int(x < y),
+    Op.LE: lambda x, y: int(x <= y),
+    Op.GT: lambda x, y: int(x > y),
+    Op.GE: lambda x, y: int(x >= y),
+}
+
+
+class Instruction:
+    '''
+    三番地形式の命令
+    operands は読む仮想レジスタ (番号) のタプル，attrs は即値・変数の order・関数名・飛び先のブロックなど
+    dst は結果を入れる仮想レジスタで，結果のない命令では None
+    '''
+    __slots__ = ('op', 'dst', 'operands', 'attrs')
+
+    def __init__(self, op, dst, operands=(), attrs=()):
+        self.op = op
+        self.dst = dst
+        self.operands = operands
+        self.attrs = attrs
+
+    def __str__(self):
+        operands = [f'v{x}' for x in self.operands]
+        if self.op == Op.CONST or self.op == Op.ARG:
+            text = f'{self.op.name.lower()} {self.attrs[0]}'
+        elif self.op in (Op.LOAD, Op.STORE, Op.ADDR):
+            text = ', '.join([f'{self.op.name.lower()} ${self.attrs[0]}'] + operands)
+        elif self.op == Op.CALL:
+            text = f'call {self.attrs[0]}({", ".join(operands)})'
+        else:
+            targets = [x.name for x in self.attrs if isinstance(x, Block)]
+            text = f'{self.op.name.lower()} {", ".join(operands + targets)}'.rstrip()
+        return text if self.dst is None else f'v{self.dst} = {text}'
+
+
+class Block:
+    '''
+    基本ブロック．最後の命令は必ず JMP / BR / RET で，途中から出ていく命令はない
+    '''
+
+    def __init__(self):
+        self.name = None
+        self.instructions = []
+
+    @property
+    def terminated(self):
+        return bool(self.instructions) and self.instructions[-1].op in TERMINATORS
+
+    @property
+    def successors(self):
+        if not self.terminated:
+            return []
+        return [x for x in self.instructions[-1].attrs if isinstance(x, Block)]
+
+
+class IrFunction:
+    '''
+    1つの関数の中間表現
+    仮想レジスタは 0 からの連番で，それぞれ1つの命令でだけ定義し，定義したブロックの中でだけ使う
+    ローカル変数は仮想レジスタにせず，LOAD / STORE でスタックフレームのスロット ($order) を読み書きする
+    '''
+
+    def __init__(self, name, frame, arg_count):
+        self.name = name
+        self.frame = frame
+        self.arg_count = arg_count
+        self.blocks = []
+        self.vreg_count = 0
+
+    def new_vreg(self):
+        self.vreg_count += 1
+        return self.vreg_count - 1
+
+    def append_block(self, block):
+        block.name = f'b{len(self.blocks)}'
+        self.blocks.append(block)
+
+    def instruction_count(self):
+        return sum(len(x.instructions) for x in self.blocks)
+
+    def dump(self):
+        '''
+        デバッグ用のテキスト表現の行
+        '''
+        lines = [f'function {self.name}({self.arg_count}) frame {self.frame.size}']
+        for block in self.blocks:
+            lines.append(f'{block.name}:')
+            lines += [f'  {x}' for x in block.instructions]
+        return lines
+
+
+def optimize(function):
+    '''
+    値番号付け，到達できないブロックと使わない命令の除去を行い，取り除いた命令数を返す
+    '''
+    before = function.instruction_count()
+    number_values(function)
+    remove_unreachable(function)
+    eliminate_dead_code(function)
+    return before - function.instruction_count()
+
+
+def remove_unreachable(function):
+    '''
+    入口のブロックからたどれないブロックを取り除く
+    '''
+    reached = {id(function.blocks[0])}
+    stack = [function.blocks[0]]
+    while stack:
+        for successor in stack.pop().successors:
+            if id(successor) not in reached:
+                reached.add(id(successor))
+                stack.append(successor)
+    function.blocks = [x for x in function.blocks if id(x) in reached]
+
+
+def live_ranges(function):
+    '''
+    命令をブロックの並び順に 0 から数えた位置で，仮想レジスタごとの (定義した位置, 最後に使う位置) のリストを返す
+    仮想レジスタはブロックをまたいで使わないので，1回の走査で生存区間が決まる
+    '''
+    start = [None] * function.vreg_count
+    end = [None] * function.vreg_count
+    position = 0
+    for block in function.blocks:
+        for instruction in block.instructions:
+            for operand in instruction.operands:
+                end[operand] = position
+            if instruction.dst is not None:
+                start[instruction.dst] = position
+                end[instruction.dst] = position
+            position += 1
+    return start, end
+
+
+def fold(op, x, y):
+    '''
+    定数どうしの演算を畳み込んだ値．32ビットに収まらない場合と0除算は None
+    '''
+    if op == Op.DIV and y == 0 or op == Op.SHL and not 0 <= y < 64:
+        return None
+    value = _FOLDING[op](x, y)
+    return value if INT32_MIN <= value <= INT32_MAX else None
+
+
+def number_values(function):
+    '''
+    基本ブロックごとの値番号付け
+    同じ値を求める命令を取り除き，その結果を使う命令は先に求めた仮想レジスタを使うように書き換える
+    定数どうしの演算と条件が定数の BR は畳み込み，STORE した値はその後の LOAD にそのまま使う
+    変数のアドレスを取る関数では，アドレスの演算で隣の変数も指せるので (&y + 8 など)，
+    どの変数も LOADP / STOREP / CALL から読み書きされうるとみなし，それらの後に読み直す
+    '''
+    rename = list(range(function.vreg_count))
+    constants = [None] * function.vreg_count
+    escaped = any(x.op == Op.ADDR for block in function.blocks for x in block.instructions)
+    for block in function.blocks:
+        table = {}
+        # メモリを書き換えうる命令を実行するたびに増やし，それより前に読んだ値を使わないようにする
+        epoch = 0
+        instructions = []
+        for instruction in block.instructions:
+            instruction.operands = tuple(rename[x] for x in instruction.operands)
+            op = instruction.op
+            if op in BINARY:
+                x, y = (constants[v] for v in instruction.operands)
+                value = None if x is None or y is None else fold(op, x, y)
+                if value is not None:
+                    op = instruction.op = Op.CONST
+                    instruction.operands = ()
+                    instruction.attrs = (value,)
+            elif op == Op.BR and constants[instruction.operands[0]] is not None:
+                target = instruction.attrs[0 if constants[instruction.operands[0]] else 1]
+                op = instruction.op = Op.JMP
+                instruction.operands = ()
+                instruction.attrs = (target,)
+
+            if op == Op.STOREP or op == Op.CALL:
+                epoch += 1
+            elif op == Op.STORE:
+                if escaped:
+                    epoch += 1
+                table[(Op.LOAD, instruction.attrs[0], epoch if escaped else 0)] = instruction.operands[0]
+
+            key = _value_key(instruction, escaped, epoch)
+            if key is not None:
+                if key in table:
+                    rename[instruction.dst] = table[key]
+                    continue
+                table[key] = instruction.dst
+            if op == Op.CONST:
+                constants[instruction.dst] = instruction.attrs[0]
+            instructions.append(instruction)
+        block.instructions = instructions
+
+
+def _value_key(instruction, escaped, epoch):
+    '''
+    同じ値を求める命令で等しくなるキー．値番号付けの対象でなければ None
+    escaped (関数が変数のアドレスを取る) でなければ，変数は LOADP / STOREP / CALL から読み書きされない
+    '''
+    op = instruction.op
+    if op == Op.CONST or op == Op.ADDR:
+        return op, instruction.attrs[0]
+    if op == Op.LOAD:
+        return op, instruction.attrs[0], epoch if escaped else 0
+    if op == Op.LOADP:
+        return op, instruction.operands[0], epoch
+    if op in BINARY:
+        x, y = instruction.operands
+        if op in COMMUTATIVE and y < x:
+            x, y = y, x
+        return op, x, y
+    return None
+
+
+def eliminate_dead_code(function):
+    '''
+    結果を使わない PURE な命令を取り除く
+    ブロックを後ろから走査し，取り除いた命令が読む仮想レジスタの使用回数を減らすので，連鎖して使われなくなる命令も1回で取り除ける
+    '''
+    uses = [0] * function.vreg_count
+    for block in function.blocks:
+        for instruction in block.instructions:
+            for operand in instruction.operands:
+                uses[operand] += 1
+    for block in function.blocks:
+        instructions = []
+        for instruction in reversed(block.instructions):
+            if instruction.op in PURE and uses[instruction.dst] == 0:
+                for operand in instruction.operands:
+                    uses[operand] -= 1
+                continue
+            instructions.append(instruction)
+        instructions.reverse()
+        block.instructions = instructions
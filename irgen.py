@@ -0,0 +1,337 @@
+import heapq
+
+from generator import PRELUDE, LabelAllocator
+from ir import COMPARISON, INT32_MAX, INT32_MIN, Op, live_ranges, optimize
+from lowering import IrLowering
+from node import FrameLayout
+
+
+class IrGenerator:
+    '''
+    構文木を中間表現に変換して最適化し，そこから x86-64 のアセンブリを出力するバックエンド
+    中間表現の最適化は opt_level が1以上のときだけ行う
+    仮想レジスタは生存区間の始まる順に callee-saved レジスタへ割り付け (線形走査)，足りなければスタックに置く
+    定数はレジスタに置かず，使う命令の即値にする
+    '''
+    REGS = ['rbx', 'r12', 'r13', 'r14', 'r15']
+    REG_ARGS = IrLowering.REG_ARGS
+
+    __arithmetic = {
+        Op.ADD: 'add',
+        Op.SUB: 'sub',
+        Op.MUL: 'imul',
+    }
+    __comparison = {
+        Op.EQ: 'e',
+        Op.NE: 'ne',
+        Op.LT: 'l',
+        Op.LE: 'le',
+        Op.GT: 'g',
+        Op.GE: 'ge',
+    }
+    __negation = {'e': 'ne', 'ne': 'e', 'l': 'ge', 'le': 'g', 'g': 'le', 'ge': 'l'}
+
+    def __init__(self, node_context, counts=None, opt_level=0):
+        self.__ncontext = node_context
+        self.__counts = counts
+        self.__opt_level = opt_level
+        self.__lowering = IrLowering(node_context)
+        self.__map = {
+            Op.ARG: self.__gen_arg,
+            Op.LOAD: self.__gen_load,
+            Op.STORE: self.__gen_store,
+            Op.ADDR: self.__gen_address,
+            Op.LOADP: self.__gen_load_pointer,
+            Op.STOREP: self.__gen_store_pointer,
+            Op.DIV: self.__gen_div,
+            Op.SHL: self.__gen_shift,
+            Op.CALL: self.__gen_call,
+            Op.JMP: self.__gen_jump,
+            Op.BR: self.__gen_branch,
+            Op.RET: self.__gen_return,
+        }
+        for op in IrGenerator.__arithmetic:
+            self.__map[op] = self.__gen_arithmetic
+        for op in COMPARISON:
+            self.__map[op] = self.__gen_comparison
+
+    def generate(self):
+        result = list(PRELUDE)
+        for output in self.generate_functions():
+            result += output
+        return result
+
+    def generate_functions(self):
+        '''
+        関数ごとに生成したアセンブリの行を順に返す
+        '''
+        for node in self.__ncontext.nodes:
+            yield self.generate_function(node)
+
+    def lower_function(self, node):
+        '''
+        node を中間表現にした IrFunction を返す．opt_level が1以上なら最適化する
+        '''
+        function = self.__lowering.lower_function(node)
+        if self.__opt_level >= 1:
+            optimize(function)
+        return function
+
+    def generate_function(self, node):
+        function = self.lower_function(node)
+        labels = LabelAllocator(function.name)
+        self.__labels = {id(x): f'.Lblock{labels.new_label()}' for x in function.blocks}
+        self.__return_label = f'.Lreturn{labels.new_label()}'
+        self.__constants = {}
+        for block in function.blocks:
+            for instruction in block.instructions:
+                if instruction.op == Op.CONST:
+                    self.__constants[instruction.dst] = instruction.attrs[0]
+        self.__fused = self.__find_fused(function)
+        locations, saved, spills = self.__allocate(function)
+
+        slot_count = function.frame.slot_count
+        frame = FrameLayout(slot_count + len(saved) + spills)
+        self.__locations = [x if x is None or isinstance(x, str) else f'[rbp-{frame.offset(slot_count + len(saved) + x + 1)}]'
+                            for x in locations]
+        self.__frame = frame
+
+        self.__output = [f'{function.name}:']
+        self.__emit('push rbp')
+        self.__emit('mov rbp, rsp')
+        self.__emit(f'sub rsp, {frame.size}')
+        for i, reg in enumerate(saved):
+            self.__emit(f'mov [rbp-{frame.offset(slot_count + i + 1)}], {reg}')
+
+        blocks = function.blocks
+        for i, block in enumerate(blocks):
+            self.__output.append(f'{self.__labels[id(block)]}:')
+            self.__next = blocks[i + 1] if i + 1 < len(blocks) else None
+            for instruction in block.instructions:
+                if instruction.op != Op.CONST:
+                    self.__map[instruction.op](instruction)
+
+        self.__output.append(f'{self.__return_label}:')
+        for i, reg in enumerate(saved):
+            self.__emit(f'mov {reg}, [rbp-{frame.offset(slot_count + i + 1)}]')
+        self.__emit('mov rsp, rbp')
+        self.__emit('pop rbp')
+        self.__emit('ret')
+        if self.__counts is not None:
+            # 生成器はこのクラス1つなので関数全体の行数を数える
+            name = type(self).__name__
+            self.__counts[name] = self.__counts.get(name, 0) + len(self.__output)
+        return self.__output
+
+    @staticmethod
+    def __find_fused(function):
+        '''
+        結果を直後の BR だけが使う比較命令の，結果の仮想レジスタから比較の種類への辞書
+        これらは setcc を使わずに条件分岐にする
+        '''
+        uses = [0] * function.vreg_count
+        for block in function.blocks:
+            for instruction in block.instructions:
+                for operand in instruction.operands:
+                    uses[operand] += 1
+        fused = {}
+        for block in function.blocks:
+            for instruction, following in zip(block.instructions, block.instructions[1:]):
+                if instruction.op in COMPARISON and following.op == Op.BR \
+                        and following.operands[0] == instruction.dst and uses[instruction.dst] == 1:
+                    fused[instruction.dst] = instruction.op
+        return fused
+
+    def __allocate(self, function):
+        '''
+        線形走査のレジスタ割り付け
+        (仮想レジスタごとの場所, 使った callee-saved レジスタ, 退避用のスロット数) を返す
+        場所はレジスタ名，退避用のスロットの番号，場所が要らなければ None
+        '''
+        start, end = live_ranges(function)
+        locations = [None] * function.vreg_count
+        order = sorted((start[v], v) for v in range(function.vreg_count)
+                       if start[v] is not None and end[v] > start[v]
+                       and v not in self.__constants and v not in self.__fused)
+        free = list(IrGenerator.REGS)
+        used = set()
+        active = []
+        spills = 0
+        for position, v in order:
+            while active and active[0][0] < position:
+                _, _, expired = heapq.heappop(active)
+                free.append(locations[expired])
+            if free:
+                reg = min(free, key=IrGenerator.REGS.index)
+                free.remove(reg)
+            else:
+                # 最も後まで使う値をスタックに追い出す
+                furthest = max(active)
+                if furthest[0] <= end[v]:
+                    locations[v] = spills
+                    spills += 1
+                    continue
+                active.remove(furthest)
+                heapq.heapify(active)
+                reg = locations[furthest[2]]
+                locations[furthest[2]] = spills
+                spills += 1
+            locations[v] = reg
+            used.add(reg)
+            heapq.heappush(active, (end[v], position, v))
+        saved = [x for x in IrGenerator.REGS if x in used]
+        return locations, saved, spills
+
+    def __emit(self, line):
+        self.__output.append(f'  {line}')
+
+    def __operand(self, v):
+        '''
+        v の値を表すオペランド (即値，レジスタ，メモリ)
+        '''
+        if v in self.__constants:
+            return str(self.__constants[v])
+        return self.__locations[v]
+
+    def __is_imm32(self, v):
+        return v in self.__constants and INT32_MIN <= self.__constants[v] <= INT32_MAX
+
+    def __in_reg(self, v, scratch):
+        '''
+        v の値を持つレジスタ．レジスタになければ scratch に読み込む
+        '''
+        operand = self.__operand(v)
+        if operand in IrGenerator.REGS:
+            return operand
+        self.__emit(f'mov {scratch}, {operand}')
+        return scratch
+
+    def __source(self, v, scratch):
+        '''
+        add や cmp の2つ目に置けるオペランド (32ビットの即値かレジスタ)
+        '''
+        if self.__is_imm32(v):
+            return str(self.__constants[v])
+        return self.__in_reg(v, scratch)
+
+    def __target(self, instruction):
+        '''
+        結果を求めるレジスタ．結果の場所がレジスタでなければ rax
+        '''
+        location = self.__locations[instruction.dst]
+        return location if location in IrGenerator.REGS else 'rax'
+
+    def __store_result(self, instruction, reg):
+        location = self.__locations[instruction.dst]
+        if location is not None and location != reg:
+            self.__emit(f'mov {location}, {reg}')
+
+    def __slot(self, order):
+        return f'[rbp-{self.__frame.offset(order)}]'
+
+    def __label(self, block):
+        return self.__labels[id(block)]
+
+    def __gen_arg(self, instruction):
+        self.__store_result(instruction, IrGenerator.REG_ARGS[instruction.attrs[0]])
+
+    def __gen_load(self, instruction):
+        reg = self.__target(instruction)
+        self.__emit(f'mov {reg}, {self.__slot(instruction.attrs[0])}')
+        self.__store_result(instruction, reg)
+
+    def __gen_store(self, instruction):
+        value = instruction.operands[0]
+        if self.__is_imm32(value):
+            self.__emit(f'mov QWORD PTR {self.__slot(instruction.attrs[0])}, {self.__constants[value]}')
+            return
+        self.__emit(f'mov {self.__slot(instruction.attrs[0])}, {self.__in_reg(value, "rax")}')
+
+    def __gen_address(self, instruction):
+        reg = self.__target(instruction)
+        self.__emit(f'lea {reg}, {self.__slot(instruction.attrs[0])}')
+        self.__store_result(instruction, reg)
+
+    def __gen_load_pointer(self, instruction):
+        address = self.__in_reg(instruction.operands[0], 'rax')
+        reg = self.__target(instruction)
+        self.__emit(f'mov {reg}, [{address}]')
+        self.__store_result(instruction, reg)
+
+    def __gen_store_pointer(self, instruction):
+        address, value = instruction.operands
+        address = self.__in_reg(address, 'rax')
+        if self.__is_imm32(value):
+            self.__emit(f'mov QWORD PTR [{address}], {self.__constants[value]}')
+            return
+        self.__emit(f'mov [{address}], {self.__in_reg(value, "rdi")}')
+
+    def __gen_arithmetic(self, instruction):
+        left, right = instruction.operands
+        reg = self.__target(instruction)
+        # 割り付けで reg は right のレジスタと重ならない
+        self.__emit(f'mov {reg}, {self.__operand(left)}')
+        self.__emit(f'{IrGenerator.__arithmetic[instruction.op]} {reg}, {self.__source(right, "rdi")}')
+        self.__store_result(instruction, reg)
+
+    def __gen_shift(self, instruction):
+        left, right = instruction.operands
+        reg = self.__target(instruction)
+        if right in self.__constants and 0 <= self.__constants[right] < 64:
+            count = str(self.__constants[right])
+        else:
+            self.__emit(f'mov rcx, {self.__operand(right)}')
+            count = 'cl'
+        self.__emit(f'mov {reg}, {self.__operand(left)}')
+        self.__emit(f'shl {reg}, {count}')
+        self.__store_result(instruction, reg)
+
+    def __gen_div(self, instruction):
+        left, right = instruction.operands
+        divisor = self.__in_reg(right, 'rdi')
+        self.__emit(f'mov rax, {self.__operand(left)}')
+        self.__emit('cqo')
+        self.__emit(f'idiv {divisor}')
+        self.__store_result(instruction, 'rax')
+
+    def __gen_comparison(self, instruction):
+        left, right = instruction.operands
+        self.__emit(f'cmp {self.__in_reg(left, "rax")}, {self.__source(right, "rdi")}')
+        if instruction.dst in self.__fused:
+            return
+        reg = self.__target(instruction)
+        self.__emit(f'set{IrGenerator.__comparison[instruction.op]} al')
+        self.__emit(f'movzx {reg}, al')
+        self.__store_result(instruction, reg)
+
+    def __gen_call(self, instruction):
+        for v, reg in zip(instruction.operands, IrGenerator.REG_ARGS):
+            self.__emit(f'mov {reg}, {self.__operand(v)}')
+        self.__emit(f'call {instruction.attrs[0]}')
+        self.__store_result(instruction, 'rax')
+
+    def __gen_jump(self, instruction):
+        target = instruction.attrs[0]
+        if target is not self.__next:
+            self.__emit(f'jmp {self.__label(target)}')
+
+    def __gen_branch(self, instruction):
+        cond = instruction.operands[0]
+        then_block, else_block = instruction.attrs
+        if cond in self.__fused:
+            condition = IrGenerator.__comparison[self.__fused[cond]]
+        else:
+            self.__emit(f'cmp {self.__in_reg(cond, "rax")}, 0')
+            condition = 'ne'
+        if then_block is self.__next:
+            self.__emit(f'j{IrGenerator.__negation[condition]} {self.__label(else_block)}')
+            return
+        self.__emit(f'j{condition} {self.__label(then_block)}')
+        if else_block is not self.__next:
+            self.__emit(f'jmp {self.__label(else_block)}')
+
+    def __gen_return(self, instruction):
+        if instruction.operands:
+            self.__emit(f'mov rax, {self.__operand(instruction.operands[0])}')
+        if self.__next is not None:
+            self.__emit(f'jmp {self.__return_label}')
@@ -0,0 +1,77 @@
+import ctypes
+import mmap
+
+from utility import error
+
+
+class JitProgram:
+    '''
+    Assembler が作った機械語を実行可能なメモリに配置し，プロセス内で関数を呼び出す
+    定義されていない関数の call は，ライブラリから引いたアドレスへ飛ぶスタブに向ける
+    '''
+    # jmp [rip+0] の後ろに飛び先の絶対アドレスを置く
+    STUB = bytes([0xff, 0x25, 0, 0, 0, 0])
+    STUB_SIZE = len(STUB) + 8
+
+    __libc = ctypes.CDLL(None, use_errno=True)
+    __libc.mmap.restype = ctypes.c_void_p
+    __libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    __libc.mprotect.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    __libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    __libc.fflush.argtypes = [ctypes.c_void_p]
+
+    def __init__(self, assembler, libraries=()):
+        code, relocations = assembler.link()
+        self.__functions = assembler.functions
+        self.__libraries = [ctypes.CDLL(x) for x in libraries] + [JitProgram.__libc]
+
+        stubs = {}
+        for _, name in relocations:
+            if name not in stubs:
+                stubs[name] = len(code) + len(stubs) * JitProgram.STUB_SIZE
+        image = bytearray(code)
+        for offset, name in relocations:
+            image[offset:offset + 4] = (stubs[name] - (offset + 4)).to_bytes(4, 'little', signed=True)
+        for name in stubs:
+            image += JitProgram.STUB + self.__lookup(name).to_bytes(8, 'little')
+
+        self.__size = max(len(image), 1)
+        self.__address = JitProgram.__libc.mmap(None, self.__size, mmap.PROT_READ | mmap.PROT_WRITE,
+                                                mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS, -1, 0)
+        if self.__address in (None, ctypes.c_void_p(-1).value):
+            error(f'実行用のメモリを確保できません errno: {ctypes.get_errno()}')
+        ctypes.memmove(self.__address, bytes(image), len(image))
+        # 書き込みが終わったら書き込み不可・実行可能に切り替える
+        if JitProgram.__libc.mprotect(self.__address, self.__size, mmap.PROT_READ | mmap.PROT_EXEC) != 0:
+            error(f'実行用のメモリを実行可能にできません errno: {ctypes.get_errno()}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.__address is not None:
+            JitProgram.__libc.munmap(self.__address, self.__size)
+            self.__address = None
+
+    def call(self, name, *args):
+        '''
+        int を返す関数 name を int の引数で呼び出す
+        '''
+        if name not in self.__functions:
+            error(f'関数が定義されていません {name}')
+        prototype = ctypes.CFUNCTYPE(ctypes.c_int, *[ctypes.c_long] * len(args))
+        result = prototype(self.__address + self.__functions[name])(*args)
+        # ライブラリの関数が printf したものを Python の出力より前に出す
+        JitProgram.__libc.fflush(None)
+        return result
+
+    def __lookup(self, name):
+        for library in self.__libraries:
+            try:
+                return ctypes.cast(getattr(library, name), ctypes.c_void_p).value
+            except AttributeError:
+                pass
+        error(f'関数が見つかりません {name}')
@@ -0,0 +1,196 @@
+from ir import Block, Instruction, IrFunction, Op
+from node import NodeTypes
+from utility import error
+
+
+class IrLowering:
+    '''
+    構文木を関数ごとの中間表現 (IrFunction) に変換する
+    式は仮想レジスタに値を求める命令の列に，制御構文は基本ブロックと JMP / BR にする
+    '''
+    REG_ARGS = ['rdi', 'rsi', 'rdx', 'rcx', 'r8', 'r9']
+
+    def __init__(self, node_context):
+        self.__ncontext = node_context
+        # 子を持たないノード．値を求めた仮想レジスタを返す
+        self.__leaves = {
+            NodeTypes.NUM: self.__lower_num,
+            NodeTypes.IDENT: self.__lower_ident,
+            NodeTypes.ADDR: self.__lower_address,
+        }
+        self.__map = {
+            NodeTypes.ASSIGN: self.__lower_assign,
+            NodeTypes.DEREF: self.__lower_dereference,
+            NodeTypes.CALL: self.__lower_call,
+            NodeTypes.RETURN: self.__lower_return,
+            NodeTypes.IF: self.__lower_if,
+            NodeTypes.IF_ELSE: self.__lower_if_else,
+            NodeTypes.WHILE: self.__lower_while,
+            NodeTypes.FOR: self.__lower_for,
+            NodeTypes.BLOCK: self.__lower_block,
+        }
+        for n_type in (NodeTypes.ADD, NodeTypes.SUB, NodeTypes.MUL, NodeTypes.DIV, NodeTypes.SHL,
+                       NodeTypes.EQ, NodeTypes.NE, NodeTypes.LT, NodeTypes.LE, NodeTypes.GT, NodeTypes.GE):
+            self.__map[n_type] = self.__lower_operator
+
+    def lower(self):
+        return [self.lower_function(node) for node in self.__ncontext.nodes]
+
+    def lower_function(self, node):
+        if len(IrLowering.REG_ARGS) < len(node.args_order_type):
+            error(f'引数が多すぎます {node.name}')
+
+        self.__function = IrFunction(node.name, node.frame, len(node.args_order_type))
+        self.__block = None
+        self.__start(Block())
+        for i, (order, _) in enumerate(node.args_order_type):
+            self.__effect(Op.STORE, (self.__value(Op.ARG, attrs=(i,)),), (order,))
+        self.__lower(node.block)
+        if not self.__block.terminated:
+            # 末尾に return がない関数は 0 を返す
+            self.__effect(Op.RET, (self.__value(Op.CONST, attrs=(0,)),))
+        return self.__function
+
+    def __value(self, op, operands=(), attrs=()):
+        dst = self.__function.new_vreg()
+        self.__block.instructions.append(Instruction(op, dst, operands, attrs))
+        return dst
+
+    def __effect(self, op, operands=(), attrs=()):
+        self.__block.instructions.append(Instruction(op, None, operands, attrs))
+
+    def __jump(self, block):
+        if not self.__block.terminated:
+            self.__effect(Op.JMP, attrs=(block,))
+
+    def __start(self, block):
+        '''
+        block を次に命令を出力するブロックにする．今のブロックから流れ込むなら JMP でつなぐ
+        '''
+        if self.__block is not None:
+            self.__jump(block)
+        self.__function.append_block(block)
+        self.__block = block
+
+    def __lower(self, node):
+        '''
+        node を変換して，式なら値を求めた仮想レジスタを返す
+        子を持つノードの __lower_* は子ノードを yield して，その値の仮想レジスタを受け取るジェネレータで，
+        入れ子が深くても再帰しないように，変換途中のジェネレータをスタックに積んで進める
+        '''
+        stack = []
+        child = node
+        while True:
+            if child.type in self.__leaves:
+                result = self.__leaves[child.type](child)
+            else:
+                stack.append(self.__map[child.type](child))
+                result = None
+            while stack:
+                try:
+                    child = stack[-1].send(result)
+                    break
+                except StopIteration as e:
+                    stack.pop()
+                    result = e.value
+            else:
+                return result
+
+    @staticmethod
+    def __order(node):
+        if node.type != NodeTypes.IDENT:
+            error(f'代入の左辺値が変数ではありません {node.type}')
+        return node.order
+
+    def __lower_num(self, node):
+        return self.__value(Op.CONST, attrs=(int(node.value),))
+
+    def __lower_ident(self, node):
+        return self.__value(Op.LOAD, attrs=(node.order,))
+
+    def __lower_address(self, node):
+        return self.__value(Op.ADDR, attrs=(IrLowering.__order(node.unary),))
+
+    def __lower_dereference(self, node):
+        address = yield node.unary
+        return self.__value(Op.LOADP, (address,))
+
+    def __lower_operator(self, node):
+        left = yield node.left
+        right = yield node.right
+        return self.__value(Op[node.type.name], (left, right))
+
+    def __lower_assign(self, node):
+        if node.left.type == NodeTypes.DEREF:
+            address = yield node.left.unary
+            value = yield node.right
+            self.__effect(Op.STOREP, (address, value))
+            return value
+        order = IrLowering.__order(node.left)
+        value = yield node.right
+        self.__effect(Op.STORE, (value,), (order,))
+        return value
+
+    def __lower_call(self, node):
+        if len(IrLowering.REG_ARGS) < len(node.args):
+            error(f'引数が多すぎます {node.name}')
+        args = []
+        for arg in node.args:
+            args.append((yield arg))
+        return self.__value(Op.CALL, tuple(args), (node.name,))
+
+    def __lower_return(self, node):
+        if node.expr:
+            self.__effect(Op.RET, ((yield node.expr),))
+        else:
+            self.__effect(Op.RET)
+        # return の後の文は到達できないブロックに置く
+        self.__start(Block())
+
+    def __lower_if(self, node):
+        then_block, end_block = Block(), Block()
+        cond = yield node.expr
+        self.__effect(Op.BR, (cond,), (then_block, end_block))
+        self.__start(then_block)
+        yield node.stmt
+        self.__start(end_block)
+
+    def __lower_if_else(self, node):
+        then_block, else_block, end_block = Block(), Block(), Block()
+        cond = yield node.expr
+        self.__effect(Op.BR, (cond,), (then_block, else_block))
+        self.__start(then_block)
+        yield node.stmt
+        self.__jump(end_block)
+        self.__start(else_block)
+        yield node.else_stmt
+        self.__start(end_block)
+
+    def __lower_while(self, node):
+        begin_block, body_block, end_block = Block(), Block(), Block()
+        self.__start(begin_block)
+        cond = yield node.expr
+        self.__effect(Op.BR, (cond,), (body_block, end_block))
+        self.__start(body_block)
+        yield node.stmt
+        self.__jump(begin_block)
+        self.__start(end_block)
+
+    def __lower_for(self, node):
+        begin_block, body_block, end_block = Block(), Block(), Block()
+        if node.expr1:
+            yield node.expr1
+        self.__start(begin_block)
+        if node.expr2:
+            cond = yield node.expr2
+            self.__effect(Op.BR, (cond,), (body_block, end_block))
+        self.__start(body_block)
+        yield node.stmt
+        if node.expr3:
+            yield node.expr3
+        self.__jump(begin_block)
+        self.__start(end_block)
+
+    def __lower_block(self, node):
+        for stmt in node.stmts:
+            yield stmt
@@ -1,17 +1,12 @@
 from enum import Enum, auto
 
-from generator import (AddressGenerator, AssignGenerator, BlockGenerator,
-                       CallGenerator, DereferenceGenerator, ForGenerator,
-                       FuncGenerator, IdentGenerator, IfElseGenerator,
-                       IfGenerator, NumGenerator, OperatorGenerator,
-                       ReturnGenerator, WhileGenerator)
-
 
 class NodeTypes(Enum):
     ADD = auto()
     SUB = auto()
     MUL = auto()
     DIV = auto()
+    SHL = auto()
     NUM = auto()
     EQ = auto()
     NE = auto()
@@ -34,95 +29,184 @@ class NodeTypes(Enum):
 
 
 class Node:
-    def __init__(self, n_type, generator):
-        self.__type = n_type
-        self.__generator = generator
+    '''
+    構文木のノード
+    ノードの種類ごとのサブクラスで属性を __slots__ に固定し，インスタンスごとの __dict__ を持たない
+    '''
+    __slots__ = ('type',)
 
-    def generate(self, output):
-        self.__generator.generate(self, output)
 
-    @property
-    def type(self):
-        return self.__type
+class NumNode(Node):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.type = NodeTypes.NUM
+        self.value = value
+
+
+class OperatorNode(Node):
+    __slots__ = ('left', 'right')
+
+    def __init__(self, n_type, left, right):
+        self.type = n_type
+        self.left = left
+        self.right = right
+
+
+class AssignNode(Node):
+    __slots__ = ('left', 'right')
+
+    def __init__(self, left, right):
+        self.type = NodeTypes.ASSIGN
+        self.left = left
+        self.right = right
+
+
+class IdentNode(Node):
+    __slots__ = ('order', 'typeinfo')
+
+    def __init__(self, order, typeinfo):
+        self.type = NodeTypes.IDENT
+        self.order = order
+        self.typeinfo = typeinfo
+
+
+class ReturnNode(Node):
+    __slots__ = ('expr',)
+
+    def __init__(self, expr):
+        self.type = NodeTypes.RETURN
+        self.expr = expr
+
+
+class IfNode(Node):
+    __slots__ = ('expr', 'stmt')
+
+    def __init__(self, expr, stmt):
+        self.type = NodeTypes.IF
+        self.expr = expr
+        self.stmt = stmt
+
+
+class IfElseNode(Node):
+    __slots__ = ('expr', 'stmt', 'else_stmt')
+
+    def __init__(self, expr, stmt, else_stmt):
+        self.type = NodeTypes.IF_ELSE
+        self.expr = expr
+        self.stmt = stmt
+        self.else_stmt = else_stmt
+
+
+class WhileNode(Node):
+    __slots__ = ('expr', 'stmt')
+
+    def __init__(self, expr, stmt):
+        self.type = NodeTypes.WHILE
+        self.expr = expr
+        self.stmt = stmt
+
+
+class ForNode(Node):
+    __slots__ = ('expr1', 'expr2', 'expr3', 'stmt')
+
+    def __init__(self, expr1, expr2, expr3, stmt):
+        self.type = NodeTypes.FOR
+        self.expr1 = expr1
+        self.expr2 = expr2
+        self.expr3 = expr3
+        self.stmt = stmt
+
+
+class BlockNode(Node):
+    __slots__ = ('stmts',)
+
+    def __init__(self, stmts):
+        self.type = NodeTypes.BLOCK
+        self.stmts = stmts
+
+
+class CallNode(Node):
+    __slots__ = ('name', 'args')
+
+    def __init__(self, name, args):
+        self.type = NodeTypes.CALL
+        self.name = name
+        self.args = args
+
+
+class FuncNode(Node):
+    __slots__ = ('name', 'args_order_type', 'block', 'frame', 'varsize')
+
+    def __init__(self, name, args_order_type, block):
+        self.type = NodeTypes.FUNC
+        self.name = name
+        self.args_order_type = args_order_type
+        self.block = block
+        self.frame = None
+        self.varsize = 0
+
+
+class AddressNode(Node):
+    __slots__ = ('unary',)
+
+    def __init__(self, unary):
+        self.type = NodeTypes.ADDR
+        self.unary = unary
+
+
+class DereferenceNode(Node):
+    __slots__ = ('unary',)
+
+    def __init__(self, unary):
+        self.type = NodeTypes.DEREF
+        self.unary = unary
 
 
 class NodeFactory:
     @staticmethod
     def create_num_node(value):
-        node = Node(NodeTypes.NUM, NumGenerator())
-        node.value = value
-        return node
+        return NumNode(value)
 
     @staticmethod
     def create_ope_node(n_type, left, right):
-        node = Node(n_type, OperatorGenerator())
-        node.left = left
-        node.right = right
-        return node
+        return OperatorNode(n_type, left, right)
 
     @staticmethod
     def create_assign_node(left, right):
-        node = Node(NodeTypes.ASSIGN, AssignGenerator())
-        node.left = left
-        node.right = right
-        return node
+        return AssignNode(left, right)
 
     @staticmethod
     def create_ident_node(order, typeinfo):
-        node = Node(NodeTypes.IDENT, IdentGenerator())
-        node.order = order
-        node.typeinfo = typeinfo
-        return node
+        return IdentNode(order, typeinfo)
 
     @staticmethod
     def create_return_node(expr):
-        node = Node(NodeTypes.RETURN, ReturnGenerator())
-        node.expr = expr
-        return node
+        return ReturnNode(expr)
 
     @staticmethod
     def create_if_node(expr, stmt):
-        node = Node(NodeTypes.IF, IfGenerator())
-        node.expr = expr
-        node.stmt = stmt
-        return node
+        return IfNode(expr, stmt)
 
     @staticmethod
     def create_if_else_node(expr, stmt, else_stmt):
-        node = Node(NodeTypes.IF_ELSE, IfElseGenerator())
-        node.expr = expr
-        node.stmt = stmt
-        node.else_stmt = else_stmt
-        return node
+        return IfElseNode(expr, stmt, else_stmt)
 
     @staticmethod
     def create_while_node(expr, stmt):
-        node = Node(NodeTypes.WHILE, WhileGenerator())
-        node.expr = expr
-        node.stmt = stmt
-        return node
+        return WhileNode(expr, stmt)
 
     @staticmethod
     def create_for_node(expr1, expr2, expr3, stmt):
-        node = Node(NodeTypes.FOR, ForGenerator())
-        node.expr1 = expr1
-        node.expr2 = expr2
-        node.expr3 = expr3
-        node.stmt = stmt
-        return node
+        return ForNode(expr1, expr2, expr3, stmt)
 
     @staticmethod
     def create_block_node(stmts):
-        node = Node(NodeTypes.BLOCK, BlockGenerator())
-        node.stmts = stmts
-        return node
+        return BlockNode(stmts)
 
     @staticmethod
     def create_call_node(name, args):
-        node = Node(NodeTypes.CALL, CallGenerator())
-        node.name = name
-        node.args = args
-        return node
+        return CallNode(name, args)
 
     @staticmethod
     def create_for_infinite_dummy_node():
@@ -130,35 +214,44 @@ class NodeFactory:
 
     @staticmethod
     def create_func_node(name, args_order_type, block):
-        node = Node(NodeTypes.FUNC, FuncGenerator())
-        node.name = name
-        node.args_order_type = args_order_type
-        node.block = block
-        return node
+        return FuncNode(name, args_order_type, block)
 
     @staticmethod
     def create_address_node(unary):
-        node = Node(NodeTypes.ADDR, AddressGenerator())
-        node.unary = unary
-        return node
+        return AddressNode(unary)
 
     @staticmethod
     def create_dereference_node(unary):
-        node = Node(NodeTypes.DEREF, DereferenceGenerator())
-        node.unary = unary
-        return node
+        return DereferenceNode(unary)
+
+
+class FrameLayout:
+    '''
+    関数のスタックフレーム
+    変数は1つ8バイトのスロットで，order 番目の変数は [rbp - order * 8] に置く
+    フレームの大きさは rsp が16バイト境界に揃うように切り上げる
+    '''
+    SLOT_SIZE = 8
+    ALIGNMENT = 16
+
+    def __init__(self, slot_count):
+        self.slot_count = slot_count
+
+    def offset(self, order):
+        return order * FrameLayout.SLOT_SIZE
+
+    @property
+    def size(self):
+        size = self.slot_count * FrameLayout.SLOT_SIZE
+        return -(-size // FrameLayout.ALIGNMENT) * FrameLayout.ALIGNMENT
 
 
 class NodeContext:
-    def __init__(self, nodes, varnames):
+    def __init__(self, nodes, frames):
         self.__nodes = nodes
-        self.__varnames = varnames
-        for node in self.__nodes:
-            node.varsize = self.__get_varsize(node.name)
-
-    def __get_varsize(self, funcname):
-        func_varnames = [x for x in self.__varnames if x.startswith(f'{funcname}:')]
-        return len(func_varnames) * 8
+        for node, frame in zip(self.__nodes, frames):
+            node.frame = frame
+            node.varsize = frame.size
 
     @property
     def nodes(self):
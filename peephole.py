@@ -0,0 +1,193 @@
+from abc import ABCMeta, abstractmethod
+
+
+def parse_instruction(line):
+    '''
+    '  mov rax, [rbp-8]' を ('mov', ['rax', '[rbp-8]']) に分ける
+    ラベルやディレクティブは None
+    '''
+    if not line.startswith('  '):
+        return None
+    fields = line.split(None, 1)
+    operands = [x.strip() for x in fields[1].split(',')] if len(fields) == 2 else []
+    return fields[0], operands
+
+
+class PeepholeRule(metaclass=ABCMeta):
+    '''
+    出力の末尾 size 行を書き換える規則
+    '''
+    size = 0
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    @abstractmethod
+    def rewrite(self, lines):
+        '''
+        書き換えた行のリストを返す．当てはまらなければ None
+        '''
+        pass
+
+
+class PushPopSameRule(PeepholeRule):
+    '''
+    push X / pop X を取り除く
+    '''
+    size = 2
+
+    def rewrite(self, lines):
+        first, second = map(parse_instruction, lines)
+        if first and second and first[0] == 'push' and second[0] == 'pop' and first[1] == second[1]:
+            return []
+        return None
+
+
+class PushPopMoveRule(PeepholeRule):
+    '''
+    push A / pop B を mov B, A にする
+    '''
+    size = 2
+
+    def rewrite(self, lines):
+        first, second = map(parse_instruction, lines)
+        if first and second and first[0] == 'push' and second[0] == 'pop':
+            return [f'  mov {second[1][0]}, {first[1][0]}']
+        return None
+
+
+class PushMovePopRule(PeepholeRule):
+    '''
+    push A / mov B, X / pop A を mov B, X にする (B が A でもスタックでもない時)
+    '''
+    size = 3
+
+    def rewrite(self, lines):
+        first, second, third = map(parse_instruction, lines)
+        if not (first and second and third and first[0] == 'push' and second[0] == 'mov' and third[0] == 'pop'):
+            return None
+        reg = first[1][0]
+        dst, src = second[1]
+        if third[1][0] == reg and reg != dst and 'rsp' not in dst and 'rsp' not in src:
+            return [lines[1]]
+        return None
+
+
+class DeadMoveRule(PeepholeRule):
+    '''
+    mov R, X の直後に R を読まずに mov R, Y で上書きするなら，前の mov を取り除く
+    '''
+    size = 2
+    __regs = ('rax', 'rdi', 'rsi', 'rdx', 'rcx', 'r8', 'r9')
+
+    def rewrite(self, lines):
+        first, second = map(parse_instruction, lines)
+        if first and second and first[0] == 'mov' and second[0] == 'mov' and first[1][0] in DeadMoveRule.__regs \
+                and second[1][0] == first[1][0] and first[1][0] not in second[1][1]:
+            return [lines[1]]
+        return None
+
+
+class LoadLocalRule(PeepholeRule):
+    '''
+    mov rax, rbp / sub rax, N / mov rax, [rax] を mov rax, [rbp-N] にする
+    '''
+    size = 3
+
+    def rewrite(self, lines):
+        first, second, third = map(parse_instruction, lines)
+        if first == ('mov', ['rax', 'rbp']) and second and second[0] == 'sub' and second[1][0] == 'rax' \
+                and third == ('mov', ['rax', '[rax]']):
+            return [f'  mov rax, [rbp-{second[1][1]}]']
+        return None
+
+
+class DelayAddressRule(PeepholeRule):
+    '''
+    mov rax, rbp / sub rax, N / mov R, X (R, X が rax を使わない) を
+    mov R, X / mov rax, rbp / sub rax, N にして StoreLocalRule を当てはめられるようにする
+    '''
+    size = 3
+
+    def rewrite(self, lines):
+        first, second, third = map(parse_instruction, lines)
+        if first == ('mov', ['rax', 'rbp']) and second and second[0] == 'sub' and second[1][0] == 'rax' \
+                and third and third[0] == 'mov' and 'rax' not in third[1][0] and 'rax' not in third[1][1] \
+                and not third[1][0].startswith('['):
+            return [lines[2], lines[0], lines[1]]
+        return None
+
+
+class StoreLocalRule(PeepholeRule):
+    '''
+    mov rax, rbp / sub rax, N / mov [rax], R の直後で rax を読まずに上書きするなら
+    mov [rbp-N], R にする
+    '''
+    size = 4
+
+    def rewrite(self, lines):
+        first, second, third, fourth = map(parse_instruction, lines)
+        if not (first == ('mov', ['rax', 'rbp']) and second and second[0] == 'sub' and second[1][0] == 'rax'
+                and third and third[0] == 'mov' and third[1][0] == '[rax]' and third[1][1] != 'rax' and fourth):
+            return None
+        op, operands = fourth
+        if not (op in ('mov', 'lea') and operands[0] == 'rax' and 'rax' not in operands[1]) and fourth != ('pop', ['rax']):
+            return None
+        return [f'  mov [rbp-{second[1][1]}], {third[1][1]}', lines[3]]
+
+
+class JumpToNextRule(PeepholeRule):
+    '''
+    直後のラベルへのジャンプを取り除く
+    '''
+    size = 2
+
+    def rewrite(self, lines):
+        jump = parse_instruction(lines[0])
+        if jump and jump[0].startswith('j') and lines[1] == f'{jump[1][0]}:':
+            return [lines[1]]
+        return None
+
+
+class MoveSelfRule(PeepholeRule):
+    '''
+    mov X, X を取り除く
+    '''
+    size = 1
+
+    def rewrite(self, lines):
+        instruction = parse_instruction(lines[0])
+        if instruction and instruction[0] == 'mov' and instruction[1][0] == instruction[1][1]:
+            return []
+        return None
+
+
+class PeepholeOptimizer:
+    '''
+    生成したアセンブリの行に規則を繰り返し当てはめる
+    1行出力するたびに末尾を書き換え，書き換えられなくなったら次の行へ進む
+    '''
+    RULES = [PushPopSameRule, PushPopMoveRule, PushMovePopRule, DeadMoveRule, LoadLocalRule, DelayAddressRule, StoreLocalRule, JumpToNextRule, MoveSelfRule]
+
+    def __init__(self, rules=None):
+        self.rules = [rule() for rule in (rules or PeepholeOptimizer.RULES)]
+        self.hits = {rule.name: 0 for rule in self.rules}
+
+    def optimize(self, lines):
+        result = []
+        for line in lines:
+            result.append(line)
+            while self.__rewrite_tail(result):
+                pass
+        return result
+
+    def __rewrite_tail(self, result):
+        for rule in self.rules:
+            if rule.size <= len(result):
+                replaced = rule.rewrite(result[-rule.size:])
+                if replaced is not None:
+                    result[-rule.size:] = replaced
+                    self.hits[rule.name] += 1
+                    return True
+        return False
@@ -1,28 +1,310 @@
-from sys import argv
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from shutil import copyfileobj
+from tempfile import NamedTemporaryFile
+from time import perf_counter
 
-from generator import Generator
-from cparser import Parser
+from assembler import Assembler
+from cache import CompileCache
+from compiler import BACKENDS, Compiler, compile_unit
+from evaluator import Evaluator
+from incremental import IncrementalCompiler
+from jit import JitProgram
+from stats import CompileStats
 from tokenizer import Tokenizer
 from utility import error
 
+STREAM_BUFFER_SIZE = 1 << 16
+
+
+def parse_args():
+    parser = ArgumentParser(description='Cコンパイラ', fromfile_prefix_chars='@')
+    parser.add_argument('inputs', nargs='+',
+                        help='Cのソースファイル．- は標準入力，ファイルでなければCのコードとして扱う．@FILE で FILE に並べた引数を読む')
+    parser.add_argument('-o', dest='output', help='出力先のファイル，または末尾が / のディレクトリ')
+    parser.add_argument('--emit', choices=['asm', 'obj', 'ir'], default='asm',
+                        help='出力の形式．obj ならアセンブラを使わずに ELF のオブジェクトファイルを，ir なら中間表現のテキスト (-O1 なら最適化したもの) を出力する')
+    parser.add_argument('--run', action='store_true',
+                        help='コンパイルした main をプロセス内で実行し，その戻り値を終了コードにする')
+    parser.add_argument('--eval', action='store_true',
+                        help='機械語にせずに構文木を評価して main を実行し，その戻り値を終了コードにする')
+    parser.add_argument('--lib', action='append', default=[],
+                        help='--run と --eval で呼び出す関数を探す共有ライブラリ．複数指定できる')
+    parser.add_argument('--backend', choices=BACKENDS, default='stack', help='コード生成のバックエンド')
+    parser.add_argument('-O', type=int, choices=[0, 1], default=0, dest='opt_level', help='最適化レベル')
+    parser.add_argument('--peephole-stats', action='store_true', help='のぞき穴最適化の規則ごとの適用回数を表示する')
+    parser.add_argument('-j', type=int, default=1, dest='jobs', help='並列にコンパイルするプロセス数')
+    parser.add_argument('--timings', action='store_true', help='翻訳単位ごとのコンパイル時間を表示する')
+    parser.add_argument('--no-cache', action='store_true', help='コンパイル結果のキャッシュを使わない')
+    parser.add_argument('--cache-dir', help=f'キャッシュのディレクトリ (既定: {CompileCache.DEFAULT_DIR})')
+    parser.add_argument('--cache-stats', action='store_true', help='キャッシュのヒット数とミス数を表示する')
+    parser.add_argument('--stats', action='store_true',
+                        help='段階ごとの時間，トークン数，ノード数，生成器ごとの行数を JSON で標準エラーに出力する')
+    parser.add_argument('--stats-output', help='--stats の JSON を書き出すファイル')
+    parser.add_argument('--stats-memory', action='store_true',
+                        help='--stats で段階ごとのピークメモリも計る．時間に影響しないように tracemalloc を使ってもう1回コンパイルする')
+    parser.add_argument('--incremental', action='store_true', help='前回から変わった関数だけを再コンパイルする')
+    return parser.parse_args()
+
+
+def read_input(name):
+    '''
+    (出力ファイル名の元になる名前, Cのコード) を返す
+    '''
+    if name == '-':
+        return 'stdin', sys.stdin.read()
+    if os.path.isfile(name):
+        path = Path(name)
+        return path.stem, path.read_text()
+    return 'a', name
+
+
+def unique_names(names):
+    '''
+    同じ名前が重ならないように，2つ目以降には -2, -3, ... を付けた名前のリストを返す
+    '''
+    used = set()
+    result = []
+    for name in names:
+        unique = name
+        count = 1
+        while unique in used:
+            count += 1
+            unique = f'{name}-{count}'
+        used.add(unique)
+        result.append(unique)
+    return result
+
+
+def output_paths(args, stems):
+    '''
+    各入力の出力先を返す．None は標準出力
+    ディレクトリに出力するときは，名前が同じ入力の出力が上書きし合わないように名前を変える
+    '''
+    if args.output is None:
+        if len(stems) != 1:
+            error('複数の入力をコンパイルするときは -o で出力先のディレクトリを指定してください')
+        return [None]
+    output = Path(args.output)
+    if args.output.endswith('/') or output.is_dir():
+        output.mkdir(parents=True, exist_ok=True)
+        suffix = {'asm': '.s', 'obj': '.o', 'ir': '.ir'}[args.emit]
+        return [output / f'{stem}{suffix}' for stem in unique_names(stems)]
+    if len(stems) != 1:
+        error(f'複数の入力の出力先はディレクトリにしてください {args.output}')
+    return [output]
+
+
+def write_assembly(path, text):
+    if path is None:
+        sys.stdout.write(text)
+    else:
+        path.write_text(text)
+
+
+def write_object(path, data):
+    if path is None:
+        sys.stdout.buffer.write(data)
+    else:
+        path.write_bytes(data)
+
+
+def write_output(args, path, text):
+    if args.emit == 'obj':
+        write_object(path, Assembler().assemble(text.splitlines()).to_elf())
+    else:
+        write_assembly(path, text)
+
+
+def replace_file(temp, path):
+    '''
+    一時ファイル temp で path を置き換える
+    NamedTemporaryFile は 0600 で作るので，path に直接書いた場合と同じパーミッションにしてから置き換える
+    '''
+    try:
+        mode = path.stat().st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    os.chmod(temp, mode)
+    os.replace(temp, path)
+
+
+def stream_assembly(args, path, c_code, cache=None, key=None):
+    '''
+    アセンブリを関数ごとに出力先へ書き出す．ファイルには全てを書き終えてから置き換える
+    cache を渡すと，書き出したアセンブリを key のエントリとしてキャッシュにも写す (asm のときだけ)
+    (経過時間, のぞき穴最適化の適用回数) を返す
+    '''
+    start = perf_counter()
+    compiler = Compiler(args.backend, args.opt_level)
+    if args.emit == 'obj':
+        write_object(path, compiler.compile_object(c_code))
+    elif path is None and cache is None:
+        compiler.compile_to(c_code, sys.stdout)
+    else:
+        # 途中でエラーになっても書きかけのファイルが残らないように，一時ファイルに書いてから置き換える
+        # 標準出力とキャッシュへは一時ファイルから写す
+        directory = None if path is None else path.parent
+        with NamedTemporaryFile('w+', dir=directory, delete=False, buffering=STREAM_BUFFER_SIZE) as f:
+            try:
+                compiler.compile_to(c_code, f)
+                if cache:
+                    f.seek(0)
+                    cache.put_file(key, f)
+                if path is None:
+                    f.seek(0)
+                    copyfileobj(f, sys.stdout)
+            except BaseException:
+                f.close()
+                os.unlink(f.name)
+                raise
+        if path is None:
+            os.unlink(f.name)
+        else:
+            replace_file(f.name, path)
+    return perf_counter() - start, compiler.peephole_hits
+
+
+def dump_ir(args, c_code):
+    '''
+    中間表現のテキストを返す
+    '''
+    functions = Compiler(args.backend, args.opt_level).lower(c_code)
+    return ''.join(f'{line}\n' for function in functions for line in function.dump())
+
+
+def run(args, c_code):
+    '''
+    機械語に変換した main をプロセス内で呼び出し，その戻り値を返す
+    '''
+    compiler = Compiler(args.backend, args.opt_level)
+    with JitProgram(compiler.assemble(c_code), args.lib) as program:
+        return program.call('main')
+
+
+def evaluate(args, c_code):
+    '''
+    構文木を評価して main を実行し，その戻り値を返す
+    '''
+    compiler = Compiler(args.backend, args.opt_level)
+    ncontext = compiler.parse(Tokenizer(c_code).stream())
+    return Evaluator(ncontext, libraries=args.lib).call('main')
+
+
+def compile_with_stats(args, sources, paths):
+    '''
+    キャッシュを使わずに1つずつコンパイルし，入力ごとの計測結果を JSON で出力する
+    入力の名前はファイルならそのパス，そうでなければ出力ファイル名の元になる名前で，重なれば -2, -3, ... を付ける
+    '''
+    report = {}
+    names = unique_names([name if os.path.isfile(name) else stem for name, (stem, _) in zip(args.inputs, sources)])
+    for name, (_, c_code), path in zip(names, sources, paths):
+        stats = CompileStats()
+        compiler = Compiler(args.backend, args.opt_level)
+        text = '\n'.join(compiler.compile_with_stats(c_code, stats)) + '\n'
+        write_output(args, path, text)
+        if args.stats_memory:
+            traced = CompileStats(trace_memory=True)
+            Compiler(args.backend, args.opt_level).compile_with_stats(c_code, traced)
+            stats.merge_memory(traced)
+        report[name] = stats.to_dict()
+    if args.stats_output:
+        Path(args.stats_output).write_text(json.dumps(report, indent=2) + '\n')
+    else:
+        print(json.dumps(report, indent=2), file=sys.stderr)
+
+
+def compile_incremental(incremental, codes):
+    for c_code in codes:
+        start = perf_counter()
+        text = '\n'.join(incremental.compile(c_code)) + '\n'
+        yield text, perf_counter() - start, {}
+
+
+def compile_all(args, codes, incremental):
+    '''
+    codes を入力の順にコンパイルした結果を順に返す
+    --incremental なら関数単位で再コンパイルし，-j が2以上ならプロセスプールで並列にコンパイルする
+    '''
+    if incremental:
+        yield from compile_incremental(incremental, codes)
+        return
+    backends = [args.backend] * len(codes)
+    opt_levels = [args.opt_level] * len(codes)
+    if args.jobs <= 1 or len(codes) <= 1:
+        yield from map(compile_unit, backends, opt_levels, codes)
+        return
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        yield from executor.map(compile_unit, backends, opt_levels, codes)
+
 
 def main():
-    if len(argv) != 2:
-        error(f'引数の個数が正しくありません {argv}')
+    args = parse_args()
+    if args.incremental and args.no_cache:
+        error('--incremental と --no-cache は同時に指定できません')
+
+    sources = [read_input(x) for x in args.inputs]
+    if args.run or args.eval:
+        if len(sources) != 1:
+            error('--run と --eval で実行できる入力は1つだけです')
+        sys.exit((run if args.run else evaluate)(args, sources[0][1]))
 
-    c_code = argv[1]
+    paths = output_paths(args, [stem for stem, _ in sources])
+    if args.emit == 'ir':
+        for (_, c_code), path in zip(sources, paths):
+            write_assembly(path, dump_ir(args, c_code))
+        return
+    if args.stats or args.stats_output or args.stats_memory:
+        compile_with_stats(args, sources, paths)
+        return
+    codes = [c_code for _, c_code in sources]
 
-    tokenizer = Tokenizer(c_code)
-    tcontext = tokenizer.tokenize()
+    cache = None if args.no_cache else CompileCache(args.cache_dir)
+    if cache:
+        keys = [cache.key(c_code, args.backend, args.opt_level) for c_code in codes]
+        cached = [cache.get(key) for key in keys]
+    else:
+        keys = cached = [None] * len(codes)
 
-    parser = Parser(tcontext)
-    ncontext = parser.parse()
+    incremental = IncrementalCompiler(cache, args.backend, args.opt_level) if args.incremental else None
+    peephole_hits = incremental.compiler.peephole_hits if incremental else {}
+    # 並列化しなければ，キャッシュにない入力は結果を文字列にまとめずに出力先とキャッシュへ書き出す
+    # キャッシュはアセンブリを保存するので，--emit=obj でキャッシュを使うときは文字列にまとめる
+    streaming = args.jobs <= 1 and not incremental and (cache is None or args.emit == 'asm')
+    results = compile_all(args, [c_code for c_code, text in zip(codes, cached) if text is None], incremental)
+    for name, path, key, c_code, text in zip(args.inputs, paths, keys, codes, cached):
+        if streaming and text is None:
+            elapsed, hits = stream_assembly(args, path, c_code, cache, key)
+        elif text is None:
+            text, elapsed, hits = next(results)
+            if cache:
+                cache.put(key, text)
+            write_output(args, path, text)
+        else:
+            elapsed, hits = None, {}
+            write_output(args, path, text)
+        if args.timings:
+            timing = 'cached' if elapsed is None else f'{elapsed * 1000:.1f} ms'
+            print(f'{name if os.path.isfile(name) else "-"}: {timing}', file=sys.stderr)
+        for rule, count in hits.items():
+            peephole_hits[rule] = peephole_hits.get(rule, 0) + count
 
-    generator = Generator(ncontext)
-    assembly = generator.generate()
+    if args.opt_level >= 1 and args.peephole_stats:
+        for name, count in peephole_hits.items():
+            print(f'{name}: {count}', file=sys.stderr)
 
-    for x in assembly:
-        print(x)
+    if cache:
+        cache.evict()
+        if args.cache_stats:
+            print(f'cache: {cache.hits} hits, {cache.misses} misses', file=sys.stderr)
+            if incremental:
+                print(f'functions: {incremental.reused} reused, {incremental.recompiled} recompiled', file=sys.stderr)
 
 
 if __name__ == '__main__':
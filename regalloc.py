@@ -0,0 +1,379 @@
+from generator import PRELUDE, LabelAllocator
+from node import FrameLayout, NodeTypes
+from utility import error
+
+
+class RegAllocGenerator:
+    '''
+    レジスタ割り付けを行うバックエンド
+    式は Sethi-Ullman 数の大きい方の子から評価し，値を callee-saved レジスタに置く
+    レジスタが足りない時だけスタックに退避する．ローカル変数は [rbp-N] で直接参照する
+    __gen_* は子ノードを生成するジェネレータを yield して，その戻り値を受け取るジェネレータで，
+    入れ子が深くても再帰しないように __run がスタックに積んで進める
+    '''
+    REGS = ['rbx', 'r12', 'r13', 'r14', 'r15']
+    REG_ARGS = ['rdi', 'rsi', 'rdx', 'rcx', 'r8', 'r9']
+
+    __arithmetic = {
+        NodeTypes.ADD: 'add',
+        NodeTypes.SUB: 'sub',
+        NodeTypes.MUL: 'imul',
+        NodeTypes.SHL: 'shl',
+    }
+    __comparison = {
+        NodeTypes.EQ: 'e',
+        NodeTypes.NE: 'ne',
+        NodeTypes.LT: 'l',
+        NodeTypes.LE: 'le',
+        NodeTypes.GT: 'g',
+        NodeTypes.GE: 'ge',
+    }
+    __negation = {'e': 'ne', 'ne': 'e', 'l': 'ge', 'le': 'g', 'g': 'le', 'ge': 'l'}
+
+    def __init__(self, node_context, counts=None):
+        self.__ncontext = node_context
+        self.__counts = counts
+        self.__needs = {}
+        self.__stmt_map = {
+            NodeTypes.RETURN: self.__gen_return,
+            NodeTypes.IF: self.__gen_if,
+            NodeTypes.IF_ELSE: self.__gen_if_else,
+            NodeTypes.WHILE: self.__gen_while,
+            NodeTypes.FOR: self.__gen_for,
+            NodeTypes.BLOCK: self.__gen_block,
+        }
+
+    def generate(self):
+        result = list(PRELUDE)
+        for output in self.generate_functions():
+            result += output
+        return result
+
+    def generate_functions(self):
+        '''
+        関数ごとに生成したアセンブリの行を順に返す
+        '''
+        for node in self.__ncontext.nodes:
+            yield self.generate_function(node)
+
+    def __emit(self, line):
+        self.__output.append(f'  {line}')
+
+    def __reg(self, index):
+        self.__max_reg = max(self.__max_reg, index)
+        return RegAllocGenerator.REGS[index]
+
+    def __offset(self, node):
+        if node.type != NodeTypes.IDENT:
+            error(f'代入の左辺値が変数ではありません {node.type}')
+        return self.__frame.offset(node.order)
+
+    @staticmethod
+    def __is_imm(node):
+        return node.type == NodeTypes.NUM and -(1 << 31) <= int(node.value) < (1 << 31)
+
+    def __run(self, task):
+        '''
+        task (ジェネレータ) を最後まで進めてその戻り値を返す
+        task が yield したジェネレータは先に最後まで進め，その戻り値を task に送る
+        '''
+        stack = [task]
+        result = None
+        while True:
+            try:
+                child = stack[-1].send(result)
+            except StopIteration as e:
+                stack.pop()
+                if not stack:
+                    return e.value
+                result = e.value
+                continue
+            stack.append(child)
+            result = None
+
+    def __need(self, node):
+        '''
+        Sethi-Ullman 数 (node の値を求めるのに必要なレジスタ数)
+        子の値を先に求めておくので，__calc_need は再帰しない
+        '''
+        needs = self.__needs
+        if id(node) not in needs:
+            stack = [node]
+            while stack:
+                top = stack[-1]
+                children = [x for x in RegAllocGenerator.__operands(top) if id(x) not in needs]
+                if children:
+                    stack += children
+                    continue
+                stack.pop()
+                needs[id(top)] = self.__calc_need(top)
+        return needs[id(node)]
+
+    @staticmethod
+    def __operands(node):
+        '''
+        __calc_need で Sethi-Ullman 数を使う子ノード
+        '''
+        n_type = node.type
+        if n_type in (NodeTypes.NUM, NodeTypes.IDENT, NodeTypes.ADDR):
+            return []
+        if n_type == NodeTypes.DEREF:
+            return [node.unary]
+        if n_type == NodeTypes.CALL:
+            return node.args
+        if n_type == NodeTypes.ASSIGN:
+            if node.left.type == NodeTypes.DEREF:
+                return [node.left.unary, node.right]
+            return [node.right]
+        return [node.left, node.right]
+
+    def __calc_need(self, node):
+        n_type = node.type
+        if n_type in (NodeTypes.NUM, NodeTypes.IDENT, NodeTypes.ADDR):
+            return 1
+        if n_type == NodeTypes.DEREF:
+            return self.__need(node.unary)
+        if n_type == NodeTypes.CALL:
+            return max([i + self.__need(arg) for i, arg in enumerate(node.args)], default=1)
+        if n_type == NodeTypes.ASSIGN and node.left.type != NodeTypes.DEREF:
+            return self.__need(node.right)
+        left = node.left.unary if n_type == NodeTypes.ASSIGN else node.left
+        if n_type != NodeTypes.ASSIGN and RegAllocGenerator.__is_imm(node.right):
+            return self.__need(left)
+        need_left = self.__need(left)
+        need_right = self.__need(node.right)
+        return need_left + 1 if need_left == need_right else max(need_left, need_right)
+
+    def generate_function(self, node):
+        if len(RegAllocGenerator.REG_ARGS) < len(node.args_order_type):
+            error(f'引数が多すぎます {node.name}')
+
+        self.__labels = LabelAllocator(node.name)
+        self.__output = []
+        self.__frame = node.frame
+        self.__max_reg = -1
+        self.__depth = 0
+        self.__return_label = f'.Lreturn{self.__labels.new_label()}'
+
+        self.__run(self.__gen_stmt(node.block))
+        body = self.__output
+
+        saved = RegAllocGenerator.REGS[:self.__max_reg + 1]
+        slot_count = node.frame.slot_count
+        frame = FrameLayout(slot_count + len(saved))
+
+        self.__output = [f'{node.name}:']
+        self.__emit('push rbp')
+        self.__emit('mov rbp, rsp')
+        self.__emit(f'sub rsp, {frame.size}')
+        for i, reg in enumerate(saved):
+            self.__emit(f'mov [rbp-{frame.offset(slot_count + i + 1)}], {reg}')
+        for (order, _), reg in zip(node.args_order_type, RegAllocGenerator.REG_ARGS):
+            self.__emit(f'mov [rbp-{frame.offset(order)}], {reg}')
+        self.__output += body
+        self.__output.append(f'{self.__return_label}:')
+        for i, reg in enumerate(saved):
+            self.__emit(f'mov {reg}, [rbp-{frame.offset(slot_count + i + 1)}]')
+        self.__emit('mov rsp, rbp')
+        self.__emit('pop rbp')
+        self.__emit('ret')
+        if self.__counts is not None:
+            # 生成器はこのクラス1つなので関数全体の行数を数える
+            name = type(self).__name__
+            self.__counts[name] = self.__counts.get(name, 0) + len(self.__output)
+        return self.__output
+
+    def __gen_stmt(self, node):
+        '''
+        文を生成するジェネレータを返す
+        '''
+        if node.type in self.__stmt_map:
+            return self.__stmt_map[node.type](node)
+        return self.__gen_expr(node, 0)
+
+    def __gen_return(self, node):
+        if node.expr:
+            yield self.__gen_expr(node.expr, 0)
+            self.__emit(f'mov rax, {self.__reg(0)}')
+        self.__emit(f'jmp {self.__return_label}')
+
+    def __gen_if(self, node):
+        label = self.__labels.new_label()
+        yield self.__gen_branch_false(node.expr, f'.Lend{label}')
+        yield self.__gen_stmt(node.stmt)
+        self.__output.append(f'.Lend{label}:')
+
+    def __gen_if_else(self, node):
+        label = self.__labels.new_label()
+        yield self.__gen_branch_false(node.expr, f'.Lelse{label}')
+        yield self.__gen_stmt(node.stmt)
+        self.__emit(f'jmp .Lend{label}')
+        self.__output.append(f'.Lelse{label}:')
+        yield self.__gen_stmt(node.else_stmt)
+        self.__output.append(f'.Lend{label}:')
+
+    def __gen_while(self, node):
+        label = self.__labels.new_label()
+        self.__output.append(f'.Lbegin{label}:')
+        yield self.__gen_branch_false(node.expr, f'.Lend{label}')
+        yield self.__gen_stmt(node.stmt)
+        self.__emit(f'jmp .Lbegin{label}')
+        self.__output.append(f'.Lend{label}:')
+
+    def __gen_for(self, node):
+        label = self.__labels.new_label()
+        if node.expr1:
+            yield self.__gen_expr(node.expr1, 0)
+        self.__output.append(f'.Lbegin{label}:')
+        yield self.__gen_branch_false(node.expr2, f'.Lend{label}')
+        yield self.__gen_stmt(node.stmt)
+        if node.expr3:
+            yield self.__gen_expr(node.expr3, 0)
+        self.__emit(f'jmp .Lbegin{label}')
+        self.__output.append(f'.Lend{label}:')
+
+    def __gen_block(self, node):
+        for stmt in node.stmts:
+            yield self.__gen_stmt(stmt)
+
+    def __gen_branch_false(self, node, label):
+        '''
+        node の値が0なら label へ飛ぶ．node が None なら常に真とする．比較演算は setcc を介さず条件分岐にする
+        '''
+        if node is None:
+            return
+        if node.type == NodeTypes.NUM:
+            if int(node.value) == 0:
+                self.__emit(f'jmp {label}')
+            return
+        if node.type in RegAllocGenerator.__comparison:
+            left, right = yield self.__gen_operands(node, 0)
+            self.__emit(f'cmp {left}, {right}')
+            self.__emit(f'j{RegAllocGenerator.__negation[RegAllocGenerator.__comparison[node.type]]} {label}')
+            return
+        yield self.__gen_expr(node, 0)
+        self.__emit(f'cmp {self.__reg(0)}, 0')
+        self.__emit(f'je {label}')
+
+    def __gen_expr(self, node, index):
+        '''
+        node の値を REGS[index] に求める．REGS[index] より前のレジスタは壊さない
+        '''
+        n_type = node.type
+        reg = self.__reg(index)
+        if n_type == NodeTypes.NUM:
+            self.__emit(f'mov {reg}, {node.value}')
+        elif n_type == NodeTypes.IDENT:
+            self.__emit(f'mov {reg}, [rbp-{self.__offset(node)}]')
+        elif n_type == NodeTypes.ADDR:
+            self.__emit(f'lea {reg}, [rbp-{self.__offset(node.unary)}]')
+        elif n_type == NodeTypes.DEREF:
+            yield self.__gen_expr(node.unary, index)
+            self.__emit(f'mov {reg}, [{reg}]')
+        elif n_type == NodeTypes.ASSIGN:
+            yield self.__gen_assign(node, index)
+        elif n_type == NodeTypes.CALL:
+            yield self.__gen_call(node, index)
+        elif n_type in RegAllocGenerator.__arithmetic:
+            left, right = yield self.__gen_operands(node, index)
+            if n_type == NodeTypes.SHL and not RegAllocGenerator.__is_imm(node.right):
+                self.__emit(f'mov rcx, {right}')
+                right = 'cl'
+            self.__emit(f'{RegAllocGenerator.__arithmetic[n_type]} {left}, {right}')
+            self.__move(reg, left)
+        elif n_type == NodeTypes.DIV:
+            left, right = yield self.__gen_operands(node, index)
+            if right != 'rdi' and right not in RegAllocGenerator.REGS:
+                self.__emit(f'mov rdi, {right}')
+                right = 'rdi'
+            self.__emit(f'mov rax, {left}')
+            self.__emit('cqo')
+            self.__emit(f'idiv {right}')
+            self.__emit(f'mov {reg}, rax')
+        elif n_type in RegAllocGenerator.__comparison:
+            left, right = yield self.__gen_operands(node, index)
+            self.__emit(f'cmp {left}, {right}')
+            self.__emit(f'set{RegAllocGenerator.__comparison[n_type]} al')
+            self.__emit(f'movzx {reg}, al')
+        else:
+            error(f'式ではありません {n_type}')
+
+    def __move(self, dst, src):
+        if dst != src:
+            self.__emit(f'mov {dst}, {src}')
+
+    def __gen_pair(self, left, right, index):
+        '''
+        2つの式を評価し，それぞれの値を持つレジスタ (または即値) を返す
+        1つ目のレジスタは REGS[index] か REGS[index + 1]
+        '''
+        if right.type == NodeTypes.NUM and RegAllocGenerator.__is_imm(right):
+            yield self.__gen_expr(left, index)
+            return self.__reg(index), right.value
+
+        if index + 1 < len(RegAllocGenerator.REGS):
+            if self.__need(right) > self.__need(left):
+                yield self.__gen_expr(right, index)
+                yield self.__gen_expr(left, index + 1)
+                return self.__reg(index + 1), self.__reg(index)
+            yield self.__gen_expr(left, index)
+            yield self.__gen_expr(right, index + 1)
+            return self.__reg(index), self.__reg(index + 1)
+
+        # レジスタが足りないので左の値をスタックに退避する
+        reg = self.__reg(index)
+        yield self.__gen_expr(left, index)
+        self.__emit(f'push {reg}')
+        self.__depth += 1
+        yield self.__gen_expr(right, index)
+        self.__emit(f'mov rdi, {reg}')
+        self.__emit(f'pop {reg}')
+        self.__depth -= 1
+        return reg, 'rdi'
+
+    def __gen_operands(self, node, index):
+        return self.__gen_pair(node.left, node.right, index)
+
+    def __gen_assign(self, node, index):
+        reg = self.__reg(index)
+        if node.left.type == NodeTypes.DEREF:
+            if node.right.type == NodeTypes.NUM and RegAllocGenerator.__is_imm(node.right):
+                yield self.__gen_expr(node.left.unary, index)
+                self.__emit(f'mov QWORD PTR [{reg}], {node.right.value}')
+                self.__emit(f'mov {reg}, {node.right.value}')
+                return
+            address, value = yield self.__gen_pair(node.left.unary, node.right, index)
+            self.__emit(f'mov [{address}], {value}')
+            self.__move(reg, value)
+        else:
+            offset = self.__offset(node.left)
+            yield self.__gen_expr(node.right, index)
+            self.__emit(f'mov [rbp-{offset}], {reg}')
+
+    def __gen_call(self, node, index):
+        args = node.args
+        if len(RegAllocGenerator.REG_ARGS) < len(args):
+            error(f'引数が多すぎます {node.name}')
+
+        if index + len(args) <= len(RegAllocGenerator.REGS):
+            for i, arg in enumerate(args):
+                yield self.__gen_expr(arg, index + i)
+            for i, reg in enumerate(RegAllocGenerator.REG_ARGS[:len(args)]):
+                self.__emit(f'mov {reg}, {self.__reg(index + i)}')
+        else:
+            # レジスタが足りないので引数をスタックに積んでから取り出す
+            for arg in args:
+                yield self.__gen_expr(arg, index)
+                self.__emit(f'push {self.__reg(index)}')
+                self.__depth += 1
+            for reg in RegAllocGenerator.REG_ARGS[:len(args)][::-1]:
+                self.__emit(f'pop {reg}')
+                self.__depth -= 1
+
+        padding = self.__depth % 2 == 1
+        if padding:
+            self.__emit('sub rsp, 8')
+        self.__emit(f'call {node.name}')
+        if padding:
+            self.__emit('add rsp, 8')
+        self.__emit(f'mov {self.__reg(index)}, rax')
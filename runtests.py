@@ -0,0 +1,98 @@
+'''
+test.sh の try 行と deep 行をプロセス内でまとめて実行する
+コンパイルは1つのプロセスで順に行い，リンクと実行は一時ディレクトリを分けて並列に行う
+
+$ python runtests.py
+$ python runtests.py --backend=regalloc -O1 --emit=obj -j 8
+'''
+import os
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import perf_counter
+
+from bench.sources import load_deep_test_cases, load_test_cases
+from compiler import BACKENDS, Compiler
+
+
+def parse_args():
+    parser = ArgumentParser(description='test.sh のテストをプロセス内で並列に実行する')
+    parser.add_argument('--backend', choices=BACKENDS, default='stack', help='コード生成のバックエンド')
+    parser.add_argument('-O', type=int, choices=[0, 1], default=0, dest='opt_level', help='最適化レベル')
+    parser.add_argument('--emit', choices=['asm', 'obj'], default='asm', help='リンクに渡す形式')
+    parser.add_argument('-j', type=int, default=os.cpu_count(), dest='jobs', help='並列にリンク・実行する数')
+    parser.add_argument('--script', default='test.sh', help='try 行と deep 行を読み出すスクリプト')
+    return parser.parse_args()
+
+
+def compile_case(compiler, emit, c_code, work):
+    '''
+    work にアセンブリかオブジェクトを書き出してそのパスを返す
+    '''
+    work.mkdir()
+    if emit == 'obj':
+        path = work / 'tmp.o'
+        path.write_bytes(compiler.compile_object(c_code))
+    else:
+        path = work / 'tmp.s'
+        path.write_text('\n'.join(compiler.compile(c_code)) + '\n')
+    return path
+
+
+def link_and_run(source, sample):
+    '''
+    (終了コード, リンクの秒数, 実行の秒数) を返す
+    '''
+    start = perf_counter()
+    binary = source.parent / 'tmp'
+    result = subprocess.run(['gcc', '-z', 'noexecstack', '-o', binary, source, sample], capture_output=True, text=True)
+    middle = perf_counter()
+    if result.returncode != 0:
+        return f'gcc compile error\n{result.stderr}', middle - start, 0
+    actual = subprocess.run([binary], stdout=subprocess.DEVNULL).returncode
+    return actual, middle - start, perf_counter() - middle
+
+
+def main():
+    args = parse_args()
+    # (期待値, 表示する名前, Cのコード)
+    cases = [(expected, c_code, c_code) for expected, c_code in load_test_cases(args.script)]
+    cases += load_deep_test_cases(args.script)
+    start = perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix='py9cc-test-') as directory:
+        root = Path(directory)
+        sample = root / 'sample.o'
+        subprocess.run(['gcc', '-c', '-o', sample, 'sample.c'], check=True)
+
+        compiler = Compiler(args.backend, args.opt_level)
+        compile_start = perf_counter()
+        sources = [compile_case(compiler, args.emit, c_code, root / str(i)) for i, (_, _, c_code) in enumerate(cases)]
+        compile_time = perf_counter() - compile_start
+
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            results = list(executor.map(link_and_run, sources, [sample] * len(sources)))
+
+    failures = 0
+    for (expected, name, _), (actual, _, _) in zip(cases, results):
+        if actual == expected:
+            print(f'{name} => {actual}')
+        else:
+            failures += 1
+            print(f'{name} => {expected} expected, but got {actual}')
+
+    link_time = sum(x[1] for x in results)
+    run_time = sum(x[2] for x in results)
+    print(f'{len(cases)} cases, compile {compile_time:.2f} s, link {link_time:.2f} s, run {run_time:.2f} s '
+          f'(-j {args.jobs}), wall {perf_counter() - start:.2f} s', file=sys.stderr)
+    if failures:
+        print(f'NG {failures} failed')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import json
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+
+from peephole import parse_instruction
+
+
+class CompileStats:
+    '''
+    コンパイルの段階ごとの経過時間とピークメモリ，トークン数，ノードの種類ごとの数，
+    生成器ごとの出力行数，最終的な命令数，制御フローグラフの整理で関数ごとに減らした命令数を記録する
+    before / after に登録した関数は各段階の前後に呼ばれる
+    trace_memory なら tracemalloc でピークメモリも計るが，トレースで各段階が数倍遅くなるので，
+    時間は trace_memory なしで計り，ピークメモリは別に計ったものを merge_memory で取り込む
+    '''
+    # 子ノードを持つ属性
+    CHILDREN = ['left', 'right', 'expr', 'stmt', 'else_stmt', 'expr1', 'expr2', 'expr3', 'unary', 'block']
+    CHILD_LISTS = ['stmts', 'args']
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        # ピークメモリをどう計ったか．None なら計っていない
+        self.memory_source = 'same pass' if trace_memory else None
+        self.phases = []
+        self.tokens = 0
+        self.nodes = {}
+        self.lines = {}
+        self.instructions = 0
+        self.eliminated = {}
+        self.__before = []
+        self.__after = []
+
+    def add_hook(self, before=None, after=None):
+        '''
+        before(段階の名前) は段階の開始前に，after(段階の名前, 経過秒数) は終了後に呼ばれる
+        '''
+        if before is not None:
+            self.__before.append(before)
+        if after is not None:
+            self.__after.append(after)
+
+    @contextmanager
+    def phase(self, name):
+        for hook in self.__before:
+            hook(name)
+        started = self.trace_memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            record = {'name': name, 'seconds': elapsed}
+            if self.trace_memory:
+                record['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                if started:
+                    tracemalloc.stop()
+            self.phases.append(record)
+            for hook in self.__after:
+                hook(name, elapsed)
+
+    def merge_memory(self, traced):
+        '''
+        trace_memory で同じ段階を計った traced (CompileStats) のピークメモリを取り込む．時間はこちらの値のままにする
+        '''
+        for record, other in zip(self.phases, traced.phases):
+            record['peak_bytes'] = other['peak_bytes']
+        self.memory_source = 'separate traced pass'
+
+    def count_nodes(self, ncontext):
+        counts = {}
+        stack = list(ncontext.nodes)
+        while stack:
+            node = stack.pop()
+            counts[node.type.name] = counts.get(node.type.name, 0) + 1
+            for name in CompileStats.CHILDREN:
+                child = getattr(node, name, None)
+                if child is not None:
+                    stack.append(child)
+            for name in CompileStats.CHILD_LISTS:
+                stack += getattr(node, name, [])
+        self.nodes = counts
+
+    def count_instructions(self, lines):
+        self.instructions = sum(1 for x in lines if parse_instruction(x) is not None)
+
+    def to_dict(self):
+        return {
+            'phases': self.phases,
+            'total_seconds': sum(x['seconds'] for x in self.phases),
+            # 時間をトレースしながら計ったか，peak_bytes をどの回で計ったか
+            'seconds_traced': self.trace_memory,
+            'peak_bytes_source': self.memory_source,
+            'tokens': self.tokens,
+            'nodes': self.nodes,
+            'lines_per_generator': self.lines,
+            'instructions': self.instructions,
+            'eliminated_per_function': self.eliminated,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
@@ -1,17 +1,52 @@
 #!/bin/bash
 
+# 引数は py9cc.py にそのまま渡す (例: ./test.sh --backend=regalloc)
+OPTIONS=("$@")
+
+# --emit=obj のときはオブジェクトファイルをそのままリンクする
+# --run と --eval のときは gcc を使わずに py9cc.py の終了コードを結果とする
+OUTPUT=tmp.s
+RUN=0
+for option in "$@"; do
+    if [ "$option" = "--emit=obj" ]; then
+        OUTPUT=tmp.o
+    elif [ "$option" = "--run" ] || [ "$option" = "--eval" ]; then
+        RUN=1
+    fi
+done
+
+check() {
+    input="$1"
+    expected="$2"
+    actual="$3"
+
+    if [ "$actual" = "$expected" ]; then
+        echo "$input => $actual"
+    else
+        echo "$input => $expected expected, but got $actual"
+        echo "NG"
+        exit 1
+    fi
+}
+
 try() {
     expected="$1"
     input="$2"
 
-    python py9cc.py "$input" > tmp.s
+    if [ "$RUN" = "1" ]; then
+        python py9cc.py "${OPTIONS[@]}" --lib ./libsample.so "$input"
+        check "$input" "$expected" "$?"
+        return
+    fi
+
+    python py9cc.py "${OPTIONS[@]}" "$input" > $OUTPUT
 
     if [ "$?" != "0" ]; then
         echo "py9cc.py error"
         exit 1
     fi
 
-    gcc -z noexecstack -o tmp tmp.s sample.o
+    gcc -z noexecstack -o tmp $OUTPUT sample.o
 
     if [ "$?" != "0" ]; then
         echo "gcc compile error"
@@ -19,20 +54,61 @@ try() {
     fi
 
     ./tmp
-    actual="$?"
+    check "$input" "$expected" "$?"
 
-    if [ "$actual" = "$expected" ]; then
-        echo "$input => $actual"
-    else
-        echo "$input => $expected expected, but got $actual"
-        echo "NG"
+    rm $OUTPUT tmp
+}
+
+# 入力が大きいので標準入力から渡す．deep 期待値 深さ Pythonの式 (n が深さ)
+deep() {
+    expected="$1"
+    depth="$2"
+    input="$3"
+
+    if [ "$RUN" = "1" ]; then
+        python -c "n = $depth; print($input)" | python py9cc.py "${OPTIONS[@]}" --lib ./libsample.so -
+        check "$input (n = $depth)" "$expected" "$?"
+        return
+    fi
+
+    python -c "n = $depth; print($input)" | python py9cc.py "${OPTIONS[@]}" - > $OUTPUT
+
+    if [ "$?" != "0" ]; then
+        echo "py9cc.py error"
+        exit 1
+    fi
+
+    gcc -z noexecstack -o tmp $OUTPUT sample.o
+
+    if [ "$?" != "0" ]; then
+        echo "gcc compile error"
         exit 1
     fi
 
-    rm tmp.s tmp
+    ./tmp
+    check "$input (n = $depth)" "$expected" "$?"
+
+    rm $OUTPUT tmp
+}
+
+# --emit=ir の出力に行が含まれる．emit_ir 行 最適化レベル Cのコード (OPTIONS は使わない)
+emit_ir() {
+    expected="$1"
+    option="$2"
+    input="$3"
+
+    if python py9cc.py --emit=ir "$option" "$input" | grep -qxF -- "$expected"; then
+        actual=found
+    else
+        actual=missing
+    fi
+    check "$input ($option: $expected)" found "$actual"
 }
 
 gcc -c sample.c
+if [ "$RUN" = "1" ]; then
+    gcc -shared -fPIC -o libsample.so sample.c
+fi
 
 try 0 "int main() { return 0; }"
 try 42 "int main() { return 42; }"
@@ -94,9 +170,44 @@ try 42 "int main() { int x; x = 42; int *y; y = &x; int **z; z = &y; return *(*z
 try 23 "int main() { int x; x = 42; int *y; y = &x; int **z; z = &y; **z = 23; return x; }"
 try 65 "int main() { int x; x = 42; int *y; y = &x; int **z; z = &y; *y = 23 + **z; return *(*z); }"
 try 5 "int main() { int a; a = MyDiv(10, 1 + 1); return a; }"
+try 22 "int main() { return 1 + MyAdd(1, 2, 3, 4, 5, 6); }"
+try 8 "int main() { int x; x = 2 + (1 + MyDiv(10, 2)); return x; }"
+try 4 "int main() { int x; x = 3; return x * 8 / 6 + 0 * x + x * 0 - (1 * x - x * 1); }"
+try 12 "int main() { int x; x = -3; return -(x * 4) + 2 * 3 - (12 - 6) + (7 / -2 + 3); }"
+try 5 "int main() { if (0) return 1; while (0) return 2; for (; 0;) return 3; if (1 - 1 == 0) return 5; return 4; }"
+try 6 "int main() { int i; i = 0; for (;;) { i = i + 1; if (i == 6) return i; } return 0; }"
+try 7 "int main() { int i; i = 0; while (1) { i = i + 1; if (i >= 7) return i; } return 0; }"
+try 1 "int main() { int x; x = 1; { int x; x = 5; } return x; }"
+try 7 "int main() { int x; x = 2; { int y; y = 5; x = x + y; } return x; }"
+try 9 "int main() { int x; x = 4; { int x; x = 3; { int x; x = 5; } } { int y; y = 5; x = x + y; } return x; }"
+try 3 "int main() { return 3; return 5; }"
+try 10 "int main() { int x; x = 1; for (;;) { x = x + 1; if (x == 10) return x; } x = 99; return x; }"
+try 7 "int main() { int a; int b; a = 7; b = 3; return a; }"
+try 13 "int main() { int x; x = 0; while (x < 5) { if (x == 3) { x = x + 10; } else { x = x + 1; } } return x; }"
+try 6 "int unused(int a, int b) { return 6; } int main() { return unused(1, 2); }"
+try 3 "int f() { return; } int main() { f(); return 3; }"
+try 7 "int main() { int x; x = 3; int y; y = 5; int *z; z = &y + 8; *z = 7; return x; }"
+try 9 "int g(int *p) { *(p + 8) = 9; return 0; } int main() { int x; x = 3; int y; y = 5; g(&y); return x; }"
 
 # try 0 "int main() { for (i = 0; ;) { MyPrint(); } return 0; }"
 
+# -O0 では変換したままの中間表現を，-O1 では最適化した中間表現を出力する
+emit_ir "  v4 = add v2, v3" -O0 "int main() { int a; a = 2; return a + 3; }"
+emit_ir "  ret v4" -O0 "int main() { int a; a = 2; return a + 3; }"
+emit_ir "  v3 = const 5" -O1 "int main() { int a; a = 2; return a + 3; }"
+emit_ir "  ret v3" -O1 "int main() { int a; a = 2; return a + 3; }"
+
+# 入れ子が深くても再帰の上限に当たらない (--eval はクロージャが再帰するので対象外)
+if [[ ! " ${OPTIONS[*]} " =~ " --eval " ]]; then
+    deep 42 100000 "'int main() { return ' + '(' * n + '42' + ')' * n + '; }'"
+    deep 42 100000 "'int main() { return ' + '(1 + ' * n + '0' + ')' * n + ' - 99958; }'"
+    deep 42 100000 "'int main() { return ' + ' + '.join(['1'] * n) + ' - 99958; }'"
+    deep 42 100000 "'int main() { int a; ' + 'a = ' * n + '42; return a; }'"
+    deep 42 100000 "'int main() { ' + '{ ' * n + 'return 42; ' + '} ' * n + '}'"
+    deep 42 100000 "'int main() { ' + 'if (1) ' * n + 'return 42; }'"
+    deep 42 100000 "'int f(int x) { return x; } int main() { return ' + 'f(' * n + '42' + ')' * n + '; }'"
+fi
+
 rm sample.o
 
 echo "OK"
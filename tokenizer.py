@@ -1,6 +1,6 @@
-from collections import deque
+import re
+from array import array
 from enum import Enum, auto
-from string import ascii_letters, digits
 
 from utility import error, error_at
 
@@ -18,34 +18,80 @@ class TokenTypes(Enum):
 
 
 class Token:
-    def __init__(self):
-        self.type = None
-        self.value = None
-        self.code = None
-        self.length = None
+    __slots__ = ('type', 'c_code', 'pos', 'end')
+
+    def __init__(self, t_type, c_code, pos, end):
+        self.type = t_type
+        self.c_code = c_code
+        self.pos = pos
+        self.end = end
 
     @property
     def text(self):
-        return self.code[:self.length]
+        return self.c_code[self.pos:self.end]
+
+    @property
+    def value(self):
+        return self.text if self.type == TokenTypes.NUM else None
+
+
+class TokenTable:
+    '''
+    トークンを種別，開始位置，終了位置の配列で保持する
+    Tokenは参照された時に作られる
+    '''
+    __types = {t.value: t for t in TokenTypes}
+
+    def __init__(self, c_code):
+        self.c_code = c_code
+        self.types = array('b')
+        self.starts = array('i')
+        self.ends = array('i')
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        return Token(TokenTable.__types[self.types[index]], self.c_code, self.starts[index], self.ends[index])
+
+    def __iter__(self):
+        types = TokenTable.__types
+        for t_type, pos, end in zip(self.types, self.starts, self.ends):
+            yield Token(types[t_type], self.c_code, pos, end)
+
+    def append(self, t_type, pos, end):
+        self.types.append(t_type.value)
+        self.starts.append(pos)
+        self.ends.append(end)
 
 
 class TokenContext:
+    '''
+    tokens から必要になった時に1トークンずつ読み出す
+    先読みは current の1トークンのみ
+    '''
+
     def __init__(self, tokens, c_code):
-        self.__tokens = deque(tokens)
+        self.__tokens = iter(tokens)
         self.__c_code = c_code
+        self.__current = next(self.__tokens, None)
 
     @property
     def current(self):
-        return None if self.is_empty() else self.__tokens[0]
+        return self.__current
 
     def is_empty(self):
-        return len(self.__tokens) == 0
+        return self.__current is None
+
+    def __pop(self):
+        token = self.__current
+        self.__current = next(self.__tokens, None)
+        return token
 
     def __consume_inner(self, t_type):
-        if self.__tokens:
-            if self.__tokens[0].type == t_type:
-                token = self.__tokens.popleft()
-                return token
+        token = self.__current
+        if token is not None and token.type == t_type:
+            return self.__pop()
         return None
 
     def consume_num(self):
@@ -69,12 +115,25 @@ class TokenContext:
     def consume_for(self):
         return self.__consume_inner(TokenTypes.FOR)
 
+    def peek_symbol(self):
+        '''
+        current が記号ならその文字列，そうでなければ None を返す．トークンは読み進めない
+        '''
+        token = self.__current
+        if token is not None and token.type == TokenTypes.SYMBOL:
+            return token.text
+        return None
+
+    def next(self):
+        '''
+        peek_symbol で確かめたトークンを読み進める
+        '''
+        return self.__pop()
+
     def consume_symbol(self, symbol):
-        if self.__tokens:
-            tk = self.__tokens[0]
-            if tk.type == TokenTypes.SYMBOL and tk.code[: tk.length] == symbol:
-                token = self.__tokens.popleft()
-                return token
+        token = self.__current
+        if token is not None and token.type == TokenTypes.SYMBOL and token.text == symbol:
+            return self.__pop()
         return None
 
     def consume_type(self):
@@ -83,8 +142,8 @@ class TokenContext:
     def expect_num(self):
         token = self.consume_num()
         if not token:
-            if self.__tokens:
-                error_at(self.__c_code, self.__tokens[0].code, '数ではありません')
+            if not self.is_empty():
+                error_at(self.__c_code, self.current.pos, '数ではありません')
             else:
                 error('数がありません')
         return token
@@ -92,8 +151,8 @@ class TokenContext:
     def expect_ident(self):
         token = self.consume_ident()
         if not token:
-            if self.__tokens:
-                error_at(self.__c_code, self.__tokens[0].code, '変数，関数ではありません')
+            if not self.is_empty():
+                error_at(self.__c_code, self.current.pos, '変数，関数ではありません')
             else:
                 error('変数，関数がありません')
         return token
@@ -101,8 +160,8 @@ class TokenContext:
     def expect_symbol(self, symbol):
         token = self.consume_symbol(symbol)
         if not token:
-            if self.__tokens:
-                error_at(self.__c_code, self.__tokens[0].code, f'{symbol}ではありません')
+            if not self.is_empty():
+                error_at(self.__c_code, self.current.pos, f'{symbol}ではありません')
             else:
                 error(f'{symbol}がありません')
         return token
@@ -110,106 +169,66 @@ class TokenContext:
     def expect_type(self):
         token = self.consume_type()
         if not token:
-            if self.__tokens:
-                error_at(self.__c_code, self.__tokens[0].code, '型ではありません')
+            if not self.is_empty():
+                error_at(self.__c_code, self.current.pos, '型ではありません')
             else:
                 error('型ではありません')
         return token
 
 
 class Tokenizer:
-    __symbols = ('==', '!=', '<=', '>=', '<', '>', '+', '-', '*', '/', '(', ')', ';', '=', '{', '}', ',', '&')
     __reserved_map = {'return': TokenTypes.RETURN, 'if': TokenTypes.IF, 'else': TokenTypes.ELSE, 'while': TokenTypes.WHILE, 'for': TokenTypes.FOR,
                       'int': TokenTypes.TYPE}
-    __var_name_head = ascii_letters + '_'
-    __var_name = digits + __var_name_head
+    __pattern = re.compile(r'''
+        (?P<SPACE>\s+)
+      | (?P<NUM>\d+)
+      | (?P<IDENT>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<SYMBOL>==|!=|<=|>=|[<>+\-*/();={},&])
+    ''', re.VERBOSE)
 
     def __init__(self, c_code):
         self.__c_code = c_code
 
-    def __trim_left(self, c_code, conditions):
-        result = ''
-        for x in c_code:
-            if (conditions(x)):
-                result += x
-            else:
-                break
-        return result, c_code[len(result):]
-
-    def __trim_left_num(self, c_code):
-        return self.__trim_left(c_code, lambda x: x.isdigit())
-
-    def __trim_left_varname(self, c_code):
-        return self.__trim_left(c_code, lambda x: x in Tokenizer.__var_name)
-
-    def __create_token(self, t_type, c_code, length):
-        token = Token()
-        token.type = t_type
-        token.code = c_code
-        token.length = length
-        return token
-
-    def __create_num_token(self, c_code):
-        num, _ = self.__trim_left_num(c_code)
-        token = self.__create_token(TokenTypes.NUM, c_code, len(num))
-        token.value = num
-        return token
-
-    def __create_varname_token(self, c_code):
-        name, _ = self.__trim_left_varname(c_code)
-        token = self.__create_token(TokenTypes.IDENT, c_code, len(name))
-        return token
-
-    def __create_reserved_token(self, c_code, reserved):
-        if reserved not in Tokenizer.__reserved_map:
-            error(f'不正な予約語です {reserved}')
-        token = self.__create_token(Tokenizer.__reserved_map[reserved], c_code, len(reserved))
-        return token
-
-    def __startswith_reserved(self, c_code):
-        for reserved in Tokenizer.__reserved_map:
-            if (c_code.startswith(reserved)) and (c_code[len(reserved)] not in Tokenizer.__var_name):
-                return reserved
-        return None
+    def __scan(self):
+        c_code = self.__c_code
+        match = Tokenizer.__pattern.match
+        reserved_map = Tokenizer.__reserved_map
+        pos = 0
+        end = len(c_code)
+        while pos < end:
+            m = match(c_code, pos)
+            if not m:
+                error_at(c_code, pos, 'トークナイズできません')
+
+            kind = m.lastgroup
+            next_pos = m.end()
+            if kind == 'NUM':
+                yield TokenTypes.NUM, pos, next_pos
+            elif kind == 'IDENT':
+                yield reserved_map.get(m.group(), TokenTypes.IDENT), pos, next_pos
+            elif kind == 'SYMBOL':
+                yield TokenTypes.SYMBOL, pos, next_pos
+            pos = next_pos
+
+    def tokenize_table(self):
+        '''
+        全トークンを読み込んだ TokenTable を返す
+        '''
+        tokens = TokenTable(self.__c_code)
+        for t_type, pos, end in self.__scan():
+            tokens.append(t_type, pos, end)
+        return tokens
 
     def tokenize(self):
-        tokens = []
-
+        '''
+        全トークンを TokenTable に読み込んでから TokenContext を返す
+        '''
+        return TokenContext(self.tokenize_table(), self.__c_code)
+
+    def stream(self):
+        '''
+        パーサが読み進めるたびにトークナイズする TokenContext を返す
+        '''
         c_code = self.__c_code
-        while c_code:
-            c = c_code[0]
-
-            if c.isspace():
-                c_code = c_code[1:]
-                continue
-
-            if c.isdigit():
-                token = self.__create_num_token(c_code)
-                tokens.append(token)
-                c_code = c_code[token.length:]
-                continue
-
-            reserved = self.__startswith_reserved(c_code)
-            if reserved:
-                token = self.__create_reserved_token(c_code, reserved)
-                tokens.append(token)
-                c_code = c_code[token.length:]
-                continue
-
-            if c in Tokenizer.__var_name_head:
-                token = self.__create_varname_token(c_code)
-                tokens.append(token)
-                c_code = c_code[token.length:]
-                continue
-
-            cc = c_code[: 2]
-            for x in (cc, c):
-                if x in Tokenizer.__symbols:
-                    token = self.__create_token(TokenTypes.SYMBOL, c_code, len(x))
-                    tokens.append(token)
-                    c_code = c_code[token.length:]
-                    break
-            else:
-                error_at(self.__c_code, c_code, 'トークナイズできません')
-
-        return TokenContext(tokens, self.__c_code)
+        tokens = (Token(t_type, c_code, pos, end) for t_type, pos, end in self.__scan())
+        return TokenContext(tokens, c_code)
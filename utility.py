@@ -6,8 +6,7 @@ def error(message):
     exit(1)
 
 
-def error_at(c_code, error_c_code, message):
-    pos = len(c_code) - len(error_c_code)
+def error_at(c_code, pos, message):
     print(f'{c_code}', file=stderr)
     print(' ' * pos, end='', file=stderr)
     print(f'^ {message}', file=stderr)